@@ -0,0 +1,254 @@
+import math
+import os
+import threading
+import time
+
+
+# ----------------------------------------
+# Admission control for the execute routes
+# ----------------------------------------
+# The engines are CPU bound, so a few huge Logic 3 reviews running at once
+# slow every other request down. Each execute/summary request is admitted
+# against a fixed capacity of cost units before its engine runs:
+# - cost is estimated from the record and schedule counts (Logic 3 scores
+#   every record against every schedule, so it weighs more), in units of
+#   about COST_UNIT_MS of engine time; one request never costs more than the
+#   whole capacity, so a huge request can still run, alone (callers can cap
+#   the cost lower: background jobs take at most half, see jobs.py)
+# - requests that don't fit wait in a bounded queue; when capacity frees up
+#   the waiting request of the client using the least capacity (relative to
+#   its weight) goes first, so one tenant can't monopolize the workers
+# - a request that can't start within DTR_ADMISSION_WAIT_MS, or finds the
+#   queue full, gets a fast 503; a client with too many requests already
+#   queued gets a 429. Both carry a Retry-After estimate.
+#
+# Clients are identified by address: the peer address, or with
+# DTR_TRUSTED_PROXIES=N the client address forwarded by the N reverse proxies
+# in front of the app (X-Forwarded-For, through werkzeug's ProxyFix). Headers
+# the client sends are not trusted; DTR_CLIENT_ID_HEADER can name a header
+# the authenticating proxy sets to the tenant (replacing any the client
+# sent), which is then used instead. Queue depth, admissions and rejections
+# are reported by GET /debug/admission (with the X-Debug-Token header).
+
+ADMISSION_ENABLED = os.environ.get("DTR_ADMISSION", "1").lower() in ("1", "true", "yes")
+ADMISSION_CAPACITY = int(os.environ.get("DTR_ADMISSION_CAPACITY", str(2 * (os.cpu_count() or 1))))  # cost units
+ADMISSION_QUEUE_SIZE = int(os.environ.get("DTR_ADMISSION_QUEUE", "32"))  # waiting requests, all clients
+ADMISSION_CLIENT_QUEUE_SIZE = int(os.environ.get("DTR_ADMISSION_CLIENT_QUEUE", "4"))  # waiting requests per client
+ADMISSION_WAIT = int(os.environ.get("DTR_ADMISSION_WAIT_MS", "10000")) / 1000  # seconds
+MAX_RETRY_AFTER = 60  # seconds
+
+TRUSTED_PROXIES = int(os.environ.get("DTR_TRUSTED_PROXIES", "0"))  # reverse proxies in front of the app
+CLIENT_ID_HEADER = os.environ.get("DTR_CLIENT_ID_HEADER", "")  # set by the proxy, e.g. "X-Tenant-Id"
+
+COST_UNIT_MS = 500  # estimated engine milliseconds per cost unit
+
+# Estimated engine milliseconds per record: base + per schedule
+# (measured on the sample records; Logic 3 scores each record against every schedule)
+COST_PER_RECORD_MS = {
+    "logic1": (0.03, 0.02),
+    "logic2": (0.04, 0.02),
+    "logic3": (0.05, 0.03)
+}
+
+
+def parse_client_weights(value):
+    """Parse DTR_CLIENT_WEIGHTS ("tenant-a=3,tenant-b=0.5") into {client: weight}."""
+    weights = {}
+    for item in (value or "").split(","):
+        client, _, weight = item.partition("=")
+        if client.strip() and weight.strip():
+            try:
+                weights[client.strip()] = max(0.01, float(weight))
+            except ValueError:
+                pass
+    return weights
+
+
+CLIENT_WEIGHTS = parse_client_weights(os.environ.get("DTR_CLIENT_WEIGHTS"))
+
+
+def count_schedules(schedule_data):
+    if isinstance(schedule_data, dict):
+        schedules = schedule_data.get("schedules")
+        return len(schedules) if isinstance(schedules, list) else 1
+    return len(schedule_data) if isinstance(schedule_data, list) else 0
+
+
+def estimate_cost_ms(logic, record_count, schedule_count):
+    """Estimated engine time of a run, in milliseconds."""
+    base, per_schedule = COST_PER_RECORD_MS.get(logic, COST_PER_RECORD_MS["logic3"])
+    return record_count * (base + per_schedule * max(1, schedule_count))
+
+
+class AdmissionRejected(Exception):
+    """A request that can't be admitted; status is 429 or 503."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    def __init__(self, controller, client, cost, estimated_ms, seq):
+        self.controller = controller
+        self.client = client
+        self.cost = cost
+        self.estimated_ms = estimated_ms
+        self.seq = seq
+        self.released = False
+
+    def release(self):
+        """Give the ticket's capacity back (idempotent)."""
+        self.controller.release(self)
+
+
+class AdmissionController:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(AdmissionController, cls).__new__(cls)
+            cls._instance._init(ADMISSION_CAPACITY)
+        return cls._instance
+
+    def _init(self, capacity):
+        self.capacity = max(1, capacity)
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = 0
+        self.active_cost = 0
+        self.active_ms = 0.0
+        self.active_requests = 0
+        self.client_active = {}
+        self.stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_client_limit": 0,
+                      "rejected_timeout": 0, "wait_seconds": 0.0}
+
+    def _weight(self, client):
+        return CLIENT_WEIGHTS.get(client, 1.0)
+
+    def _next(self):
+        """The waiting ticket to start next: least capacity in use by its client (per weight), then FIFO."""
+        return min(self._waiting,
+                   key=lambda ticket: (self.client_active.get(ticket.client, 0) / self._weight(ticket.client),
+                                       ticket.seq))
+
+    def _fits(self, ticket):
+        return self.active_requests == 0 or self.active_cost + ticket.cost <= self.capacity
+
+    def retry_after(self):
+        """Seconds until the running and queued work is expected to drain."""
+        pending_ms = self.active_ms + sum(ticket.estimated_ms for ticket in self._waiting)
+        parallelism = max(1, min(self.capacity, os.cpu_count() or 1))
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(pending_ms / 1000 / parallelism)))
+
+    def acquire(self, client, estimated_ms, wait=ADMISSION_WAIT, max_cost=None):
+        """
+        Wait for capacity for a request of the given estimated cost (at most
+        max_cost units, default the whole capacity) and return its
+        AdmissionTicket. Raises AdmissionRejected.
+        """
+        cost = min(max_cost or self.capacity, self.capacity, max(1, math.ceil(estimated_ms / COST_UNIT_MS)))
+        start = time.monotonic()
+        deadline = start + wait
+
+        with self._cond:
+            self._seq += 1
+            ticket = AdmissionTicket(self, client, cost, estimated_ms, self._seq)
+
+            if not self._waiting and self._fits(ticket):
+                return self._start(ticket, start)
+
+            if len(self._waiting) >= ADMISSION_QUEUE_SIZE:
+                self.stats["rejected_queue_full"] += 1
+                raise AdmissionRejected("The server is busy, try again later.", 503, self.retry_after())
+            if sum(1 for waiting in self._waiting if waiting.client == client) >= ADMISSION_CLIENT_QUEUE_SIZE:
+                self.stats["rejected_client_limit"] += 1
+                raise AdmissionRejected("Too many requests in progress for this client.", 429, self.retry_after())
+
+            self.stats["queued"] += 1
+            self._waiting.append(ticket)
+            try:
+                while not (self._next() is ticket and self._fits(ticket)):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["rejected_timeout"] += 1
+                        raise AdmissionRejected("The server is busy, try again later.", 503, self.retry_after())
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(ticket)
+                # Whoever is next may fit now that this ticket is out of the way
+                self._cond.notify_all()
+                raise
+            self._waiting.remove(ticket)
+            return self._start(ticket, start)
+
+    def _start(self, ticket, start):
+        self.active_cost += ticket.cost
+        self.active_ms += ticket.estimated_ms
+        self.active_requests += 1
+        self.client_active[ticket.client] = self.client_active.get(ticket.client, 0) + ticket.cost
+        self.stats["admitted"] += 1
+        self.stats["wait_seconds"] += time.monotonic() - start
+        # Another waiter may fit alongside this one
+        self._cond.notify_all()
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.active_cost -= ticket.cost
+            self.active_ms -= ticket.estimated_ms
+            self.active_requests -= 1
+            self.client_active[ticket.client] -= ticket.cost
+            if self.client_active[ticket.client] <= 0:
+                del self.client_active[ticket.client]
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """Current queue and capacity state plus the admission counters."""
+        with self._cond:
+            clients = {client: {"active_cost": cost} for client, cost in self.client_active.items()}
+            for ticket in self._waiting:
+                clients.setdefault(ticket.client, {"active_cost": 0})
+                clients[ticket.client]["queued"] = clients[ticket.client].get("queued", 0) + 1
+            return {
+                "capacity": self.capacity,
+                "active_cost": self.active_cost,
+                "active_requests": self.active_requests,
+                "queue_depth": len(self._waiting),
+                "queued_cost": sum(ticket.cost for ticket in self._waiting),
+                "retry_after": self.retry_after(),
+                "clients": clients,
+                **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()}
+            }
+
+
+def client_identity(request):
+    """The admission client of a Flask request: the proxy-set tenant, else the client address."""
+    if CLIENT_ID_HEADER:
+        tenant = request.headers.get(CLIENT_ID_HEADER, "").strip()
+        if tenant:
+            return tenant
+    return request.remote_addr
+
+
+def init_admission(app):
+    """
+    Release a request's admission ticket when the request ends, and take the
+    client address from the trusted proxies' X-Forwarded-For.
+    """
+    from flask import g
+
+    if TRUSTED_PROXIES > 0:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+    @app.teardown_request
+    def release_admission(exc=None):
+        ticket = g.pop('admission_ticket', None)
+        if ticket is not None:
+            ticket.release()
@@ -1,10 +1,309 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, abort, g
+import hmac
 import json
-from logics.logic1 import execute_logic1  # Import our Python logic for Logic 1
-from logics.logic2 import execute_logic2  # Import our Python logic for Logic 2
-from logics.logic3 import execute_logic3  # Add this import for Logic 3
+import os
+from logics.logic1 import execute_logic1, iter_logic1  # Import our Python logic for Logic 1
+from logics.logic2 import execute_logic2, iter_logic2  # Import our Python logic for Logic 2
+from logics.logic3 import execute_logic3, shape_review_result, REVIEW_FIELDS  # Add this import for Logic 3
+from logics.window import parse_window
+from logics.summary import summarize_labeled_records, summarize_review
+from logics.registry import ScheduleRegistry
+from logics.datasets import DatasetStore
+from logics.deadline import Deadline, DeadlineExceeded
+from logics.metrics import stage
+from logics.compact import (decode_recorded_times, decode_schedules, encode_labeled_arrays, iter_record_strings,
+                            record_strings)
+from admission import (ADMISSION_ENABLED, ADMISSION_WAIT, AdmissionController, AdmissionRejected, client_identity,
+                       count_schedules, estimate_cost_ms, init_admission)
+from compression import init_compression
+from jobs import FINISHED, JobQueue, JobQueueFull, init_jobs
+from progress import PROGRESS_KEY, ProgressBoard, init_progress, progress_key, progress_stream
+from server_timing import init_server_timing, note_debug_request, with_debug_block
+from slowlog import init_slowlog, note_engine_input
+from profiling import init_profiling
+from sampler import MAX_PROFILE_SECONDS, StackSampler, collapsed_text, init_sampler
+from msgpack_codec import is_msgpack_request, msgpack, msgpack_response, unpackb, wants_msgpack
+from uploads import decode_upload, is_zip, process_bulk_upload, read_upload, validate_upload
 
 app = Flask(__name__)
+# Before compression, so its after_request hook sees the final response
+init_server_timing(app)
+init_compression(app)
+init_slowlog(app)
+init_admission(app)
+init_progress(app)
+init_profiling(app)
+init_sampler(app)
+
+# Runs with more records than this return a timesheet summary instead of every
+# labeled punch, unless the request asks for "view": "records".
+SUMMARY_DEFAULT_THRESHOLD = 5000
+
+# Seconds an execute request may run before the engines give up on it.
+# Clients can ask for less with "timeout" in the body or an X-Request-Timeout header.
+REQUEST_TIMEOUT = float(os.environ.get("DTR_REQUEST_TIMEOUT", "120"))
+
+# Shared secret for the /debug routes, sent in an X-Debug-Token header. The
+# routes answer 404 while it is unset. (The peer address can't gate them:
+# behind the reverse proxy every request comes from loopback.)
+DEBUG_TOKEN = os.environ.get("DTR_DEBUG_TOKEN", "")
+
+
+def debug_access_error():
+    """None if the request may use a /debug route, else the error response."""
+    if not DEBUG_TOKEN:
+        return api_response({'status': 'error', 'message': 'Not found.'}), 404
+    token = request.headers.get('X-Debug-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), DEBUG_TOKEN.encode('utf-8')):
+        return api_response({'status': 'error', 'message': 'A valid X-Debug-Token header is required.'}), 403
+    return None
+
+
+def api_response(payload):
+    """Encode an API payload as MessagePack or JSON, following the Accept header."""
+    with stage('encode'):
+        return with_debug_block(payload, msgpack_response if wants_msgpack(request) else jsonify)
+
+
+def get_request_data():
+    """
+    Read the request body as a dict, from JSON or from MessagePack
+    (Content-Type: application/msgpack). Malformed MessagePack bodies abort
+    the request with a 400 (415 if MessagePack isn't installed).
+    """
+    with stage('decode'):
+        if not is_msgpack_request(request):
+            data = request.get_json()
+            note_debug_request(data)
+            return data
+
+        if msgpack is None:
+            message, status = 'MessagePack is not supported on this server.', 415
+        else:
+            try:
+                data = unpackb(request.get_data())
+                note_debug_request(data)
+                return data
+            except ValueError as e:
+                message, status = str(e), 400
+
+    print("REQUEST: Rejected MessagePack body:", message)
+    error_response = api_response({'status': 'error', 'message': message})
+    error_response.status_code = status
+    abort(error_response)
+
+
+def get_window(data):
+    """
+    Read the optional {"start": ..., "end": ...} window from a request body.
+    Returns (window, error_response); error_response is set if it is invalid.
+    """
+    window = data.get('window')
+    try:
+        parse_window(window)
+    except ValueError as e:
+        return None, (api_response({'status': 'error', 'message': str(e)}), 400)
+    return window, None
+
+
+def get_compact_input(recorded_times, schedule_data):
+    """
+    Decode compact input: epoch minute / ISO-8601 recordedTimes and
+    minute-of-week schedule pairs (see logics/compact.py). Regular record
+    strings and schedule objects pass through unchanged.
+    Returns (recorded_times, schedule_data, error_response).
+    """
+    try:
+        with stage('decode'):
+            return decode_recorded_times(recorded_times), decode_schedules(schedule_data), None
+    except ValueError as e:
+        return None, None, (api_response({'status': 'error', 'message': str(e)}), 400)
+
+
+def resolve_dataset(data, recorded_times, schedule_data):
+    """
+    Use an uploaded dataset when the request names a dataset_id (returned by
+    /upload) instead of sending recordedTimes. The dataset's schedules are
+    used unless the request sends schedules or a schedule_id.
+    Returns (recorded_times, schedule_data, error_response).
+    """
+    dataset_id = data.get('dataset_id')
+    if not dataset_id:
+        return recorded_times, schedule_data, None
+
+    with stage('decode'):
+        dataset = DatasetStore().get(str(dataset_id))
+    if dataset is None:
+        return None, None, (api_response({
+            'status': 'error',
+            'message': f'Unknown or expired dataset_id: {dataset_id}. Upload the file again.'
+        }), 404)
+
+    if dataset.schedules and not any(key in data for key in ('schedules', 'schedule', 'schedule_id')):
+        # Copies: Logic 3 annotates schedule dicts
+        schedule_data = [dict(schedule) for schedule in dataset.schedules]
+    return dataset.recorded_times, schedule_data, None
+
+
+def wants_echo():
+    """False if an upload asked not to get its records back (echo=false)."""
+    return request.values.get('echo', 'true').lower() not in ('0', 'false', 'no')
+
+
+def resolve_schedule_id(data, schedule_data):
+    """
+    Use the registered schedule set when the request names a schedule_id
+    (returned by /set_schedule) instead of sending the schedules.
+    Returns (schedule_data, error_response).
+    """
+    schedule_id = data.get('schedule_id')
+    if not schedule_id:
+        return schedule_data, None
+
+    with stage('decode'):
+        compiled = ScheduleRegistry().get(str(schedule_id))
+    if compiled is None:
+        return None, (api_response({
+            'status': 'error',
+            'message': f'Unknown schedule_id: {schedule_id}. Register the schedules with /set_schedule.'
+        }), 404)
+    return compiled, None
+
+
+def requested_timeout(data):
+    """The run time limit the client asked for ("timeout" seconds in the body or X-Request-Timeout), or None."""
+    requested = data.get('timeout', request.headers.get('X-Request-Timeout'))
+    try:
+        if requested is not None and float(requested) > 0:
+            return float(requested)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def request_deadline(data):
+    """
+    The Deadline for this request: REQUEST_TIMEOUT, or less if the client
+    asks for it. With a progress id, the run reports to GET /progress/<id>.
+    """
+    seconds = min(REQUEST_TIMEOUT, requested_timeout(data) or REQUEST_TIMEOUT)
+    key = progress_key(data)
+    if key is None:
+        return Deadline(seconds)
+    g.progress_key = key
+    return ProgressBoard().start(key, seconds)
+
+
+def deadline_response(error):
+    """Response for a run stopped by its deadline (504) or cancelled (409), with how far it got."""
+    return api_response({'status': 'error', 'message': str(error), 'progress': error.progress()}), (
+        409 if error.cancelled else 504)
+
+
+def admit_request(logic, recorded_times, schedule_data, deadline=None):
+    """
+    Wait until the request fits in the engines' capacity (see admission.py),
+    at most until the deadline. The capacity is given back when the request ends.
+    Returns an error response (429/503 with Retry-After) if it is rejected.
+    """
+    if not ADMISSION_ENABLED:
+        return None
+
+    client = client_identity(request)
+    estimated_ms = estimate_cost_ms(logic, len(recorded_times), count_schedules(schedule_data))
+    wait = ADMISSION_WAIT if deadline is None else min(ADMISSION_WAIT, deadline.remaining())
+    try:
+        with stage('queue'):
+            g.admission_ticket = AdmissionController().acquire(client, estimated_ms, wait=wait)
+    except AdmissionRejected as e:
+        print(f"ADMISSION: Rejected {logic} request from {client} ({estimated_ms:.0f} ms estimated):", str(e))
+        error_response = api_response({'status': 'error', 'message': str(e)})
+        error_response.status_code = e.status
+        error_response.headers['Retry-After'] = str(e.retry_after)
+        return error_response
+    return None
+
+
+def wants_compact(data):
+    """True if the client asked for labels as parallel arrays ("format": "compact")."""
+    return data.get('format') == 'compact'
+
+
+def wants_summary(data, recorded_times):
+    """
+    Decide between the full records payload and the summary payload.
+    An explicit "view" ("records" or "summary") wins; otherwise large runs
+    get the summary.
+    """
+    view = data.get('view')
+    if view in ('records', 'summary'):
+        return view == 'summary'
+    if wants_compact(data):
+        return False
+    return len(recorded_times) > SUMMARY_DEFAULT_THRESHOLD
+
+
+# Labeled records per NDJSON chunk; small enough to render progressively,
+# large enough to avoid one write per record.
+STREAM_CHUNK_RECORDS = 200
+
+
+def wants_stream(data):
+    """True if the client asked for an NDJSON stream ("stream": true or Accept header)."""
+    if data.get('stream'):
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+def ndjson_response(labeled_records, log_tag):
+    """
+    Stream labeled records as newline-delimited JSON, one record per line,
+    followed by a trailer line {"trailer": true, "status": ..., "count": ...}
+    that carries the error message if the run failed part way (and the
+    progress it reached if it ran out of time or was cancelled).
+    """
+    # The run's progress (if it has a progress id) ends with the stream, not with the route
+    progress_id = g.pop('progress_key', None)
+
+    def finish_progress(status, message=None):
+        if progress_id is not None:
+            ProgressBoard().finish(progress_id, status, message)
+
+    def generate():
+        count = 0
+        chunk = []
+        try:
+            for labeled in labeled_records:
+                chunk.append(json.dumps(labeled))
+                count += 1
+                if len(chunk) >= STREAM_CHUNK_RECORDS:
+                    yield "\n".join(chunk) + "\n"
+                    chunk = []
+            trailer = {'trailer': True, 'status': 'success', 'count': count}
+            print(f"{log_tag}: Streamed {count} labeled records.")
+            finish_progress("succeeded")
+        except DeadlineExceeded as e:
+            print(f"{log_tag}:", str(e))
+            trailer = {'trailer': True, 'status': 'error', 'count': count, 'message': str(e),
+                       'progress': e.progress()}
+            finish_progress("cancelled" if e.cancelled else "failed", str(e))
+        except Exception as e:
+            error_message = f"Error processing logic: {str(e)}"
+            print(f"{log_tag}:", error_message)
+            trailer = {'trailer': True, 'status': 'error', 'count': count, 'message': error_message}
+            finish_progress("failed", error_message)
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+        yield json.dumps(trailer) + "\n"
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    # The stream does the engine work, so it holds the admission ticket until it is closed
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        response.call_on_close(ticket.release)
+    # A client that disconnects part way never reaches the trailer (no-op once finished)
+    response.call_on_close(lambda: finish_progress("failed", "Stream closed before the end"))
+    return response
 
 
 @app.route('/')
@@ -14,104 +313,152 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_info():
-    if 'file' not in request.files:
+    # Several files and/or zip archives: bulk upload with a per-file manifest
+    files = [f for f in request.files.getlist('file') + request.files.getlist('files') if f.filename]
+    if len(files) > 1 or any(is_zip(f) for f in files):
+        return bulk_upload(files)
+
+    # A MessagePack document can also be posted as the request body itself
+    if is_msgpack_request(request):
+        file = None
+        data = get_request_data()
+    elif 'file' not in request.files:
         print("UPLOAD: No file provided.")
-        return jsonify({'status': 'error', 'message': 'No file provided.'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        print("UPLOAD: No file selected.")
-        return jsonify({'status': 'error', 'message': 'No file selected.'}), 400
+        return api_response({'status': 'error', 'message': 'No file provided.'}), 400
+    else:
+        file = request.files['file']
+        if file.filename == '':
+            print("UPLOAD: No file selected.")
+            return api_response({'status': 'error', 'message': 'No file selected.'}), 400
     
     try:
-        print("UPLOAD: Received file:", file.filename)
-        content = file.read().decode('utf-8')
-        data = json.loads(content)
+        if file is None:
+            print("UPLOAD: Received MessagePack body.")
+        else:
+            print("UPLOAD: Received file:", file.filename)
+            data = decode_upload(file.filename, read_upload(file), file.mimetype)
         
-        # Validate recordedTimes
-        if "recordedTimes" not in data or not isinstance(data["recordedTimes"], list):
-            print("UPLOAD: JSON file does not contain valid 'recordedTimes' key.")
-            return jsonify({
-                'status': 'error', 
-                'message': 'JSON file must contain "recordedTimes" as a list.'
-            }), 400
+        # Validate recordedTimes and schedules (raises ValueError)
+        validate_upload(data)
 
-        # Validate schedules if present
-        if 'schedules' in data:
-            if not isinstance(data['schedules'], list):
-                print("UPLOAD: Invalid schedules format.")
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Schedules must be a list.'
-                }), 400
-            
-            # Validate each schedule
-            for schedule in data['schedules']:
-                required_fields = ['start_day', 'start_time', 'end_day', 'end_time']
-                if not all(field in schedule for field in required_fields):
-                    print("UPLOAD: Invalid schedule structure.")
-                    return jsonify({
-                        'status': 'error',
-                        'message': f'Each schedule must contain: {", ".join(required_fields)}'
-                    }), 400
+        # Keep the parsed punches server-side; execute calls can send the dataset_id
+        dataset = DatasetStore().put(data['recordedTimes'], data.get('schedules'),
+                                     name=file.filename if file else None)
 
         # Return structured response with uncheck_logics flag
         response_data = {
             'status': 'success',
             'uncheck_logics': True,  # Add this flag
-            'content': {
-                'recordedTimes': data['recordedTimes']
-            }
+            'dataset_id': dataset.dataset_id,
+            'dataset': dataset.describe(),
+            'content': {}
         }
+
+        # Echo the records back for the browser unless asked not to
+        if wants_echo():
+            response_data['content']['recordedTimes'] = (data['recordedTimes'] if wants_msgpack(request)
+                                                         else record_strings(data['recordedTimes']))
         
         # Include schedules if present
         if 'schedules' in data:
             response_data['content']['schedules'] = data['schedules']
             
         print("UPLOAD: Processed file content successfully.")
-        return jsonify(response_data)
+        return api_response(response_data)
         
     except json.JSONDecodeError:
         print("UPLOAD: Invalid JSON format.")
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': 'File must contain valid JSON.'
         }), 400
+    except ValueError as e:
+        print("UPLOAD: Invalid file content:", str(e))
+        return api_response({'status': 'error', 'message': str(e)}), 400
     except Exception as e:
         print("UPLOAD: Error processing file:", str(e))
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': str(e)
         }), 500
 
 
+def bulk_upload(files):
+    """
+    Handle a multi-file / zip upload: every member is decoded, validated and
+    stored as a dataset in parallel, and a per-file manifest is returned
+    instead of the records.
+    """
+    print(f"UPLOAD: Bulk upload of {len(files)} files:", ", ".join(f.filename for f in files))
+    try:
+        manifest = process_bulk_upload(files)
+    except Exception as e:
+        print("UPLOAD: Error processing bulk upload:", str(e))
+        return api_response({'status': 'error', 'message': str(e)}), 500
+
+    errors = sum(1 for entry in manifest if entry['status'] == 'error')
+    datasets = [entry['dataset_id'] for entry in manifest if entry.get('dataset_id')]
+    print(f"UPLOAD: Bulk upload stored {len(datasets)} datasets, {errors} files rejected.")
+    return api_response({
+        'status': 'success' if datasets else 'error',
+        'uncheck_logics': True,
+        'datasets': datasets,
+        'errors': errors,
+        'manifest': manifest
+    }), 200 if datasets else 400
+
+
 @app.route('/set_schedule', methods=['POST'])
 def set_schedule():
-    data = request.get_json()
+    data = get_request_data()
     # Handle new schedule format
     if 'schedules' in data and isinstance(data['schedules'], list):
         schedules = data.get('schedules', [])
+        legacy_message = None
+    else:
+        # Handle legacy format for backward compatibility
+        schedule_day = data.get('schedule_day')
+        start_time = data.get('start_time')
+        end_time = data.get('end_time')
+        schedules = [{
+            'start_day': schedule_day,
+            'start_time': start_time,
+            'end_day': schedule_day,
+            'end_time': end_time
+        }]
+        legacy_message = f"Schedule set for {schedule_day} from {start_time} to {end_time}."
+
+    # Validate and compile once; execute calls can then send the schedule_id
+    try:
+        schedules = decode_schedules(schedules)
+        compiled = ScheduleRegistry().register(schedules if isinstance(schedules, list) else [schedules])
+    except ValueError as e:
+        print("SET_SCHEDULE: Invalid schedules:", str(e))
+        return api_response({'status': 'error', 'message': str(e)}), 400
+
+    if legacy_message:
+        response_message = legacy_message
+    else:
         schedule_info = []
-        for schedule in schedules:
+        for schedule in compiled:
             schedule_info.append(
                 f"{schedule.get('start_day')} {schedule.get('start_time')} to "
                 f"{schedule.get('end_day')} {schedule.get('end_time')}"
             )
         response_message = f"Multiple schedules set: {', '.join(schedule_info)}"
-    else:
-        # Handle legacy format for backward compatibility
-        schedule_day = data.get('schedule_day')
-        start_time = data.get('start_time')
-        end_time = data.get('end_time')
-        response_message = f"Schedule set for {schedule_day} from {start_time} to {end_time}."
 
-    print("SET_SCHEDULE:", response_message)
-    return jsonify({'status': 'success', 'message': response_message})
+    print("SET_SCHEDULE:", response_message, "-> schedule_id", compiled.schedule_id)
+    return api_response({
+        'status': 'success',
+        'message': response_message,
+        'schedule_id': compiled.schedule_id,
+        'schedules': compiled.describe()
+    })
 
 
 @app.route('/execute_logic1', methods=['POST'])
 def execute_logic1_endpoint():
-    data = request.get_json()
+    data = get_request_data()
     recorded_times = data.get('recordedTimes', [])
 
     # Handle both new and old schedule formats
@@ -124,12 +471,42 @@ def execute_logic1_endpoint():
 
     print("EXECUTE_LOGIC1: Received recordedTimes:", recorded_times)
 
+    window, error_response = get_window(data)
+    if error_response:
+        print("EXECUTE_LOGIC1: Invalid window:", data.get('window'))
+        return error_response
+
+    recorded_times, schedule_data, error_response = resolve_dataset(data, recorded_times, schedule_data)
+    if error_response:
+        print("EXECUTE_LOGIC1: Unknown dataset_id:", data.get('dataset_id'))
+        return error_response
+
+    recorded_times, schedule_data, error_response = get_compact_input(recorded_times, schedule_data)
+    if error_response:
+        print("EXECUTE_LOGIC1: Invalid compact input.")
+        return error_response
+
+    schedule_data, error_response = resolve_schedule_id(data, schedule_data)
+    if error_response:
+        print("EXECUTE_LOGIC1: Unknown schedule_id:", data.get('schedule_id'))
+        return error_response
+    note_engine_input(data, recorded_times, schedule_data, window)
+
+    deadline = request_deadline(data)
+    error_response = admit_request('logic1', recorded_times, schedule_data, deadline)
+    if error_response:
+        return error_response
+
+    if wants_stream(data):
+        print("EXECUTE_LOGIC1: Streaming labeled records.")
+        return ndjson_response(iter_record_strings(iter_logic1(recorded_times, schedule_data, window=window, deadline=deadline)), "EXECUTE_LOGIC1")
+
     try:
-        result = execute_logic1(recorded_times, schedule_data)
+        result = execute_logic1(recorded_times, schedule_data, window=window, deadline=deadline)
 
         if isinstance(result, dict) and "error" in result:
             print("EXECUTE_LOGIC1: Error processing logic:", result["error"])
-            return jsonify({'status': 'error', 'message': result["error"]}), 400
+            return api_response({'status': 'error', 'message': result["error"]}), 400
 
         # Ensure we have the expected format for the response
         if isinstance(result, dict) and "labeledRecords" in result:
@@ -138,19 +515,32 @@ def execute_logic1_endpoint():
             # In case the function returns the records directly
             labeled_records = result
 
+        if wants_summary(data, recorded_times):
+            print("EXECUTE_LOGIC1: Successfully processed records. Returning summary.")
+            return api_response({'status': 'success', 'summary': summarize_labeled_records(labeled_records, schedule_data)})
+
+        if wants_compact(data):
+            print("EXECUTE_LOGIC1: Successfully processed records. Returning label arrays.")
+            return api_response({'status': 'success', 'labeledArrays': encode_labeled_arrays(labeled_records)})
+
+        if not wants_msgpack(request):
+            labeled_records = list(iter_record_strings(labeled_records))
         print("EXECUTE_LOGIC1: Successfully processed records. Labeled records:")
         print(labeled_records)
-        return jsonify({'status': 'success', 'labeledRecords': labeled_records})
+        return api_response({'status': 'success', 'labeledRecords': labeled_records})
 
+    except DeadlineExceeded as e:
+        print("EXECUTE_LOGIC1:", str(e))
+        return deadline_response(e)
     except Exception as e:
         error_message = f"Error processing logic: {str(e)}"
         print("EXECUTE_LOGIC1:", error_message)
-        return jsonify({'status': 'error', 'message': error_message}), 500
+        return api_response({'status': 'error', 'message': error_message}), 500
 
 
 @app.route('/execute_logic2', methods=['POST'])
 def execute_logic2_endpoint():
-    data = request.get_json()
+    data = get_request_data()
     recorded_times = data.get('recordedTimes', [])
 
     # Handle both new and old schedule formats
@@ -163,12 +553,42 @@ def execute_logic2_endpoint():
 
     print("EXECUTE_LOGIC2: Received recordedTimes:", recorded_times)
 
+    window, error_response = get_window(data)
+    if error_response:
+        print("EXECUTE_LOGIC2: Invalid window:", data.get('window'))
+        return error_response
+
+    recorded_times, schedule_data, error_response = resolve_dataset(data, recorded_times, schedule_data)
+    if error_response:
+        print("EXECUTE_LOGIC2: Unknown dataset_id:", data.get('dataset_id'))
+        return error_response
+
+    recorded_times, schedule_data, error_response = get_compact_input(recorded_times, schedule_data)
+    if error_response:
+        print("EXECUTE_LOGIC2: Invalid compact input.")
+        return error_response
+
+    schedule_data, error_response = resolve_schedule_id(data, schedule_data)
+    if error_response:
+        print("EXECUTE_LOGIC2: Unknown schedule_id:", data.get('schedule_id'))
+        return error_response
+    note_engine_input(data, recorded_times, schedule_data, window)
+
+    deadline = request_deadline(data)
+    error_response = admit_request('logic2', recorded_times, schedule_data, deadline)
+    if error_response:
+        return error_response
+
+    if wants_stream(data):
+        print("EXECUTE_LOGIC2: Streaming labeled records.")
+        return ndjson_response(iter_record_strings(iter_logic2(recorded_times, schedule_data, window=window, deadline=deadline)), "EXECUTE_LOGIC2")
+
     try:
-        result = execute_logic2(recorded_times, schedule_data)
+        result = execute_logic2(recorded_times, schedule_data, window=window, deadline=deadline)
 
         if isinstance(result, dict) and "error" in result:
             print("EXECUTE_LOGIC2: Error processing logic:", result["error"])
-            return jsonify({'status': 'error', 'message': result["error"]}), 400
+            return api_response({'status': 'error', 'message': result["error"]}), 400
 
         # Ensure we have the expected format for the response
         if isinstance(result, dict) and "labeledRecords" in result:
@@ -177,38 +597,408 @@ def execute_logic2_endpoint():
             # In case the function returns the records directly
             labeled_records = result
 
+        if wants_summary(data, recorded_times):
+            print("EXECUTE_LOGIC2: Successfully processed records. Returning summary.")
+            return api_response({'status': 'success', 'summary': summarize_labeled_records(labeled_records, schedule_data)})
+
+        if wants_compact(data):
+            print("EXECUTE_LOGIC2: Successfully processed records. Returning label arrays.")
+            return api_response({'status': 'success', 'labeledArrays': encode_labeled_arrays(labeled_records)})
+
+        if not wants_msgpack(request):
+            labeled_records = list(iter_record_strings(labeled_records))
         print("EXECUTE_LOGIC2: Successfully processed records. Labeled records:")
         print(labeled_records)
-        return jsonify({'status': 'success', 'labeledRecords': labeled_records})
+        return api_response({'status': 'success', 'labeledRecords': labeled_records})
 
+    except DeadlineExceeded as e:
+        print("EXECUTE_LOGIC2:", str(e))
+        return deadline_response(e)
     except Exception as e:
         error_message = f"Error processing logic: {str(e)}"
         print("EXECUTE_LOGIC2:", error_message)
-        return jsonify({'status': 'error', 'message': error_message}), 500
+        return api_response({'status': 'error', 'message': error_message}), 500
 
 
 @app.route('/execute_logic3', methods=['POST'])
 def execute_logic3_endpoint():
+    data = get_request_data()
     try:
-        data = request.get_json()
         recorded_times = data.get('recordedTimes', [])
         schedules = data.get('schedules', {})
         
         print("EXECUTE_LOGIC3: Received recordedTimes:", recorded_times)
         print("EXECUTE_LOGIC3: Received schedules:", schedules)
-        
-        result = execute_logic3(recorded_times, schedules)
+
+        window, error_response = get_window(data)
+        if error_response:
+            print("EXECUTE_LOGIC3: Invalid window:", data.get('window'))
+            return error_response
+
+        recorded_times, schedules, error_response = resolve_dataset(data, recorded_times, schedules)
+        if error_response:
+            print("EXECUTE_LOGIC3: Unknown dataset_id:", data.get('dataset_id'))
+            return error_response
+
+        # The reviewer works on record strings, so compact punches are formatted
+        recorded_times, schedules, error_response = get_compact_input(recorded_times, schedules)
+        if error_response:
+            print("EXECUTE_LOGIC3: Invalid compact input.")
+            return error_response
+
+        schedules, error_response = resolve_schedule_id(data, schedules)
+        if error_response:
+            print("EXECUTE_LOGIC3: Unknown schedule_id:", data.get('schedule_id'))
+            return error_response
+        recorded_times = record_strings(recorded_times)
+        note_engine_input(data, recorded_times, schedules, window)
+
+        # Optional slim / field-selected response shape
+        shape = data.get('shape', 'full')
+        fields = data.get('fields')
+        if shape not in ('full', 'slim'):
+            return api_response({'status': 'error', 'message': 'shape must be "full" or "slim".'}), 400
+        if fields is not None and (not isinstance(fields, list) or not set(fields) <= set(REVIEW_FIELDS)):
+            return api_response({
+                'status': 'error',
+                'message': f'fields must be a list of: {", ".join(REVIEW_FIELDS)}'
+            }), 400
+
+        deadline = request_deadline(data)
+        error_response = admit_request('logic3', recorded_times, schedules, deadline)
+        if error_response:
+            return error_response
+
+        result = execute_logic3(recorded_times, schedules, window=window, deadline=deadline)
         print("EXECUTE_LOGIC3: Successfully processed records.")
-        
-        return jsonify(result)
+
+        if result.get('status') == 'success' and wants_summary(data, recorded_times):
+            return api_response({
+                'status': 'success',
+                'needs_review': result['needs_review'],
+                'issues': result['issues'],
+                'summary': summarize_review(result, schedules)
+            })
+
+        return api_response(shape_review_result(result, shape, fields))
+    except DeadlineExceeded as e:
+        print("EXECUTE_LOGIC3:", str(e))
+        return deadline_response(e)
     except Exception as e:
         print("EXECUTE_LOGIC3: Error:", str(e))
-        return jsonify({
+        return api_response({
             'status': 'error',
             'message': f"Error processing logic: {str(e)}"
         }), 500
 
 
+@app.route('/summary', methods=['POST'])
+def summary_endpoint():
+    """
+    Run one of the logics and return per-shift, per-day and per-week totals
+    (worked, break and overtime minutes, late/early counts) instead of records.
+    Body: {"logic": "logic1" | "logic2" | "logic3", "recordedTimes": [...],
+    "schedules": [...], "window": {...}}
+    """
+    data = get_request_data()
+    logic = data.get('logic', 'logic1')
+    recorded_times = data.get('recordedTimes', [])
+
+    if logic not in ('logic1', 'logic2', 'logic3'):
+        print("SUMMARY: Unknown logic:", logic)
+        return api_response({'status': 'error', 'message': f'Unknown logic: {logic}'}), 400
+
+    window, error_response = get_window(data)
+    if error_response:
+        print("SUMMARY: Invalid window:", data.get('window'))
+        return error_response
+
+    # Handle both new and old schedule formats
+    if 'schedules' in data:
+        schedule_data = data.get('schedules')
+    else:
+        schedule_data = data.get('schedule', {})
+
+    recorded_times, schedule_data, error_response = resolve_dataset(data, recorded_times, schedule_data)
+    if error_response:
+        print("SUMMARY: Unknown dataset_id:", data.get('dataset_id'))
+        return error_response
+
+    recorded_times, schedule_data, error_response = get_compact_input(recorded_times, schedule_data)
+    if error_response:
+        print("SUMMARY: Invalid compact input.")
+        return error_response
+
+    schedule_data, error_response = resolve_schedule_id(data, schedule_data)
+    if error_response:
+        print("SUMMARY: Unknown schedule_id:", data.get('schedule_id'))
+        return error_response
+
+    print(f"SUMMARY: Summarizing {len(recorded_times)} records with {logic}")
+
+    deadline = request_deadline(data)
+    error_response = admit_request(logic, recorded_times, schedule_data, deadline)
+    if error_response:
+        return error_response
+
+    try:
+        if logic == 'logic3':
+            result = execute_logic3(record_strings(recorded_times), schedule_data, window=window, deadline=deadline)
+            if result.get('status') != 'success':
+                return api_response(result), 400
+            return api_response({
+                'status': 'success',
+                'needs_review': result['needs_review'],
+                'issues': result['issues'],
+                'summary': summarize_review(result, schedule_data)
+            })
+
+        execute = execute_logic1 if logic == 'logic1' else execute_logic2
+        result = execute(recorded_times, schedule_data, window=window, deadline=deadline)
+
+        if isinstance(result, dict) and "error" in result:
+            print("SUMMARY: Error processing logic:", result["error"])
+            return api_response({'status': 'error', 'message': result["error"]}), 400
+
+        labeled_records = result["labeledRecords"] if isinstance(result, dict) else result
+        return api_response({'status': 'success', 'summary': summarize_labeled_records(labeled_records, schedule_data)})
+
+    except DeadlineExceeded as e:
+        print("SUMMARY:", str(e))
+        return deadline_response(e)
+    except Exception as e:
+        error_message = f"Error processing logic: {str(e)}"
+        print("SUMMARY:", error_message)
+        return api_response({'status': 'error', 'message': error_message}), 500
+
+
+def run_job_item(logic, recorded_times, schedule_data, window, options):
+    """
+    Label one input of a background job (see jobs.py) and build the payload
+    the execute routes would return for it. Returns (payload, status code).
+    """
+    if logic == 'logic3':
+        result = execute_logic3(record_strings(recorded_times), schedule_data, window=window)
+        if result.get('status') != 'success':
+            return result, 400
+        if wants_summary(options, recorded_times):
+            return {
+                'status': 'success',
+                'needs_review': result['needs_review'],
+                'issues': result['issues'],
+                'summary': summarize_review(result, schedule_data)
+            }, 200
+        return shape_review_result(result, options.get('shape', 'full'), options.get('fields')), 200
+
+    execute = execute_logic1 if logic == 'logic1' else execute_logic2
+    result = execute(recorded_times, schedule_data, window=window)
+    if isinstance(result, dict) and "error" in result:
+        return {'status': 'error', 'message': result["error"]}, 400
+
+    labeled_records = result["labeledRecords"] if isinstance(result, dict) else result
+    if wants_summary(options, recorded_times):
+        return {'status': 'success', 'summary': summarize_labeled_records(labeled_records, schedule_data)}, 200
+    if wants_compact(options):
+        return {'status': 'success', 'labeledArrays': encode_labeled_arrays(labeled_records)}, 200
+    return {'status': 'success', 'labeledRecords': list(iter_record_strings(labeled_records))}, 200
+
+
+init_jobs(app, run_job_item)
+
+# Request options that shape a job's result payload
+JOB_OPTIONS = ('view', 'format', 'shape', 'fields')
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a labeling run as a background job and return its job_id (202).
+    Body: like /summary ({"logic", "recordedTimes" or "dataset_id",
+    "schedules" or "schedule_id", "window"}) plus the execute routes'
+    "view", "format", "shape", "fields" and "timeout"; or "dataset_ids":
+    [...] instead of the records, to run the logic over several uploaded
+    datasets in one job.
+    """
+    data = get_request_data()
+    logic = data.get('logic', 'logic1')
+
+    if logic not in ('logic1', 'logic2', 'logic3'):
+        print("JOBS: Unknown logic:", logic)
+        return api_response({'status': 'error', 'message': f'Unknown logic: {logic}'}), 400
+
+    window, error_response = get_window(data)
+    if error_response:
+        print("JOBS: Invalid window:", data.get('window'))
+        return error_response
+
+    fields = data.get('fields')
+    if data.get('shape', 'full') not in ('full', 'slim') or (
+            fields is not None and (not isinstance(fields, list) or not set(fields) <= set(REVIEW_FIELDS))):
+        return api_response({
+            'status': 'error',
+            'message': f'shape must be "full" or "slim" and fields a list of: {", ".join(REVIEW_FIELDS)}'
+        }), 400
+
+    dataset_ids = data.get('dataset_ids')
+    batch = dataset_ids is not None
+    if batch and (not isinstance(dataset_ids, list) or not dataset_ids):
+        return api_response({'status': 'error', 'message': 'dataset_ids must be a non-empty list.'}), 400
+
+    # Handle both new and old schedule formats
+    if 'schedules' in data:
+        schedule_data = data.get('schedules')
+    else:
+        schedule_data = data.get('schedule', {})
+
+    # Resolve everything now, so the job doesn't depend on datasets or schedules that may expire
+    items = []
+    for dataset_id in dataset_ids if batch else [data.get('dataset_id')]:
+        recorded_times, schedules, error_response = resolve_dataset(
+            dict(data, dataset_id=dataset_id), data.get('recordedTimes', []), schedule_data)
+        if error_response:
+            print("JOBS: Unknown dataset_id:", dataset_id)
+            return error_response
+
+        recorded_times, schedules, error_response = get_compact_input(recorded_times, schedules)
+        if error_response:
+            print("JOBS: Invalid compact input.")
+            return error_response
+
+        schedules, error_response = resolve_schedule_id(data, schedules)
+        if error_response:
+            print("JOBS: Unknown schedule_id:", data.get('schedule_id'))
+            return error_response
+
+        items.append({'dataset_id': dataset_id, 'recordedTimes': recorded_times, 'schedules': schedules,
+                      'schedule_id': data.get('schedule_id'), 'window': window})
+
+    options = {key: data[key] for key in JOB_OPTIONS if key in data}
+    try:
+        job = JobQueue().submit(logic, items, options, timeout=requested_timeout(data), batch=batch)
+    except JobQueueFull as e:
+        print("JOBS:", str(e))
+        return api_response({'status': 'error', 'message': str(e)}), 503
+    except (OSError, TypeError, ValueError) as e:
+        print("JOBS: Could not queue job:", str(e))
+        return api_response({'status': 'error', 'message': f'Could not queue job: {str(e)}'}), 500
+
+    response = api_response({'status': 'success', 'job_id': job.job_id, 'job': job.describe()})
+    response.status_code = 202
+    response.headers['Location'] = f'/jobs/{job.job_id}'
+    return response
+
+
+def unknown_job(job_id):
+    return api_response({'status': 'error', 'message': f'Unknown or expired job_id: {job_id}.'}), 404
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """A background job's status and progress."""
+    job = JobQueue().get(job_id)
+    if job is None:
+        return unknown_job(job_id)
+    return api_response({'status': 'success', 'job': job.describe()})
+
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """
+    A finished job's result: the payload (and status code) its execute route
+    would have returned, or {"results": [...]} for a dataset_ids batch.
+    409 while the job is queued or running.
+    """
+    job = JobQueue().get(job_id)
+    if job is None:
+        return unknown_job(job_id)
+    if job.status not in FINISHED:
+        return api_response({'status': 'error', 'message': f'Job {job_id} is {job.status}.',
+                             'job': job.describe()}), 409
+
+    stored = JobQueue().result(job_id)
+    if stored is None:
+        return unknown_job(job_id)
+    payload, status = stored
+    return api_response(payload), status
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job, or delete a finished one and its result."""
+    job = JobQueue().cancel(job_id)
+    if job is None:
+        return unknown_job(job_id)
+    print(f"JOBS: Cancelled or deleted job {job_id} ({job.status})")
+    return api_response({'status': 'success', 'job': job.describe()})
+
+
+@app.route('/progress/<key>', methods=['GET'])
+def progress_events(key):
+    """
+    Server-sent events with the progress of the run started with this
+    progress_id (or of the job with this job_id): "progress" events with
+    the phase and records done, then a "done" event.
+    """
+    if not PROGRESS_KEY.match(key):
+        return api_response({'status': 'error', 'message': 'Invalid progress id.'}), 400
+    response = Response(progress_stream(ProgressBoard().track(key)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@app.route('/progress/<key>', methods=['DELETE'])
+def cancel_progress(key):
+    """Cancel the run started with this progress_id; it stops at its next check."""
+    run = ProgressBoard().cancel(key)
+    if run is None:
+        return api_response({'status': 'error', 'message': f'No run in progress for {key}.'}), 404
+    print(f"PROGRESS: Cancelling {key}")
+    return api_response({'status': 'success', 'progress': run.snapshot()})
+
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """
+    Collect stack samples for ?seconds=N (default 10) and return them as
+    collapsed stacks for a flamegraph. Requires the X-Debug-Token header.
+    """
+    error = debug_access_error()
+    if error:
+        return error
+
+    sampler = StackSampler()
+    if not sampler.running:
+        return api_response({'status': 'error', 'message': 'The sampling profiler is disabled (DTR_SAMPLER=0).'}), 404
+
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        seconds = -1
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return api_response({
+            'status': 'error',
+            'message': f'seconds must be a number between 0 and {MAX_PROFILE_SECONDS}.'
+        }), 400
+
+    print(f"DEBUG_PROFILE: Sampling for {seconds} seconds.")
+    counts = sampler.collect(seconds)
+    print(f"DEBUG_PROFILE: Collected {sum(counts.values())} samples in {len(counts)} stacks.")
+    response = Response(collapsed_text(counts), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(sum(counts.values()))
+    response.headers['X-Profile-Interval-Ms'] = str(round(sampler.interval * 1000, 3))
+    return response
+
+
+@app.route('/debug/admission', methods=['GET'])
+def debug_admission():
+    """Admission control metrics: capacity in use, queue depth, admissions and rejections."""
+    error = debug_access_error()
+    if error:
+        return error
+    return api_response({'status': 'success', 'enabled': ADMISSION_ENABLED, 'admission': AdmissionController().snapshot()})
+
+
 if __name__ == '__main__':
     print("Starting Flask server on 0.0.0.0, port 5069...")
     app.run(debug=True, host='0.0.0.0', port=5069)
\ No newline at end of file
@@ -0,0 +1,194 @@
+import gzip
+import io
+import json
+import zlib
+
+try:
+    import brotli  # Optional: pip install brotli
+except ImportError:
+    brotli = None
+
+
+# ----------------------------------------
+# Transparent request/response compression
+# ----------------------------------------
+# Month-scale record lists are multi-megabyte and very repetitive
+# ("Monday - 24/03/2025 - 6:00 PM" ...), so they compress extremely well.
+# Responses are compressed when the client accepts it and the body is
+# large enough to be worth the CPU; small responses are sent as-is.
+
+COMPRESS_MIN_SIZE = 2048  # bytes; below this compression costs more than it saves
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MAX_DECOMPRESSED_SIZE = 256 * 1024 * 1024  # refuse request bodies that inflate beyond this
+BROTLI_CHUNK_SIZE = 1024  # compressed bytes fed to the brotli decompressor at a time
+
+# Routes that accept compressed request bodies
+COMPRESSED_REQUEST_PATHS = ('/upload', '/execute_logic1', '/execute_logic2', '/execute_logic3', '/summary')
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/msgpack', 'text/',
+                      'application/javascript')
+
+
+def parse_accept_encoding(header):
+    """Parse an Accept-Encoding header into {encoding: q}."""
+    accepted = {}
+    for item in (header or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, params = item.partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """Pick the best supported encoding for an Accept-Encoding header, or None."""
+    accepted = parse_accept_encoding(header)
+    candidates = ["br", "gzip"] if brotli is not None else ["gzip"]
+    best = None
+    best_q = 0.0
+    for encoding in candidates:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _inflate(data, wbits, limit):
+    """Inflate one complete zlib/gzip stream. Returns (result, unused data after it)."""
+    decompressor = zlib.decompressobj(wbits)
+    result = decompressor.decompress(data, limit + 1)
+    if len(result) > limit or decompressor.unconsumed_tail:
+        raise ValueError("Decompressed request body is too large.")
+    if not decompressor.eof:
+        raise ValueError("Compressed request body is truncated.")
+    return result, decompressor.unused_data
+
+
+def _decompress_brotli(data, limit):
+    """Inflate a brotli body a chunk at a time, stopping as soon as it passes the limit."""
+    decompressor = brotli.Decompressor()
+    parts = []
+    size = 0
+    try:
+        for start in range(0, len(data), BROTLI_CHUNK_SIZE):
+            part = decompressor.process(data[start:start + BROTLI_CHUNK_SIZE])
+            size += len(part)
+            if size > limit:
+                raise ValueError("Decompressed request body is too large.")
+            parts.append(part)
+        finished = decompressor.is_finished()
+    except brotli.error as e:
+        raise ValueError(f"Invalid brotli request body: {e}")
+    if not finished:
+        raise ValueError("Compressed request body is truncated.")
+    return b"".join(parts)
+
+
+def decompress(data, encoding, limit=MAX_DECOMPRESSED_SIZE):
+    """
+    Decompress a request body. Raises ValueError for unsupported encodings,
+    truncated bodies and bodies that inflate beyond the limit. gzip bodies
+    may hold several members (like gzip.decompress()); they count towards
+    the limit together.
+    """
+    encoding = encoding.strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        parts = []
+        remaining = limit
+        while True:
+            part, data = _inflate(data, 16 + zlib.MAX_WBITS, remaining)
+            parts.append(part)
+            remaining -= len(part)
+            if not data:
+                return b"".join(parts)
+    elif encoding == "deflate":
+        result, unused = _inflate(data, zlib.MAX_WBITS, limit)
+        if unused:
+            raise ValueError("Unexpected data after the compressed request body.")
+        return result
+    elif encoding == "br":
+        if brotli is None:
+            raise ValueError("Brotli request bodies are not supported on this server.")
+        return _decompress_brotli(data, limit)
+    else:
+        raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+
+
+class DecompressRequestMiddleware:
+    """
+    WSGI middleware that inflates gzip/deflate/br request bodies on the
+    execute and upload routes before Flask reads them, so request.get_json()
+    and request.files work unchanged.
+    """
+
+    def __init__(self, wsgi_app, paths=COMPRESSED_REQUEST_PATHS):
+        self.wsgi_app = wsgi_app
+        self.paths = paths
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding and encoding != "identity" and environ.get("PATH_INFO") in self.paths:
+            try:
+                length = int(environ.get("CONTENT_LENGTH") or 0)
+                body = environ["wsgi.input"].read(length) if length else environ["wsgi.input"].read()
+                body = decompress(body, encoding)
+            except (ValueError, OSError, zlib.error) as e:
+                print("COMPRESSION: Rejected request body:", str(e))
+                body = json.dumps({"status": "error", "message": str(e)}).encode("utf-8")
+                start_response("400 Bad Request", [("Content-Type", "application/json"),
+                                                   ("Content-Length", str(len(body)))])
+                return [body]
+
+            environ["wsgi.input"] = io.BytesIO(body)
+            environ["CONTENT_LENGTH"] = str(len(body))
+            del environ["HTTP_CONTENT_ENCODING"]
+
+        return self.wsgi_app(environ, start_response)
+
+
+def compress_response(response, request):
+    """after_request hook: compress large, compressible responses."""
+    if (response.direct_passthrough or response.is_streamed or
+            response.status_code < 200 or response.status_code in (204, 304) or
+            "Content-Encoding" in response.headers):
+        return response
+
+    mimetype = response.mimetype or ""
+    if not mimetype.startswith(COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_compression(app):
+    """Enable request decompression and response compression for a Flask app."""
+    from flask import request
+
+    app.wsgi_app = DecompressRequestMiddleware(app.wsgi_app)
+    app.after_request(lambda response: compress_response(response, request))
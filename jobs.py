@@ -0,0 +1,428 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date
+
+from werkzeug.http import http_date
+
+from admission import (ADMISSION_ENABLED, ADMISSION_WAIT, AdmissionController, AdmissionRejected, count_schedules,
+                       estimate_cost_ms)
+from logics.compact import record_strings
+from logics.deadline import DeadlineExceeded, deadline_scope
+from logics.registry import ScheduleRegistry
+from progress import ProgressBoard, TrackedDeadline
+from slowlog import plain_schedules, to_json
+
+
+# ----------------------------------------
+# Background jobs for very large labeling runs
+# ----------------------------------------
+# POST /jobs queues a labeling run (one input, or a batch of uploaded
+# datasets) and returns a job id at once, so runs longer than the proxy
+# timeout don't need to hold a connection open. The client polls
+# GET /jobs/<id> for status and progress and fetches GET /jobs/<id>/result
+# when the job is done; DELETE /jobs/<id> cancels it (or deletes it).
+#
+# Jobs run in DTR_JOB_WORKERS threads of the server process; the engines
+# still hand big schedule groups to the worker pool (logics/parallel.py).
+# Every job goes through admission control as the client "jobs", at a cost
+# capped so that the job workers together hold at most JOB_CAPACITY_SHARE
+# of the capacity (but at least one unit each); the rest stays free for the
+# interactive routes, however big the jobs are. Progress comes from the
+# engines' deadline checks (see progress.py), and can also be followed as
+# server-sent events from GET /progress/<id>; cancelling a job cancels its
+# deadline.
+#
+# Everything is kept in DTR_JOB_DIR, one server process per directory:
+#   <id>.json         state: status, progress, timestamps, error
+#   <id>.input.json   the resolved engine input (dataset_id / schedule_id
+#                     resolved at submission, so it survives their expiry)
+#   <id>.result.json  the response payload, once the job has finished
+# After a restart, jobs that were queued or running are queued again (a job
+# interrupted JOB_MAX_ATTEMPTS times fails instead). Finished jobs and their
+# results expire DTR_JOB_TTL seconds after they finish.
+
+JOB_DIR = os.environ.get("DTR_JOB_DIR", os.path.join(tempfile.gettempdir(), "dtr-jobs"))
+JOB_WORKERS = int(os.environ.get("DTR_JOB_WORKERS", "1"))
+JOB_QUEUE_SIZE = int(os.environ.get("DTR_JOB_QUEUE", "100"))  # queued jobs
+JOB_TIMEOUT = float(os.environ.get("DTR_JOB_TIMEOUT", "3600"))  # seconds per job
+JOB_TTL = int(os.environ.get("DTR_JOB_TTL", "3600"))  # seconds a finished job is kept
+JOB_MAX_ATTEMPTS = 3  # runs interrupted by a restart before a job is failed
+JOB_CAPACITY_SHARE = 0.5  # admission capacity all running jobs may hold together
+SWEEP_INTERVAL = 60  # seconds between expiry sweeps of the job directory
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def result_json(value):
+    """json.dump default for results: dates the way jsonify() writes them, so a result reads like the route's."""
+    if isinstance(value, date):
+        return http_date(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+class Job:
+    """A background job's state (what <id>.json holds)."""
+
+    def __init__(self, job_id, logic, items, status=QUEUED, created=None, started=None, finished=None,
+                 expires=None, progress=None, error=None, attempts=0, result_status=None):
+        self.job_id = job_id
+        self.logic = logic
+        self.items = items  # number of inputs: 1, or the datasets of a batch
+        self.status = status
+        self.created = created or time.time()
+        self.started = started
+        self.finished = finished
+        self.expires = expires
+        self.progress = progress or {}
+        self.error = error
+        self.attempts = attempts
+        self.result_status = result_status  # HTTP status of the stored result
+        self.deadline = None
+        self.cancelled = threading.Event()  # set by cancel(), wakes a job waiting for capacity
+
+    @property
+    def expired(self):
+        return self.expires is not None and time.time() >= self.expires
+
+    def to_json(self):
+        return {
+            "job_id": self.job_id,
+            "logic": self.logic,
+            "items": self.items,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "expires": self.expires,
+            "progress": self.progress,
+            "error": self.error,
+            "attempts": self.attempts,
+            "result_status": self.result_status
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**data)
+
+    def describe(self):
+        """The job as reported by GET /jobs/<id>."""
+        now = time.time()
+        end = self.finished or now
+        return {
+            "job_id": self.job_id,
+            "logic": self.logic,
+            "items": self.items,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "queued_seconds": round((self.started or end) - self.created, 3),
+            "run_seconds": round(end - self.started, 3) if self.started else None,
+            "expires_in": max(0, int(self.expires - now)) if self.expires else None
+        }
+
+
+class JobDeadline(TrackedDeadline):
+    """A job's deadline: its checks report progress to the job and its event stream."""
+
+    def __init__(self, job, seconds=None):
+        super().__init__(ProgressBoard().track(job.job_id), seconds)
+        self.job = job
+        self.item = 0
+
+    def check(self, phase, done=None, total=None):
+        self.job.progress = {"item": self.item + 1, "items": self.job.items,
+                             "phase": phase, "done": done, "total": total}
+        super().check(phase, done, total)
+
+    def cancel(self):
+        # Also reached through DELETE /progress/<id>
+        super().cancel()
+        self.job.cancelled.set()
+
+
+class JobQueue:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(JobQueue, cls).__new__(cls)
+            cls._instance._jobs = {}
+            cls._instance._queue = queue.Queue()
+            cls._instance._lock = threading.Lock()
+            cls._instance._runner = None
+            cls._instance._started = False
+            cls._instance._last_sweep = 0.0
+        return cls._instance
+
+    # ----------------------------------------
+    # Submission and queries
+    # ----------------------------------------
+    def submit(self, logic, items, options=None, timeout=None, batch=False):
+        """
+        Persist and queue a job. items is a list of engine inputs:
+        {"recordedTimes", "schedules", "window", and optionally "schedule_id"
+        and "dataset_id"}. A batch job's result lists one payload per
+        input. Raises JobQueueFull.
+        """
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+        if queued >= JOB_QUEUE_SIZE:
+            raise JobQueueFull("Too many jobs queued, try again later.")
+
+        job = Job(uuid.uuid4().hex, logic, len(items))
+        document = {
+            "logic": logic,
+            "options": options or {},
+            "timeout": timeout,
+            "batch": batch,
+            "items": [dict(item, recordedTimes=record_strings(item["recordedTimes"]),
+                           schedules=plain_schedules(item["schedules"])) for item in items]
+        }
+        os.makedirs(JOB_DIR, exist_ok=True)
+        self._write(job.job_id, ".input.json", document)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._save(job)
+        self._queue.put(job.job_id)
+        print(f"JOBS: Queued {logic} job {job.job_id} ({len(items)} inputs)")
+        self.sweep()
+        return job
+
+    def get(self, job_id):
+        """Return the Job for an id, or None if it is unknown or expired."""
+        self.sweep()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.expired:
+            return None
+        return job
+
+    def result(self, job_id):
+        """The stored (payload, status) of a finished job, or None."""
+        try:
+            with open(self._path(job_id, ".result.json"), "r") as f:
+                return json.load(f), self._jobs[job_id].result_status
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued or running job (a running one stops at its next
+        deadline check), or delete a finished one. Returns the Job.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancelled.set()
+        if job.deadline is not None:
+            job.deadline.cancel()
+        if job.status == QUEUED:
+            self._finish(job, CANCELLED, {"status": "error", "message": "The job was cancelled."}, 409)
+        elif job.status in FINISHED:
+            self.delete(job_id)
+        return job
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        for suffix in (".json", ".input.json", ".result.json"):
+            try:
+                os.remove(self._path(job_id, suffix))
+            except OSError:
+                pass
+
+    def sweep(self):
+        """Delete expired jobs (at most once per SWEEP_INTERVAL)."""
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.expired]
+        for job_id in expired:
+            print("JOBS: Expired", job_id)
+            self.delete(job_id)
+
+    # ----------------------------------------
+    # Workers
+    # ----------------------------------------
+    def start(self, runner):
+        """
+        Load the jobs kept in JOB_DIR, queue the unfinished ones again and
+        start the worker threads. runner(logic, recorded_times, schedule_data,
+        window, options) labels one input and returns (payload, status code).
+        """
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._runner = runner
+
+        for job in self._load_all():
+            if job.status in (QUEUED, RUNNING):
+                if job.status == RUNNING and job.attempts >= JOB_MAX_ATTEMPTS:
+                    self._finish(job, FAILED, {"status": "error", "message": "The job was interrupted too often."},
+                                 500)
+                    continue
+                job.status = QUEUED
+                self._save(job)
+                self._queue.put(job.job_id)
+                print(f"JOBS: Queued {job.logic} job {job.job_id} again after a restart")
+
+        for i in range(max(1, JOB_WORKERS)):
+            threading.Thread(target=self._work, name=f"dtr-job-worker-{i}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                # Never let one job take a worker down
+                print(f"JOBS: Job {job.job_id} failed:", str(e))
+                self._finish(job, FAILED, {"status": "error", "message": f"Error processing logic: {str(e)}"}, 500)
+
+    def _run(self, job):
+        with open(self._path(job.job_id, ".input.json"), "r") as f:
+            document = json.load(f)
+        items = document["items"]
+        timeout = min(JOB_TIMEOUT, document.get("timeout") or JOB_TIMEOUT)
+
+        deadline = job.deadline = JobDeadline(job, timeout)
+        ticket = self._admit(job, items, deadline)
+        if job.status != QUEUED:
+            # Cancelled while waiting
+            if ticket is not None:
+                ticket.release()
+            return
+
+        job.status = RUNNING
+        job.started = time.time()
+        job.attempts += 1
+        self._save(job)
+        print(f"JOBS: Running {job.logic} job {job.job_id} (attempt {job.attempts})")
+
+        results = []
+        try:
+            with deadline_scope(deadline):
+                for i, item in enumerate(items):
+                    deadline.item = i
+                    deadline.check("starting")
+                    schedules = ScheduleRegistry().get(item["schedule_id"]) if item.get("schedule_id") else None
+                    payload, status = self._runner(job.logic, item["recordedTimes"], schedules or item["schedules"],
+                                                   item.get("window"), document["options"])
+                    results.append((item, payload, status))
+        except DeadlineExceeded as e:
+            print(f"JOBS: Job {job.job_id}:", str(e))
+            payload = {"status": "error", "message": str(e), "progress": e.progress()}
+            self._finish(job, CANCELLED if e.cancelled else FAILED, payload, 409 if e.cancelled else 504)
+            return
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+        if job.items == 1 and not document.get("batch"):
+            _, payload, status = results[0]
+        else:
+            payload = {"status": "success", "results": [
+                dict(payload, dataset_id=item.get("dataset_id"))
+                for item, payload, _ in results
+            ]}
+            status = 200
+        self._finish(job, SUCCEEDED if status < 400 else FAILED, payload, status)
+        print(f"JOBS: Finished job {job.job_id} in {job.finished - job.started:.1f} s")
+
+    def _admit(self, job, items, deadline):
+        """
+        Wait for admission as the client "jobs" (retrying while the server is
+        busy), at no more than this worker's share of JOB_CAPACITY_SHARE.
+        """
+        if not ADMISSION_ENABLED:
+            return None
+        estimated_ms = sum(estimate_cost_ms(job.logic, len(item["recordedTimes"]), count_schedules(item["schedules"]))
+                           for item in items)
+        controller = AdmissionController()
+        max_cost = max(1, int(controller.capacity * JOB_CAPACITY_SHARE) // max(1, JOB_WORKERS))
+        while True:
+            if deadline.expired or job.cancelled.is_set():
+                return None
+            try:
+                # Bounded waits, so a cancel is noticed
+                return controller.acquire("jobs", estimated_ms, wait=min(ADMISSION_WAIT, deadline.remaining()),
+                                          max_cost=max_cost)
+            except AdmissionRejected as e:
+                job.progress = {"phase": "waiting for capacity", "retry_after": e.retry_after}
+                job.cancelled.wait(min(e.retry_after, deadline.remaining()))
+
+    def _finish(self, job, status, payload, result_status):
+        self._write(job.job_id, ".result.json", payload, default=result_json)
+        job.status = status
+        job.finished = time.time()
+        job.expires = job.finished + JOB_TTL
+        job.result_status = result_status
+        job.error = payload.get("message") if status != SUCCEEDED else None
+        job.deadline = None
+        self._save(job)
+        ProgressBoard().finish(job.job_id, status, job.error)
+
+    # ----------------------------------------
+    # Files
+    # ----------------------------------------
+    def _path(self, job_id, suffix):
+        return os.path.join(JOB_DIR, job_id + suffix)
+
+    def _write(self, job_id, suffix, document, default=to_json):
+        """Write a job file atomically, so a crash never leaves half a file behind."""
+        os.makedirs(JOB_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=JOB_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(document, f, default=default)
+        os.replace(tmp_path, self._path(job_id, suffix))
+
+    def _save(self, job):
+        self._write(job.job_id, ".json", job.to_json())
+
+    def _load_all(self):
+        try:
+            names = sorted(os.listdir(JOB_DIR))
+        except OSError:
+            return []
+        jobs = []
+        for name in names:
+            job_id = name[:-len(".json")]
+            if not name.endswith(".json") or not all(c in "0123456789abcdef" for c in job_id):
+                continue
+            try:
+                with open(os.path.join(JOB_DIR, name), "r") as f:
+                    job = Job.from_json(json.load(f))
+            except (OSError, ValueError, TypeError):
+                continue
+            with self._lock:
+                self._jobs[job.job_id] = job
+            jobs.append(job)
+        jobs.sort(key=lambda job: job.created)
+        return jobs
+
+
+def init_jobs(app, runner):
+    """
+    Start the job workers with the first request, so a debug reloader's
+    parent process never runs jobs. See JobQueue.start() for runner.
+    """
+    @app.before_request
+    def start_job_workers():
+        JobQueue().start(runner)
@@ -1,2 +1,3 @@
 from .logic1 import execute_logic1
 from .logic3 import execute_logic3  # Add this line
+from .stream import iter_labels, label_minutes
\ No newline at end of file
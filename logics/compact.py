@@ -0,0 +1,131 @@
+from datetime import datetime
+
+from .punchlog import (LABEL_CODES, LABELS, MinuteRecords, datetime_to_minute, format_record, minute_to_datetime,
+                       parse_record_minute)
+
+
+# ----------------------------------------
+# Compact numeric request/response format
+# ----------------------------------------
+# Machine-to-machine clients don't need "Tuesday - 25/03/2025 - 2:00 AM".
+# recordedTimes may instead hold epoch minutes (minutes since 01/01/1970,
+# wall clock time, like the punch log) or ISO-8601 strings, which are turned
+# straight into datetimes; the engines take datetimes as-is and skip the
+# split + strptime they do for every record string. Schedules may be given
+# as [start, end] minute-of-week pairs (Monday 00:00 = 0), e.g. Monday
+# 8:00 AM to 5:00 PM is [480, 1020].
+#
+# With "format": "compact" labels come back as parallel arrays:
+#   {"times": [epoch minutes], "labels": [label codes], "labelNames": [...]}
+# where labelNames[code] is the label (code 0 = no label), the same codes as
+# the punch log.
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def _is_iso(value):
+    return len(value) >= 16 and value[4] == "-" and value[10] in "T "
+
+
+def decode_punch(value):
+    """
+    Decode one compact punch (epoch minute, ISO-8601 string or a MessagePack
+    timestamp datetime) into a naive datetime. Record strings are returned
+    unchanged.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid punch: {value}")
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, int):
+        return minute_to_datetime(value)
+    if isinstance(value, str):
+        if not _is_iso(value):
+            return value
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        # Keep the wall clock time, like the record strings do
+        return dt.replace(tzinfo=None, second=0, microsecond=0)
+    raise ValueError(f"Invalid punch: {value}")
+
+
+def decode_recorded_times(recorded_times):
+    """
+    Decode a recordedTimes list that may contain compact punches.
+    Lists of record strings only are returned as-is; Logic 3's labeled
+    record objects ({"record": ..., "label": ...}) pass through unchanged.
+    Raises ValueError for entries that are neither.
+    """
+    if isinstance(recorded_times, MinuteRecords):
+        # A stored dataset (logics/datasets.py): parsed at upload
+        return recorded_times
+    if not isinstance(recorded_times, list):
+        raise ValueError("recordedTimes must be a list.")
+    if all((isinstance(value, str) and not _is_iso(value)) or isinstance(value, dict) for value in recorded_times):
+        return recorded_times
+    try:
+        return [value if isinstance(value, dict) else decode_punch(value) for value in recorded_times]
+    except (TypeError, ValueError, OverflowError) as e:
+        # OverflowError: epoch minutes outside the datetime range
+        raise ValueError(f"Invalid recordedTimes entry: {e}")
+
+
+def format_minute_of_day(minute):
+    hour, minute = divmod(minute, 60)
+    return f"{hour % 12 or 12}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+def decode_schedule(schedule):
+    """Turn a [start, end] minute-of-week pair into a schedule dict; dicts pass through."""
+    if isinstance(schedule, dict):
+        return schedule
+    if (not isinstance(schedule, (list, tuple)) or len(schedule) != 2 or
+            not all(isinstance(m, int) and not isinstance(m, bool) and 0 <= m < MINUTES_PER_WEEK
+                    for m in schedule)):
+        raise ValueError(f"Schedules must be objects or [start, end] minute-of-week pairs: {schedule}")
+
+    start, end = schedule
+    return {
+        "start_day": DAY_NAMES[start // MINUTES_PER_DAY],
+        "start_time": format_minute_of_day(start % MINUTES_PER_DAY),
+        "end_day": DAY_NAMES[end // MINUTES_PER_DAY],
+        "end_time": format_minute_of_day(end % MINUTES_PER_DAY)
+    }
+
+
+def decode_schedules(schedule_data):
+    """Decode a schedule or list of schedules that may use minute-of-week pairs."""
+    if isinstance(schedule_data, list):
+        # A bare [start, end] pair is a single schedule
+        if len(schedule_data) == 2 and all(isinstance(m, int) for m in schedule_data):
+            return decode_schedule(schedule_data)
+        return [decode_schedule(schedule) for schedule in schedule_data]
+    return decode_schedule(schedule_data)
+
+
+def iter_record_strings(labeled_records):
+    """
+    Yield labeled records with datetime "record" values (compact input)
+    formatted back into record strings, for the regular JSON responses.
+    """
+    for labeled in labeled_records:
+        if isinstance(labeled.get("record"), datetime):
+            labeled["record"] = format_record(labeled["record"])
+        yield labeled
+
+
+def record_strings(recorded_times):
+    """Format decoded punches as record strings (for engines that need the text)."""
+    return [format_record(value) if isinstance(value, datetime) else value for value in recorded_times]
+
+
+def encode_labeled_arrays(labeled_records):
+    """Return labeled records as {"times", "labels", "labelNames"} parallel arrays."""
+    times = []
+    labels = []
+    for labeled in labeled_records:
+        record = labeled["record"]
+        times.append(datetime_to_minute(record) if isinstance(record, datetime) else parse_record_minute(record))
+        labels.append(LABEL_CODES.get(labeled.get("label"), 0))
+    return {"times": times, "labels": labels, "labelNames": list(LABELS)}
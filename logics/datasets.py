@@ -0,0 +1,223 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+
+from .compact import decode_punch
+from .punchlog import (MinuteRecords, PunchLog, datetime_to_minute, format_record, minute_to_datetime,
+                       parse_record_minute, write_punchlog)
+
+
+# ----------------------------------------
+# Uploaded datasets
+# ----------------------------------------
+# /upload stores the parsed punches server-side under a dataset id, so the
+# execute routes can take {"dataset_id": ...} instead of the browser
+# posting the full recordedTimes list back for every logic. Punches are
+# parsed once, at upload, and kept as a binary punch log (epoch minutes)
+# next to a small JSON file with the schedules and expiry time. Datasets
+# expire DTR_DATASET_TTL seconds after upload.
+#
+# A dataset hands its punches to the engines as the punch log's sorted
+# epoch-minute column (MinuteRecords, logics/punchlog.py), which Logic 1
+# and 2 label straight from the column (stream.label_minutes()) without a
+# parse or sort phase. If an upload used record strings that don't
+# round-trip through format_record() (old format, leading zeros, ...), the
+# original strings are kept as well (in time order, next to the punch log)
+# and come out as ParsedRecords: the labeled output matches what the client
+# sent, and the engines still take the parsed datetimes instead of parsing
+# the strings again.
+
+DATASET_DIR = os.environ.get("DTR_DATASET_DIR", os.path.join(tempfile.gettempdir(), "dtr-datasets"))
+DATASET_TTL = int(os.environ.get("DTR_DATASET_TTL", "3600"))  # seconds
+DATASET_CACHE_SIZE = int(os.environ.get("DTR_DATASET_CACHE_SIZE", "8"))  # parsed datasets kept in memory
+SWEEP_INTERVAL = 60  # seconds between expiry sweeps of the dataset directory
+
+
+class Dataset:
+    """A stored upload: its punches (datetimes or original strings), schedules and expiry."""
+
+    def __init__(self, dataset_id, recorded_times, schedules=None, name=None, expires=None):
+        # recorded_times: MinuteRecords, or a list of the original strings (datasets stored unsorted)
+        self.dataset_id = dataset_id
+        self.recorded_times = recorded_times
+        self.schedules = schedules
+        self.name = name
+        self.expires = expires
+
+    @property
+    def expired(self):
+        return self.expires is not None and time.time() >= self.expires
+
+    def describe(self):
+        return {
+            "dataset_id": self.dataset_id,
+            "name": self.name,
+            "count": len(self.recorded_times),
+            "has_schedules": bool(self.schedules),
+            "expires_in": max(0, int(self.expires - time.time())) if self.expires else None
+        }
+
+
+def parse_punches(recorded_times):
+    """
+    Parse recordedTimes entries into epoch minutes. Returns (minutes,
+    originals) where originals is the list of record strings to keep if any
+    entry doesn't round-trip through format_record(), else None.
+    Raises ValueError for entries that can't be parsed.
+    """
+    minutes = array("i")
+    originals = []
+    keep_originals = False
+    for value in recorded_times:
+        try:
+            dt = decode_punch(value)
+            if isinstance(dt, str):
+                dt = minute_to_datetime(parse_record_minute(value))
+                keep_originals = keep_originals or format_record(dt) != value
+                originals.append(value)
+            else:
+                originals.append(format_record(dt))
+            minutes.append(datetime_to_minute(dt))
+        except OverflowError as e:
+            # Epoch minutes outside the datetime (or int32 column) range
+            raise ValueError(f"Invalid recordedTimes entry: {e}")
+    return minutes, (originals if keep_originals else None)
+
+
+class DatasetStore:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(DatasetStore, cls).__new__(cls)
+            cls._instance._cache = OrderedDict()
+            cls._instance._lock = threading.Lock()
+            cls._instance._last_sweep = 0.0
+        return cls._instance
+
+    def put(self, recorded_times, schedules=None, name=None, ttl=None):
+        """
+        Parse and store an upload. Entries may be record strings, epoch
+        minutes, ISO-8601 strings or datetimes. Raises ValueError for
+        entries that can't be parsed. Returns the Dataset.
+        """
+        minutes, originals = parse_punches(recorded_times)
+        return self.put_parsed(minutes, originals, schedules, name, ttl)
+
+    def put_parsed(self, minutes, originals=None, schedules=None, name=None, ttl=None):
+        """Store punches already parsed by parse_punches() (e.g. in a worker process)."""
+        dataset_id = uuid.uuid4().hex
+        expires = time.time() + (DATASET_TTL if ttl is None else ttl)
+
+        # Punch logs are stored sorted (the engines sort by time anyway); the
+        # original strings are kept in the same order, so they line up
+        if originals is None:
+            minutes = array("i", sorted(minutes))
+        else:
+            pairs = sorted(zip(minutes, originals), key=lambda pair: pair[0])
+            minutes = array("i", (minute for minute, _ in pairs))
+            originals = [original for _, original in pairs]
+        meta = {
+            "name": name,
+            "schedules": schedules,
+            "expires": expires,
+            "recordedTimes": originals,
+            "recordsSorted": True
+        }
+
+        os.makedirs(DATASET_DIR, exist_ok=True)
+        write_punchlog(self._path(dataset_id, ".punches"), ((0, minute, 0) for minute in minutes))
+        with open(self._path(dataset_id, ".json"), "w") as f:
+            json.dump(meta, f)
+
+        dataset = Dataset(dataset_id, MinuteRecords(minutes, originals), schedules, name, expires)
+        self._remember(dataset)
+        self.sweep()
+        print(f"DATASETS: Stored {len(minutes)} punches as {dataset_id}")
+        return dataset
+
+    def get(self, dataset_id):
+        """Return the Dataset for an id, or None if it is unknown or expired."""
+        self.sweep()
+        with self._lock:
+            dataset = self._cache.get(dataset_id)
+            if dataset is not None:
+                self._cache.move_to_end(dataset_id)
+        if dataset is None:
+            dataset = self._load(dataset_id)
+            if dataset is not None:
+                self._remember(dataset)
+        if dataset is not None and dataset.expired:
+            self.delete(dataset_id)
+            return None
+        return dataset
+
+    def delete(self, dataset_id):
+        with self._lock:
+            self._cache.pop(dataset_id, None)
+        for suffix in (".punches", ".json"):
+            try:
+                os.remove(self._path(dataset_id, suffix))
+            except OSError:
+                pass
+
+    def sweep(self):
+        """Delete expired datasets (at most once per SWEEP_INTERVAL)."""
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+
+        with self._lock:
+            expired = [dataset_id for dataset_id, dataset in self._cache.items() if dataset.expired]
+        try:
+            names = os.listdir(DATASET_DIR)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(DATASET_DIR, name), "r") as f:
+                    if json.load(f).get("expires", 0) <= now:
+                        expired.append(name[:-len(".json")])
+            except (OSError, ValueError):
+                pass
+        for dataset_id in set(expired):
+            print("DATASETS: Expired", dataset_id)
+            self.delete(dataset_id)
+
+    def _remember(self, dataset):
+        with self._lock:
+            self._cache[dataset.dataset_id] = dataset
+            self._cache.move_to_end(dataset.dataset_id)
+            while len(self._cache) > DATASET_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _path(self, dataset_id, suffix):
+        return os.path.join(DATASET_DIR, dataset_id + suffix)
+
+    def _load(self, dataset_id):
+        if not dataset_id or not all(c in "0123456789abcdef" for c in dataset_id):
+            return None
+        try:
+            with open(self._path(dataset_id, ".json"), "r") as f:
+                meta = json.load(f)
+            recorded_times = meta.get("recordedTimes")
+            # (Datasets stored before recordsSorted keep their strings in upload order)
+            if recorded_times is None or meta.get("recordsSorted"):
+                with PunchLog(self._path(dataset_id, ".punches")) as log:
+                    # One copy of the column, nothing parsed
+                    minutes = array("i")
+                    with memoryview(log.minutes).cast("B") as column:
+                        minutes.frombytes(column)
+                recorded_times = MinuteRecords(minutes, recorded_times)
+        except (OSError, ValueError):
+            return None
+        return Dataset(dataset_id, recorded_times, meta.get("schedules"), meta.get("name"), meta.get("expires"))
+
@@ -0,0 +1,139 @@
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+
+# ----------------------------------------
+# Request deadlines and cooperative cancellation
+# ----------------------------------------
+# A Deadline is handed to execute_logic1/2/3 by the routes (or cancelled by
+# whoever owns the run). The engines' record loops, the schedule scoring
+# loop, the overnight pre-grouping and shift labeling check it every few
+# records and stop with DeadlineExceeded, which says how far the run got,
+# instead of burning CPU for a client that has already given up.
+#
+# The active deadline lives in a context variable, like the request metrics,
+# so the engine methods don't all need an extra argument. Deadlines pickle,
+# so groups labeled in worker processes stop at the same time; cancel()
+# only reaches the process it is called in.
+
+CHECK_INTERVAL = 1024  # records between deadline checks in the record loops
+
+_current = ContextVar("dtr_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """A run stopped by its deadline or by cancel(). Carries the phase and progress it reached."""
+
+    def __init__(self, phase, done=None, total=None, cancelled=False):
+        self.phase = phase
+        self.done = done
+        self.total = total
+        self.cancelled = cancelled
+        reason = "Cancelled" if cancelled else "Deadline exceeded"
+        progress = f" ({done} of {total} processed)" if done is not None and total is not None else ""
+        super().__init__(f"{reason} during {phase}{progress}.")
+
+    def __reduce__(self):
+        # Keep the fields when raised in a worker process
+        return DeadlineExceeded, (self.phase, self.done, self.total, self.cancelled)
+
+    def progress(self):
+        return {"phase": self.phase, "done": self.done, "total": self.total, "cancelled": self.cancelled}
+
+
+class Deadline:
+    def __init__(self, seconds=None):
+        # Wall clock, so the expiry means the same in worker processes
+        self.expires_at = time.time() + seconds if seconds is not None else None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def remaining(self):
+        """Seconds left (None without a time limit)."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.time())
+
+    @property
+    def expired(self):
+        return self.cancelled or (self.expires_at is not None and time.time() >= self.expires_at)
+
+    def check(self, phase, done=None, total=None):
+        """Raise DeadlineExceeded if the deadline has passed or the run was cancelled."""
+        if self.expired:
+            raise DeadlineExceeded(phase, done, total, cancelled=self.cancelled)
+
+
+def deadline_scope(deadline):
+    """Make deadline the active one inside the block (no change if it is None)."""
+    if deadline is None:
+        return nullcontext()
+    return _activate(deadline)
+
+
+@contextmanager
+def _activate(deadline):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline():
+    return _current.get()
+
+
+def check_deadline(phase, done=None, total=None):
+    """Check the active deadline, if any."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check(phase, done, total)
+
+
+def checked(iterable, phase, every=CHECK_INTERVAL):
+    """
+    Iterate, checking the active deadline every `every` items. Without an
+    active deadline the iterable is returned as-is, so unbounded runs pay
+    nothing for it.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return iterable
+    return _checked(iterable, phase, every, deadline)
+
+
+def _checked(iterable, phase, every, deadline):
+    total = len(iterable) if hasattr(iterable, "__len__") else None
+    for i, item in enumerate(iterable):
+        if i % every == 0:
+            deadline.check(phase, i, total)
+        yield item
+
+
+def stepwise(iterator, deadline, phase="streaming", every=CHECK_INTERVAL):
+    """
+    Run a generator with deadline active while each item is produced, and
+    check it every `every` items. A streamed response is resumed after the
+    request has returned, so a deadline_scope around it would not hold.
+    """
+    if deadline is None:
+        return iterator
+    return _stepwise(iter(iterator), deadline, phase, every)
+
+
+def _stepwise(iterator, deadline, phase, every):
+    produced = 0
+    while True:
+        if produced % every == 0:
+            deadline.check(phase, produced)
+        with deadline_scope(deadline):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        produced += 1
+        yield item
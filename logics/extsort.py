@@ -0,0 +1,239 @@
+import heapq
+import json
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+
+from .punchlog import (FLAG_BIG_ENDIAN, HEADER, MAGIC, VERSION, format_record, minute_to_datetime,
+                       parse_record_minute)
+
+
+# ----------------------------------------
+# External-memory sort for large punch exports
+# ----------------------------------------
+# Terminal exports can be several GB and are not always in time order, so
+# they can't be loaded into a list and .sort()ed like the engines do. Punches
+# are read as epoch minutes, sorted in runs that fit the memory budget,
+# spilled to temporary files as raw int32 arrays and k-way merged back into
+# one time-ordered stream, at most DTR_SORT_FAN_IN runs at a time (in
+# several passes for very large exports). Peak memory and open files are
+# bounded by the budget and the fan-in, not by the size of the export.
+#
+#     for labeled in iter_labels(iter_sorted_punches("export.txt"), schedules):
+#         ...
+
+SORT_MEMORY_BUDGET = int(os.environ.get("DTR_SORT_MEMORY_MB", "64")) * 1024 * 1024
+BYTES_PER_RECORD = 48  # int object + list slot while a run is sorted, plus the array copies
+MIN_READ_BLOCK = 1024  # records read at a time from each run while merging
+MAX_MERGE_FAN_IN = int(os.environ.get("DTR_SORT_FAN_IN", "64"))  # runs open at once while merging
+ITEMSIZE = array("i").itemsize
+
+
+def iter_punch_file(path):
+    """
+    Yield epoch minutes from a text export with one punch per line.
+    Lines may be plain record strings, JSON strings or labeled record
+    objects ({"record": ..., "label": ...}, as in an NDJSON stream), and a
+    trailing comma is tolerated; blank lines are skipped.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip().rstrip(",")
+            if not line:
+                continue
+            try:
+                record = line
+                if line.startswith(('"', '{')):
+                    record = json.loads(line)
+                    if isinstance(record, dict):
+                        record = record.get("record", "")
+                minute = parse_record_minute(record)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid record on line {line_no}: {line}")
+            yield minute
+
+
+def _run_size(memory_budget):
+    return max(MIN_READ_BLOCK, memory_budget // BYTES_PER_RECORD)
+
+
+def spill_sorted_runs(minutes, run_size, run_dir):
+    """
+    Sort `minutes` in chunks of run_size and write each chunk to run_dir.
+    Returns (run_paths, count). If everything fits in one run, nothing is
+    written and the sorted array is returned in place of the path list.
+    """
+    run_paths = []
+    count = 0
+    buffer = array("i")
+
+    for minute in minutes:
+        buffer.append(minute)
+        if len(buffer) >= run_size:
+            run_paths.append(_write_run(sorted(buffer), run_dir, len(run_paths)))
+            count += len(buffer)
+            buffer = array("i")
+
+    count += len(buffer)
+    if not run_paths:
+        return array("i", sorted(buffer)), count
+    if buffer:
+        run_paths.append(_write_run(sorted(buffer), run_dir, len(run_paths)))
+    return run_paths, count
+
+
+def _write_run(sorted_minutes, run_dir, index):
+    path = os.path.join(run_dir, f"run-{index:05d}.bin")
+    with open(path, "wb") as f:
+        array("i", sorted_minutes).tofile(f)
+    return path
+
+
+def _iter_run(path, block_size):
+    """Yield the minutes of one run file, reading block_size at a time."""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(block_size * ITEMSIZE)
+            if not data:
+                return
+            block = array("i")
+            block.frombytes(data)
+            yield from block
+
+
+def _write_merged(paths, path, block_size):
+    """Merge run files into one run file at path, then remove them."""
+    block = array("i")
+    with open(path, "wb") as f:
+        for minute in heapq.merge(*(_iter_run(run, block_size) for run in paths)):
+            block.append(minute)
+            if len(block) >= block_size:
+                block.tofile(f)
+                block = array("i")
+        block.tofile(f)
+    for run in paths:
+        os.remove(run)
+    return path
+
+
+def _merge_runs(runs, memory_budget):
+    """
+    Return an iterator over the merged runs (or the in-memory array). At
+    most MAX_MERGE_FAN_IN runs are open at once: with more, groups of runs
+    are merged into intermediate run files first, pass by pass, so open
+    files and read buffers don't grow with the input.
+    """
+    if isinstance(runs, array):
+        return iter(runs)
+    fan_in = max(2, MAX_MERGE_FAN_IN)
+    # Split the budget between the read buffers of the open runs (and one write buffer)
+    block_size = max(MIN_READ_BLOCK, memory_budget // ITEMSIZE // (min(len(runs), fan_in) + 1))
+
+    run_dir = os.path.dirname(runs[0])
+    merge_pass = 0
+    while len(runs) > fan_in:
+        merge_pass += 1
+        runs = [_write_merged(runs[i:i + fan_in], os.path.join(run_dir, f"merge-{merge_pass}-{i // fan_in:05d}.bin"),
+                              block_size)
+                for i in range(0, len(runs), fan_in)]
+    return heapq.merge(*(_iter_run(path, block_size) for path in runs))
+
+
+def external_sort(minutes, memory_budget=None, tmpdir=None):
+    """
+    Sort an iterable of epoch minutes within memory_budget bytes and yield
+    them in order. Inputs that fit the budget are sorted in memory; larger
+    ones are spilled to sorted runs under tmpdir and merged.
+    """
+    if memory_budget is None:
+        memory_budget = SORT_MEMORY_BUDGET
+
+    run_dir = tempfile.mkdtemp(prefix="dtr-sort-", dir=tmpdir)
+    try:
+        runs, _ = spill_sorted_runs(minutes, _run_size(memory_budget), run_dir)
+        yield from _merge_runs(runs, memory_budget)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def iter_sorted_punches(path, memory_budget=None, tmpdir=None):
+    """Yield the punches of a text export as datetimes, in time order."""
+    for minute in external_sort(iter_punch_file(path), memory_budget, tmpdir):
+        yield minute_to_datetime(minute)
+
+
+def iter_sorted_records(path, memory_budget=None, tmpdir=None):
+    """Yield the punches of a text export as record strings, in time order."""
+    for dt in iter_sorted_punches(path, memory_budget, tmpdir):
+        yield format_record(dt)
+
+
+def sort_punch_file(source, target, memory_budget=None, tmpdir=None, fmt="text", employee_id=0):
+    """
+    Sort a text export into target, either as one record string per line
+    (fmt="text") or as a binary punch log (fmt="punchlog").
+    Returns the number of punches written.
+    """
+    if memory_budget is None:
+        memory_budget = SORT_MEMORY_BUDGET
+
+    if fmt == "text":
+        written = 0
+        with open(target, "w", encoding="utf-8") as f:
+            for record in iter_sorted_records(source, memory_budget, tmpdir):
+                f.write(record + "\n")
+                written += 1
+        return written
+
+    if fmt != "punchlog":
+        raise ValueError(f"Unknown output format: {fmt}")
+
+    # The punch log header needs the count up front, so write the columns
+    # once the runs are spilled and the count is known
+    run_dir = tempfile.mkdtemp(prefix="dtr-sort-", dir=tmpdir)
+    try:
+        runs, count = spill_sorted_runs(iter_punch_file(source), _run_size(memory_budget), run_dir)
+        merged = _merge_runs(runs, memory_budget)
+
+        flags = FLAG_BIG_ENDIAN if sys.byteorder == "big" else 0
+        with open(target, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, flags, count))
+            _write_repeated(f, "I", employee_id, count)
+            block = array("i")
+            for minute in merged:
+                block.append(minute)
+                if len(block) >= MIN_READ_BLOCK:
+                    block.tofile(f)
+                    block = array("i")
+            block.tofile(f)
+            _write_repeated(f, "B", 0, count)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+    return count
+
+
+def _write_repeated(f, typecode, value, count):
+    """Write count copies of value as a typed column without building it in memory."""
+    block = array(typecode, [value]) * MIN_READ_BLOCK
+    for _ in range(count // MIN_READ_BLOCK):
+        block.tofile(f)
+    array(typecode, [value] * (count % MIN_READ_BLOCK)).tofile(f)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sort a large punch export within a fixed memory budget.")
+    parser.add_argument("source", help="text export, one record per line")
+    parser.add_argument("target")
+    parser.add_argument("--format", choices=("text", "punchlog"), default="text")
+    parser.add_argument("--memory-mb", type=int, default=SORT_MEMORY_BUDGET // (1024 * 1024))
+    parser.add_argument("--tmpdir", default=None)
+    parser.add_argument("--employee-id", type=int, default=0)
+
+    args = parser.parse_args()
+    written = sort_punch_file(args.source, args.target, memory_budget=args.memory_mb * 1024 * 1024,
+                              tmpdir=args.tmpdir, fmt=args.format, employee_id=args.employee_id)
+    print(f"EXTSORT: Wrote {written} punches to {args.target}")
@@ -1,4 +1,12 @@
 from datetime import datetime, timedelta
+import heapq
+from functools import partial
+from .deadline import checked, current_deadline, deadline_scope, stepwise
+from .metrics import count, counting, stage
+from .parallel import map_groups
+from .partition import label_partitioned
+from .punchlog import MinuteRecords, ParsedRecord
+from .window import parse_window, select_window_records, filter_labeled_result, in_window
 
 
 class TimeScheduleManager:
@@ -33,8 +41,15 @@ class TimeScheduleManager:
         Parse a record string in either format:
         - "DD/MM/YYYY - HH:MM AM/PM" (old format)
         - "Day - DD/MM/YYYY - HH:MM AM/PM" (new format)
-        Returns a datetime object.
+        Returns a datetime object. Datetimes (compact requests, see
+        logics/compact.py) are returned unchanged.
         """
+        if isinstance(record_str, datetime):
+            return record_str
+        if isinstance(record_str, ParsedRecord):
+            # Parsed when its dataset was stored (logics/datasets.py)
+            return record_str.dt
+
         # Check which format we're dealing with
         parts = record_str.split(" - ")
 
@@ -70,29 +85,12 @@ class TimeScheduleManager:
             print(f"Invalid day name: {day_name}, defaulting to Monday")
             return 0  # Monday
 
-    # ----------------------------------------
-    # 2) Main processing logic
-    # ----------------------------------------
-    def process_recorded_times(self, recorded_times, schedule):
+    def compile_schedule(self, schedule):
         """
-        Process recorded times using the provided schedule.
-        
-        Input Formats:
-        recorded_times: List from recordedTimes array containing strings like:
-            "Day - DD/MM/YYYY - HH:MM AM/PM"
-        
-        schedule: Dictionary containing:
-            {
-                "start_day": "Day",    # Full weekday name
-                "start_time": "HH:MM AM/PM",
-                "end_day": "Day",      # Full weekday name
-                "end_time": "HH:MM AM/PM"
-            }
+        Resolve defaults for a schedule and parse it into the values used by
+        grouping and labeling: start/end hours (end adjusted for multi-day
+        shifts), day indices, day difference and shift duration.
         """
-        # Update input handling for new format
-        if isinstance(recorded_times, dict):
-            recorded_times = recorded_times.get("recordedTimes", [])
-        
         if isinstance(schedule, dict) and "schedules" in schedule:
             schedule = schedule["schedules"][0] if schedule["schedules"] else None
         
@@ -137,199 +135,216 @@ class TimeScheduleManager:
 
         shift_duration = end_h - start_h
 
-        # Define thresholds
-        early_threshold = 3.0  # hours before start time
-        grace_period = 0.25  # 15 minutes (in hours)
-        late_threshold = 2.0  # hours after start time
-        early_out_threshold = 1.0  # hour before end time
+        return {
+            "start_h": start_h,
+            "end_h": end_h,
+            "start_day_idx": start_day_idx,
+            "end_day_idx": end_day_idx,
+            "day_diff": day_diff,
+            "is_multi_day": is_multi_day,
+            "shift_duration": shift_duration
+        }
+
+    def is_shift_boundary(self, prev_dt, curr_dt, compiled):
+        """
+        True if curr_dt starts a new shift after prev_dt under a compiled schedule.
+        A new shift starts on a later date when the current record is near the
+        shift start or the previous record is near the shift end.
+        """
+        date_diff = (curr_dt.date() - prev_dt.date()).days
+        if date_diff <= 0:
+            return False
+
+        curr_time = curr_dt.hour + curr_dt.minute / 60.0
+        prev_time = prev_dt.hour + prev_dt.minute / 60.0
+
+        # Check if current record is within 2 hours of shift start
+        is_near_start = abs(curr_time - compiled["start_h"]) < 2.0
+
+        # Check if previous record is within 2 hours of shift end
+        is_prev_near_end = abs(prev_time - (compiled["end_h"] % 24)) < 2.0
+
+        return is_near_start or is_prev_near_end
+
+    # ----------------------------------------
+    # 2) Main processing logic
+    # ----------------------------------------
+    def process_recorded_times(self, recorded_times, schedule):
+        """
+        Process recorded times using the provided schedule.
+        
+        Input Formats:
+        recorded_times: List from recordedTimes array containing strings like:
+            "Day - DD/MM/YYYY - HH:MM AM/PM"
+        
+        schedule: Dictionary containing:
+            {
+                "start_day": "Day",    # Full weekday name
+                "start_time": "HH:MM AM/PM",
+                "end_day": "Day",      # Full weekday name
+                "end_time": "HH:MM AM/PM"
+            }
+        """
+        labeled_results = []
+
+        with stage("group"):
+            for shift_labels in self.iter_shift_labels(recorded_times, schedule):
+                labeled_results.extend(labeled for _, labeled in shift_labels)
+
+        return {"labeledRecords": labeled_results}
+
+    def iter_shift_labels(self, recorded_times, schedule):
+        """
+        Generator behind process_recorded_times: parses and sorts the records,
+        then yields each shift's labels as soon as the shift is closed, as a
+        chronological list of (datetime, labeled_record) pairs. Shifts are
+        yielded in order, so the concatenation is sorted by time.
+        """
+        # Update input handling for new format
+        if isinstance(recorded_times, dict):
+            recorded_times = recorded_times.get("recordedTimes", [])
+        
+        # 1) Parse schedule times
+        compiled = self.compile_schedule(schedule)
 
         # 2) Parse and sort records
-        recs = []
-        for orig in recorded_times:
-            dt = self.parse_record_datetime(orig)
-
-            # Extract day of week (as index 0-6)
-            day_idx = dt.weekday()  # 0 = Monday, 6 = Sunday
-
-            # Calculate normalized time for comparison with schedule
-            # Base time is the hour and minute of the day as a float
-            rec_time = dt.hour + dt.minute / 60.0
-
-            # Extract original day from the record if it's in the new format
-            orig_day = None
-            if " - " in orig and len(orig.split(" - ")) == 3:
-                orig_day = orig.split(" - ")[0]
-
-            # Calculate day offset from start day
-            day_offset = (day_idx - start_day_idx) % 7
-
-            # Normalize time for comparison (add 24h for each day after start day)
-            normalized_time = rec_time + 24.0 * day_offset
-
-            # Check if this time is a valid start time
-            start_diff = normalized_time - start_h
-            is_valid_start = -early_threshold <= start_diff <= late_threshold
-
-            # Check if this time is a valid end time
-            end_diff = normalized_time - end_h
-            is_valid_end = -early_out_threshold <= end_diff <= 0
-
-            recs.append({
-                "dt": dt,
-                "orig": orig,
-                "time_h": rec_time,
-                "orig_day": orig_day,
-                "day_idx": day_idx,
-                "normalized_time": normalized_time,
-                "is_valid_start": is_valid_start,
-                "is_valid_end": is_valid_end
-            })
+        with stage("parse"):
+            recs = [self.prepare_record(orig, self.parse_record_datetime(orig), compiled)
+                    for orig in checked(recorded_times, "parsing")]
+        if counting():
+            # Records from group_records_by_schedule() come parsed (ParsedRecords)
+            count("records_parsed", sum(1 for orig in recorded_times if not isinstance(orig, ParsedRecord)))
 
         if not recs:
-            return {"labeledRecords": []}
+            return
 
         # Sort records chronologically
-        recs.sort(key=lambda x: x["dt"])
+        with stage("sort"):
+            recs.sort(key=lambda x: x["dt"])
+        count("sorts")
 
         # 3) Group records into logical shifts (including multi-day shifts)
-        shifts = []
-        current_shift = []
-
-        # Add the first record to start the first shift
-        if recs:
-            current_shift.append(recs[0])
+        # and 4) label each shift as soon as the next one starts
+        current_shift = [recs[0]]
 
         # Process remaining records
-        for i in range(1, len(recs)):
+        for i in checked(range(1, len(recs)), "shift labeling"):
             prev_rec = recs[i - 1]
             curr_rec = recs[i]
 
-            # Calculate time difference between consecutive records
-            time_diff = (curr_rec["dt"] - prev_rec["dt"]).total_seconds() / 3600
-            date_diff = (curr_rec["dt"].date() - prev_rec["dt"].date()).days
-
             # Check if this should be a new shift
-            start_new_shift = False
-            
-            # If it's a different date AND the current record's time is close to the start time
-            # OR if the previous record's time is close to the end time
-            if date_diff > 0:
-                curr_time = curr_rec["time_h"]
-                prev_time = prev_rec["time_h"]
-                
-                # Check if current record is within 2 hours of shift start
-                is_near_start = abs(curr_time - start_h) < 2.0
-                
-                # Check if previous record is within 2 hours of shift end
-                is_prev_near_end = abs(prev_time - (end_h % 24)) < 2.0
-                
-                # Start a new shift if the current record is near the start time
-                # or if the previous record is near the end time
-                if is_near_start or is_prev_near_end:
-                    start_new_shift = True
-            
-            # If it should be a new shift
-            if start_new_shift:
+            if self.is_shift_boundary(prev_rec["dt"], curr_rec["dt"], compiled):
                 # Finalize current shift and start a new one
-                if current_shift:
-                    shifts.append(current_shift)
+                yield self._timed_shift_labels(current_shift)
                 current_shift = [curr_rec]
             else:
                 # Add to current shift
                 current_shift.append(curr_rec)
 
-        # Add the last shift if it exists
-        if current_shift:
-            shifts.append(current_shift)
+        # Label the last shift
+        yield self._timed_shift_labels(current_shift)
 
-        # 4) Process each shift's records
-        labeled_results = []
+    def _timed_shift_labels(self, shift_recs):
+        """_label_shift() for a closed shift, counted and timed for the request metrics."""
+        count("shifts")
+        with stage("label"):
+            return self._label_shift(shift_recs)
 
-        for shift_recs in shifts:
-            num_records = len(shift_recs)
+    def prepare_record(self, orig, dt, compiled):
+        """
+        Build the per-record data the shift labeler needs for one record
+        (orig is the record string, dt its parsed datetime).
+        """
+        start_h = compiled["start_h"]
+        end_h = compiled["end_h"]
+        start_day_idx = compiled["start_day_idx"]
 
-            if num_records == 1:
-                # Single record - classify based on time proximity
-                rec = shift_recs[0]
-                weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
+        # Define thresholds
+        early_threshold = 3.0  # hours before start time
+        late_threshold = 2.0  # hours after start time
+        early_out_threshold = 1.0  # hour before end time
 
-                if rec["is_valid_end"]:
-                    label = "Time Out"
-                else:
-                    label = "Time In"
+        # Extract day of week (as index 0-6)
+        day_idx = dt.weekday()  # 0 = Monday, 6 = Sunday
+
+        # Calculate normalized time for comparison with schedule
+        # Base time is the hour and minute of the day as a float
+        rec_time = dt.hour + dt.minute / 60.0
+
+        # Extract original day from the record if it's in the new format
+        orig_day = None
+        if isinstance(orig, datetime):
+            # Compact/MessagePack punches label like new format record strings
+            orig_day = dt.strftime('%A')
+        elif " - " in orig and len(orig.split(" - ")) == 3:
+            orig_day = orig.split(" - ")[0]
+
+        # Calculate day offset from start day
+        day_offset = (day_idx - start_day_idx) % 7
+
+        # Normalize time for comparison (add 24h for each day after start day)
+        normalized_time = rec_time + 24.0 * day_offset
+
+        # Check if this time is a valid start time
+        start_diff = normalized_time - start_h
+        is_valid_start = -early_threshold <= start_diff <= late_threshold
+
+        # Check if this time is a valid end time
+        end_diff = normalized_time - end_h
+        is_valid_end = -early_out_threshold <= end_diff <= 0
+
+        return {
+            "dt": dt,
+            "orig": orig,
+            "time_h": rec_time,
+            "orig_day": orig_day,
+            "day_idx": day_idx,
+            "normalized_time": normalized_time,
+            "is_valid_start": is_valid_start,
+            "is_valid_end": is_valid_end
+        }
 
-                labeled_results.append({
-                    "record": rec["orig"],
-                    "weekday": weekday,
-                    "label": label
-                })
+    def _label_shift(self, shift_recs):
+        """
+        Label one shift's records (already in chronological order).
+        Returns a list of (datetime, labeled_record) pairs in the same order.
+        """
+        labeled_results = []
 
-            elif num_records == 2:
-                # Two records - Time In and Time Out
-                rec1, rec2 = shift_recs
+        def emit(rec, label):
+            weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
+            labeled_results.append((rec["dt"], {
+                "record": rec["orig"],
+                "weekday": weekday,
+                "label": label
+            }))
 
-                weekday1 = rec1["orig_day"] if rec1["orig_day"] else self.format_date_with_day(rec1["dt"])
-                weekday2 = rec2["orig_day"] if rec2["orig_day"] else self.format_date_with_day(rec2["dt"])
+        num_records = len(shift_recs)
 
-                labeled_results.append({
-                    "record": rec1["orig"],
-                    "weekday": weekday1,
-                    "label": "Time In"
-                })
+        if num_records == 1:
+            # Single record - classify based on time proximity
+            rec = shift_recs[0]
+            emit(rec, "Time Out" if rec["is_valid_end"] else "Time In")
 
-                labeled_results.append({
-                    "record": rec2["orig"],
-                    "weekday": weekday2,
-                    "label": "Time Out"
-                })
+        elif num_records == 2:
+            # Two records - Time In and Time Out
+            emit(shift_recs[0], "Time In")
+            emit(shift_recs[1], "Time Out")
 
-            else:
-                # More than 2 records - first is Time In, last is Time Out,
-                # intermediate records alternate between Break Out and Break In
-                # (Break Out means leaving for break, Break In means returning from break)
-
-                # Process first record (Time In)
-                first_rec = shift_recs[0]
-                first_weekday = first_rec["orig_day"] if first_rec["orig_day"] else self.format_date_with_day(
-                    first_rec["dt"])
-
-                labeled_results.append({
-                    "record": first_rec["orig"],
-                    "weekday": first_weekday,
-                    "label": "Time In"
-                })
-
-                # Process intermediate records (Break Out, Break In, Break Out, ...)
-                # CORRECTED: First intermediate is Break Out (leaving for break)
-                for i in range(1, num_records - 1):
-                    rec = shift_recs[i]
-                    weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
-
-                    # FIXED: Odd indices are Break Out, even indices are Break In
-                    # First intermediate (i=1) should be Break Out (leaving work for break)
-                    label = "Break Out" if i % 2 == 1 else "Break In"
-
-                    labeled_results.append({
-                        "record": rec["orig"],
-                        "weekday": weekday,
-                        "label": label
-                    })
-
-                # Process last record (Time Out)
-                last_rec = shift_recs[num_records - 1]
-                last_weekday = last_rec["orig_day"] if last_rec["orig_day"] else self.format_date_with_day(
-                    last_rec["dt"])
-
-                labeled_results.append({
-                    "record": last_rec["orig"],
-                    "weekday": last_weekday,
-                    "label": "Time Out"
-                })
-
-        # Sort results by original timestamp order
-        labeled_results.sort(key=lambda x: self.parse_record_datetime(x["record"]))
+        else:
+            # More than 2 records - first is Time In, last is Time Out,
+            # intermediate records alternate between Break Out and Break In
+            # (Break Out means leaving for break, Break In means returning from break)
+            emit(shift_recs[0], "Time In")
 
-        return {"labeledRecords": labeled_results}
+            # Odd indices are Break Out, even indices are Break In
+            # First intermediate (i=1) should be Break Out (leaving work for break)
+            for i in range(1, num_records - 1):
+                emit(shift_recs[i], "Break Out" if i % 2 == 1 else "Break In")
+
+            emit(shift_recs[num_records - 1], "Time Out")
+
+        return labeled_results
 
     def find_applicable_schedule(self, dt, schedules):
         """
@@ -351,7 +366,8 @@ class TimeScheduleManager:
         dt_day_idx = dt.weekday()
         dt_time = dt.hour + dt.minute / 60.0
 
-        for schedule in schedules:
+        # Stop at the first match; the schedules checked are counted
+        for position, schedule in enumerate(schedules, 1):
             # Get indices for schedule days
             start_day_idx = self.get_day_index(schedule.get("start_day", "Monday"))
             end_day_idx = self.get_day_index(schedule.get("end_day", schedule.get("start_day", "Monday")))
@@ -378,35 +394,77 @@ class TimeScheduleManager:
             # Case 1: Same day schedule
             if not is_multi_day and dt_day_idx == start_day_idx:
                 if start_h <= dt_time <= end_h:
-                    return schedule
+                    break
 
             # Case 2: Multi-day schedule
             else:
                 # Check if dt is on start day after start time
                 if dt_day_idx == start_day_idx and dt_time >= start_h:
-                    return schedule
+                    break
 
                 # Check if dt is on end day before end time
                 if dt_day_idx == end_day_idx and dt_time <= end_h:
-                    return schedule
+                    break
 
                 # Check if dt is on a day between start and end day
                 if day_diff > 1:
                     days_between = [(start_day_idx + d) % 7 for d in range(1, day_diff)]
                     if dt_day_idx in days_between:
-                        return schedule
+                        break
+        else:
+            # No matching schedule found
+            count("schedule_comparisons", len(schedules))
+            return None
 
-        # No matching schedule found
-        return None
+        count("schedule_comparisons", position)
+        return schedule
 
-    def process_recorded_times_with_schedules(self, recorded_times, schedules):
+    def get_schedule_key(self, schedule):
+        """Build the key used to group records that share a schedule."""
+        return (
+            f"{schedule.get('start_day', 'Monday')}_"
+            f"{schedule.get('start_time', '8:00 AM')}_"
+            f"{schedule.get('end_day', schedule.get('start_day', 'Monday'))}_"
+            f"{schedule.get('end_time', '5:00 PM')}"
+        )
+
+    def get_schedule_group(self, dt, schedules):
         """
-        Process recorded times using multiple schedules.
-        Groups records by applicable schedule and processes each group.
+        Pick the schedule group a record belongs to.
+        Returns (schedule_key, schedule), or (None, None) if no schedule applies.
         """
-        if not recorded_times:
-            return {"labeledRecords": []}
+        # Registered schedule sets (logics/registry.py) carry a week table
+        if hasattr(schedules, "lookup_group"):
+            count("week_table_lookups")
+            return schedules.lookup_group(self, dt)
+
+        applicable_schedule = self.find_applicable_schedule(dt, schedules)
+
+        if applicable_schedule:
+            return self.get_schedule_key(applicable_schedule), applicable_schedule
 
+        # Handle records with no matching schedule
+        # Use the schedule for the day of the week this record falls on
+        record_day = dt.strftime('%A')
+        matching_schedule = None
+
+        for schedule in schedules:
+            if schedule.get("start_day") == record_day:
+                matching_schedule = schedule
+                break
+
+        if not matching_schedule and schedules:
+            matching_schedule = schedules[0]  # Default to first schedule
+
+        if matching_schedule:
+            return self.get_schedule_key(matching_schedule), matching_schedule
+        return None, None
+
+    def group_records_by_schedule(self, recorded_times, schedules):
+        """
+        Split records into schedule groups.
+        Returns a list of (records, schedule) pairs in first-seen order.
+        """
         # Ensure we have valid schedules with default values
         if not schedules or not isinstance(schedules, list) or len(schedules) == 0:
             # Default schedule if none provided
@@ -418,88 +476,155 @@ class TimeScheduleManager:
             }]
 
         # Parse all record datetimes
-        parsed_records = [(rec, self.parse_record_datetime(rec)) for rec in recorded_times]
+        with stage("parse"):
+            parsed_records = [(rec, self.parse_record_datetime(rec)) for rec in checked(recorded_times, "parsing")]
+        count("records_parsed", len(parsed_records))
 
         # Group records by applicable schedule
         schedule_groups = {}
 
-        for rec, dt in parsed_records:
-            applicable_schedule = self.find_applicable_schedule(dt, schedules)
-
-            if applicable_schedule:
-                # Create a key from the schedule to group records
-                schedule_key = (
-                    f"{applicable_schedule.get('start_day', 'Monday')}_"
-                    f"{applicable_schedule.get('start_time', '8:00 AM')}_"
-                    f"{applicable_schedule.get('end_day', applicable_schedule.get('start_day', 'Monday'))}_"
-                    f"{applicable_schedule.get('end_time', '5:00 PM')}"
-                )
+        with stage("match"):
+            for rec, dt in checked(parsed_records, "schedule matching"):
+                schedule_key, matching_schedule = self.get_schedule_group(dt, schedules)
+                if schedule_key is None:
+                    continue
 
                 if schedule_key not in schedule_groups:
                     schedule_groups[schedule_key] = {
-                        "schedule": applicable_schedule,
+                        "schedule": matching_schedule,
                         "records": []
                     }
 
+                # The parsed datetime goes along, so the group doesn't parse the record again
+                if not isinstance(rec, (datetime, ParsedRecord)):
+                    rec = ParsedRecord(rec, dt)
                 schedule_groups[schedule_key]["records"].append(rec)
-            else:
-                # Handle records with no matching schedule
-                # Use the schedule for the day of the week this record falls on
-                record_day = dt.strftime('%A')
-                matching_schedule = None
-
-                for schedule in schedules:
-                    if schedule.get("start_day") == record_day:
-                        matching_schedule = schedule
-                        break
 
-                if not matching_schedule and schedules:
-                    matching_schedule = schedules[0]  # Default to first schedule
+        return [(group_data["records"], group_data["schedule"]) for group_data in schedule_groups.values()]
+
+    def iter_labeled_records_with_schedules(self, recorded_times, schedules):
+        """
+        Streaming counterpart of process_recorded_times_with_schedules.
+        Yields labeled records in time order, merging the schedule groups'
+        shift-by-shift output instead of collecting and sorting everything.
+        """
+        if not recorded_times:
+            return
 
-                if matching_schedule:
-                    schedule_key = (
-                        f"{matching_schedule.get('start_day', 'Monday')}_"
-                        f"{matching_schedule.get('start_time', '8:00 AM')}_"
-                        f"{matching_schedule.get('end_day', matching_schedule.get('start_day', 'Monday'))}_"
-                        f"{matching_schedule.get('end_time', '5:00 PM')}"
-                    )
+        streams = [
+            self._iter_group_labels(records, schedule)
+            for records, schedule in self.group_records_by_schedule(recorded_times, schedules)
+        ]
+        for _, labeled in heapq.merge(*streams, key=lambda x: x[0]):
+            yield labeled
 
-                    if schedule_key not in schedule_groups:
-                        schedule_groups[schedule_key] = {
-                            "schedule": matching_schedule,
-                            "records": []
-                        }
+    def _iter_group_labels(self, records, schedule):
+        for shift_labels in self.iter_shift_labels(records, schedule):
+            yield from shift_labels
 
-                    schedule_groups[schedule_key]["records"].append(rec)
+    def process_recorded_times_with_schedules(self, recorded_times, schedules):
+        """
+        Process recorded times using multiple schedules.
+        Groups records by applicable schedule and processes each group.
+        """
+        if not recorded_times:
+            return {"labeledRecords": []}
 
         # Process each group with its applicable schedule
+        # Groups are independent, so large ones are labeled in worker processes
+        groups = self.group_records_by_schedule(recorded_times, schedules)
         all_labeled_records = []
 
-        for group_data in schedule_groups.values():
-            result = self.process_recorded_times(group_data["records"], group_data["schedule"])
-            all_labeled_records.extend(result["labeledRecords"])
+        # Time spent waiting on worker processes counts as labeling
+        with stage("label"):
+            label_group = partial(_label_schedule_group, deadline=current_deadline())
+            for labeled_records in map_groups(label_group, groups):
+                all_labeled_records.extend(labeled_records)
 
-        # Sort all results by timestamp
-        all_labeled_records.sort(key=lambda x: self.parse_record_datetime(x["record"]))
+        # Sort all results by timestamp (the records carry their datetimes, see group_records_by_schedule())
+        with stage("sort"):
+            all_labeled_records.sort(key=lambda x: self.parse_record_datetime(x["record"]))
+        count("sorts")
 
         return {"labeledRecords": all_labeled_records}
 
 
+def _label_schedule_group(records, schedule, deadline=None):
+    """Label one schedule group. Module level so worker processes can run it."""
+    with deadline_scope(deadline):
+        return TimeScheduleManager().process_recorded_times(records, schedule)["labeledRecords"]
+
+
 # For convenience, expose the process functions
-def execute_logic1(recorded_times, schedule_or_schedules):
+def execute_logic1(recorded_times, schedule_or_schedules, window=None, deadline=None):
     """
     Wrapper function that maintains compatibility with the original logic1 checkbox.
     This function can handle both a single schedule or a list of schedules.
+    An optional window ({"start": date, "end": date}) limits labeling to those dates.
+    A deadline (logics/deadline.py) stops the run with DeadlineExceeded once it passes.
+    """
+    with deadline_scope(deadline):
+        manager = TimeScheduleManager()
+
+        # Restrict to the window (plus padding up to the nearest shift boundaries)
+        window = parse_window(window)
+        if window:
+            recorded_times = select_window_records(recorded_times, window, schedule_or_schedules, manager)
+
+        # Long histories are labeled in date partitions on the worker pool (logics/partition.py)
+        labeled_records = label_partitioned(TimeScheduleManager, "_label_shift", recorded_times, schedule_or_schedules)
+        if labeled_records is not None:
+            result = {"labeledRecords": labeled_records}
+        # Stored datasets: label the sorted epoch-minute column as it is
+        elif isinstance(recorded_times, MinuteRecords):
+            from .stream import label_minutes  # stream imports this module
+
+            result = {"labeledRecords": label_minutes(recorded_times.minutes, schedule_or_schedules, "logic1",
+                                                      recorded_times.originals)}
+        # Check if we have a list of schedules or a single schedule
+        elif isinstance(schedule_or_schedules, list):
+            # If we have a list of schedules, use the multi-schedule function
+            result = manager.process_recorded_times_with_schedules(recorded_times, schedule_or_schedules)
+        else:
+            # If we have a single schedule, use the original function
+            result = manager.process_recorded_times(recorded_times, schedule_or_schedules)
+
+        # Only emit labels dated inside the window
+        if window:
+            result = filter_labeled_result(result, window)
+        return result
+
+
+def iter_logic1(recorded_times, schedule_or_schedules, window=None, deadline=None):
     """
+    Streaming version of execute_logic1: yields labeled records in time order,
+    shift by shift, so callers can send them on before the run has finished.
+    The deadline is checked while the records are produced, as in execute_logic1.
+    """
+    return stepwise(_iter_logic1(recorded_times, schedule_or_schedules, window), deadline)
+
+
+def _iter_logic1(recorded_times, schedule_or_schedules, window):
     manager = TimeScheduleManager()
 
-    # Check if we have a list of schedules or a single schedule
+    window = parse_window(window)
+    if window:
+        recorded_times = select_window_records(recorded_times, window, schedule_or_schedules, manager)
+
     if isinstance(schedule_or_schedules, list):
-        # If we have a list of schedules, use the multi-schedule function
-        return manager.process_recorded_times_with_schedules(recorded_times, schedule_or_schedules)
+        labeled_records = manager.iter_labeled_records_with_schedules(recorded_times, schedule_or_schedules)
     else:
-        # If we have a single schedule, use the original function
-        return manager.process_recorded_times(recorded_times, schedule_or_schedules)
+        labeled_records = (
+            labeled
+            for shift_labels in manager.iter_shift_labels(recorded_times, schedule_or_schedules)
+            for _, labeled in shift_labels
+        )
+
+    for labeled in labeled_records:
+        # Only emit labels dated inside the window
+        if window and not in_window(labeled, window):
+            continue
+        yield labeled
 
 
 # Still provide direct access to the individual functions if needed
@@ -1,5 +1,13 @@
 from datetime import datetime, timedelta
 import copy
+import heapq
+from functools import partial
+from .deadline import checked, current_deadline, deadline_scope, stepwise
+from .metrics import count, counting, stage
+from .parallel import map_groups
+from .partition import label_partitioned
+from .punchlog import MinuteRecords, ParsedRecord
+from .window import parse_window, select_window_records, filter_labeled_result, in_window
 
 
 class OvertimeScheduleManager:
@@ -34,8 +42,15 @@ class OvertimeScheduleManager:
         Parse a record string in either format:
         - "DD/MM/YYYY - HH:MM AM/PM" (old format)
         - "Day - DD/MM/YYYY - HH:MM AM/PM" (new format)
-        Returns a datetime object.
+        Returns a datetime object. Datetimes (compact requests, see
+        logics/compact.py) are returned unchanged.
         """
+        if isinstance(record_str, datetime):
+            return record_str
+        if isinstance(record_str, ParsedRecord):
+            # Parsed when its dataset was stored (logics/datasets.py)
+            return record_str.dt
+
         # Check which format we're dealing with
         parts = record_str.split(" - ")
 
@@ -75,22 +90,11 @@ class OvertimeScheduleManager:
         """Extract just the date part of a datetime as a string"""
         return dt.strftime("%Y-%m-%d")
 
-    # ----------------------------------------
-    # 2) Main processing logic with overtime detection
-    # ----------------------------------------
-    def process_recorded_times(self, recorded_times, schedule):
+    def compile_schedule(self, schedule):
         """
-        Process recorded times using the provided schedule.
-        Logic 2 extends the core functionality from Logic 1 with:
-        1. Overtime detection - marks records as overtime when they exceed scheduled hours
-        2. Enhanced break detection with scheduled break handling
-
-        Schedule format: {
-            "start_day": "Monday",
-            "start_time": "12:00 PM",
-            "end_day": "Monday",  # Or "Tuesday" for overnight
-            "end_time": "6:00 PM"
-        }
+        Resolve defaults for a schedule and parse it into the values used by
+        grouping and labeling: start/end hours (end adjusted for overnight
+        shifts), day indices, day difference and shift duration.
         """
         # Ensure we have valid schedule data with default values for missing fields
         if not schedule:
@@ -134,368 +138,352 @@ class OvertimeScheduleManager:
         # Calculate standard shift duration
         shift_duration = end_h - start_h
 
-        # Set overtime threshold (typically end of shift)
-        overtime_threshold_h = end_h
+        return {
+            "start_day": start_day,
+            "start_time": start_time,
+            "end_day": end_day,
+            "end_time": end_time,
+            "start_h": start_h,
+            "end_h": end_h,
+            "start_day_idx": start_day_idx,
+            "end_day_idx": end_day_idx,
+            "day_diff": day_diff,
+            "is_overnight": is_overnight,
+            "shift_duration": shift_duration
+        }
+
+    def is_shift_boundary(self, prev_dt, curr_dt, compiled):
+        """
+        True if curr_dt starts a new shift after prev_dt under a compiled schedule.
+        Regular shifts break on every date change; overnight shifts stay together
+        across consecutive days while the gap is shorter than the shift plus a buffer.
+        """
+        # Calculate time difference between consecutive records
+        time_diff = (curr_dt - prev_dt).total_seconds() / 3600
+        date_diff = (curr_dt.date() - prev_dt.date()).days
+
+        if not compiled["is_overnight"]:
+            # For regular shifts (same day), only the same date continues a shift
+            return date_diff != 0
+
+        # If consecutive days and within reasonable time (less than shift duration + buffer)
+        if date_diff <= 1 and time_diff < (compiled["shift_duration"] + 4):
+            return False
+
+        # If same day, almost always same shift
+        if date_diff == 0:
+            return False
+
+        # If on different days but the first is on start_day and second on end_day
+        # and times are in the right ranges
+        prev_time = prev_dt.hour + prev_dt.minute / 60.0
+        curr_time = curr_dt.hour + curr_dt.minute / 60.0
+        if (prev_dt.weekday() == compiled["start_day_idx"] and prev_time >= compiled["start_h"] and
+                curr_dt.weekday() == compiled["end_day_idx"] and curr_time <= compiled["end_h"] % 24):
+            return False
+
+        return True
+
+    # ----------------------------------------
+    # 2) Main processing logic with overtime detection
+    # ----------------------------------------
+    def process_recorded_times(self, recorded_times, schedule):
+        """
+        Process recorded times using the provided schedule.
+        Logic 2 extends the core functionality from Logic 1 with:
+        1. Overtime detection - marks records as overtime when they exceed scheduled hours
+        2. Enhanced break detection with scheduled break handling
+
+        Schedule format: {
+            "start_day": "Monday",
+            "start_time": "12:00 PM",
+            "end_day": "Monday",  # Or "Tuesday" for overnight
+            "end_time": "6:00 PM"
+        }
+        """
+        labeled_results = []
+
+        with stage("group"):
+            for shift_labels in self.iter_shift_labels(recorded_times, schedule):
+                labeled_results.extend(labeled for _, labeled in shift_labels)
+
+        return {"labeledRecords": labeled_results}
+
+    def iter_shift_labels(self, recorded_times, schedule):
+        """
+        Generator behind process_recorded_times: parses and sorts the records,
+        then yields each shift's labels as soon as the shift is closed, as a
+        chronological list of (datetime, labeled_record) pairs. Shifts are
+        yielded in order, so the concatenation is sorted by time.
+        """
+        # 1) Parse schedule times
+        compiled = self.compile_schedule(schedule)
+        start_day = compiled["start_day"]
+        start_time = compiled["start_time"]
+        end_day = compiled["end_day"]
+        end_time = compiled["end_time"]
+        is_overnight = compiled["is_overnight"]
+        shift_duration = compiled["shift_duration"]
 
         print(f"Schedule: {start_day} {start_time} to {end_day} {end_time}")
         print(f"Shift duration: {shift_duration} hours, Overnight: {is_overnight}")
 
-        # Define thresholds
-        early_threshold = 3.0  # hours before start time
-        grace_period = 0.25  # 15 minutes (in hours)
-        late_threshold = 2.0  # hours after start time
-        early_out_threshold = 1.0  # hour before end time
-
         # 2) Parse and sort records
-        recs = []
-        for orig in recorded_times:
-            dt = self.parse_record_datetime(orig)
-
-            # Extract day of week (as index 0-6)
-            day_idx = dt.weekday()  # 0 = Monday, 6 = Sunday
-
-            # Calculate normalized time for comparison with schedule
-            # Base time is the hour and minute of the day as a float
-            rec_time = dt.hour + dt.minute / 60.0
-
-            # Extract original day from the record if it's in the new format
-            orig_day = None
-            if " - " in orig and len(orig.split(" - ")) == 3:
-                orig_day = orig.split(" - ")[0]
-
-            # Calculate normalized time for comparison with schedule
-            # This needs special handling for overnight shifts
-            normalized_time = rec_time  # Default to same-day time
-
-            # For overnight shifts, adjust based on day of week
-            if is_overnight:
-                if day_idx == start_day_idx:
-                    # On start day, keep as is (e.g., evening hours)
-                    normalized_time = rec_time
-                elif day_idx == end_day_idx:
-                    # On end day, add days to get correct comparison
-                    if day_diff == 0:  # Same day start/end means +1 day for overnight
-                        normalized_time = rec_time + 24.0
-                    else:
-                        normalized_time = rec_time + (24.0 * day_diff)
-                else:
-                    # On intermediate days (for multi-day shifts)
-                    day_offset = (day_idx - start_day_idx) % 7
-                    normalized_time = rec_time + (24.0 * day_offset)
-
-            # Calculate proximity to schedule start time
-            start_diff = normalized_time - start_h
-
-            # Calculate proximity to schedule end time
-            end_diff = normalized_time - end_h
-
-            # Determine if this is closer to start or end time
-            is_closer_to_start = abs(start_diff) <= abs(end_diff)
-
-            # Check if valid start time (within threshold of scheduled start)
-            is_valid_start = -early_threshold <= start_diff <= late_threshold
-
-            # Check if valid end time (within threshold of scheduled end)
-            is_valid_end = -early_out_threshold <= end_diff <= grace_period
-
-            # Check if this is overtime (after scheduled end time)
-            is_overtime = normalized_time > overtime_threshold_h + grace_period
-
-            recs.append({
-                "dt": dt,
-                "orig": orig,
-                "time_h": rec_time,
-                "orig_day": orig_day,
-                "day_idx": day_idx,
-                "normalized_time": normalized_time,
-                "start_diff": start_diff,
-                "end_diff": end_diff,
-                "is_closer_to_start": is_closer_to_start,
-                "is_valid_start": is_valid_start,
-                "is_valid_end": is_valid_end,
-                "is_overtime": is_overtime,
-                "date_str": self.get_date_string(dt)
-            })
+        with stage("parse"):
+            recs = [self.prepare_record(orig, self.parse_record_datetime(orig), compiled)
+                    for orig in checked(recorded_times, "parsing")]
+        if counting():
+            # Records from group_records_by_schedule() come parsed (ParsedRecords)
+            count("records_parsed", sum(1 for orig in recorded_times if not isinstance(orig, ParsedRecord)))
 
         if not recs:
-            return {"labeledRecords": []}
+            return
 
         # Sort records chronologically
-        recs.sort(key=lambda x: x["dt"])
+        with stage("sort"):
+            recs.sort(key=lambda x: x["dt"])
+        count("sorts")
 
         # 3) Group records into shifts
-        shifts = []
-        current_shift = []
-
-        # Add the first record to start the first shift
-        if recs:
-            current_shift.append(recs[0])
+        # and 4) label each shift as soon as the next one starts
+        current_shift = [recs[0]]
 
         # Process remaining records
-        for i in range(1, len(recs)):
+        for i in checked(range(1, len(recs)), "shift labeling"):
             prev_rec = recs[i - 1]
             curr_rec = recs[i]
 
-            # Calculate time difference between consecutive records
-            time_diff = (curr_rec["dt"] - prev_rec["dt"]).total_seconds() / 3600
-            date_diff = (curr_rec["dt"].date() - prev_rec["dt"].date()).days
+            if self.is_shift_boundary(prev_rec["dt"], curr_rec["dt"], compiled):
+                # Finalize current shift and start a new one
+                yield self._timed_shift_labels(current_shift)
+                current_shift = [curr_rec]
+            else:
+                current_shift.append(curr_rec)
 
-            # Special handling for overnight shifts
-            if is_overnight:
-                # For overnight shifts, we need to consider consecutive calendar days
-                # as potentially the same shift
-                same_shift = False
+        # Label the last shift
+        yield self._timed_shift_labels(current_shift)
 
-                # If consecutive days and within reasonable time (less than shift duration + buffer)
-                if date_diff <= 1 and time_diff < (shift_duration + 4):
-                    same_shift = True
+    def _timed_shift_labels(self, shift_recs):
+        """_sorted_shift_labels() for a closed shift, counted and timed for the request metrics."""
+        count("shifts")
+        with stage("label"):
+            return self._sorted_shift_labels(shift_recs)
 
-                # If same day, almost always same shift
-                elif date_diff == 0:
-                    same_shift = True
+    def prepare_record(self, orig, dt, compiled):
+        """
+        Build the per-record data the shift labeler needs for one record
+        (orig is the record string, dt its parsed datetime).
+        """
+        start_h = compiled["start_h"]
+        end_h = compiled["end_h"]
+        start_day_idx = compiled["start_day_idx"]
+        end_day_idx = compiled["end_day_idx"]
+        day_diff = compiled["day_diff"]
+        is_overnight = compiled["is_overnight"]
 
-                # If on different days but the first is on start_day and second on end_day
-                # and times are in the right ranges
-                elif (prev_rec["day_idx"] == start_day_idx and prev_rec["time_h"] >= start_h and
-                      curr_rec["day_idx"] == end_day_idx and curr_rec["time_h"] <= end_h % 24):
-                    same_shift = True
+        # Set overtime threshold (typically end of shift)
+        overtime_threshold_h = end_h
 
-                if same_shift:
-                    current_shift.append(curr_rec)
-                else:
-                    # Finalize current shift and start a new one
-                    if current_shift:
-                        shifts.append(current_shift)
-                    current_shift = [curr_rec]
-            else:
-                # For regular shifts (same day)
-                # Use simpler logic - mostly just check if same day
-                if date_diff == 0:
-                    current_shift.append(curr_rec)
-                else:
-                    # Finalize current shift and start a new one
-                    if current_shift:
-                        shifts.append(current_shift)
-                    current_shift = [curr_rec]
+        # Define thresholds
+        early_threshold = 3.0  # hours before start time
+        grace_period = 0.25  # 15 minutes (in hours)
+        late_threshold = 2.0  # hours after start time
+        early_out_threshold = 1.0  # hour before end time
 
-        # Add the last shift if it exists
-        if current_shift:
-            shifts.append(current_shift)
+        # Extract day of week (as index 0-6)
+        day_idx = dt.weekday()  # 0 = Monday, 6 = Sunday
 
-        # 4) Process each shift's records to assign labels
-        labeled_results = []
+        # Calculate normalized time for comparison with schedule
+        # Base time is the hour and minute of the day as a float
+        rec_time = dt.hour + dt.minute / 60.0
 
-        for shift_recs in shifts:
-            # LOGIC 2: Split shift into regular and overtime segments
-            regular_recs = [r for r in shift_recs if not r["is_overtime"]]
-            overtime_recs = [r for r in shift_recs if r["is_overtime"]]
-
-            # Process regular records first
-            if regular_recs:
-                self._process_shift_segment(regular_recs, labeled_results, is_overtime=False)
-
-            # Process overtime records if any exist
-            if overtime_recs:
-                # Mark the first overtime record as "Overtime Start"
-                first_ot_rec = overtime_recs[0]
-                weekday = first_ot_rec["orig_day"] if first_ot_rec["orig_day"] else self.format_date_with_day(
-                    first_ot_rec["dt"])
-
-                labeled_results.append({
-                    "record": first_ot_rec["orig"],
-                    "weekday": weekday,
-                    "label": "Overtime Start"
-                })
-
-                # Process intermediate overtime records if any
-                for i in range(1, len(overtime_recs) - 1):
-                    rec = overtime_recs[i]
-                    weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
-
-                    # Alternate between Break Out and Break In
-                    label = "Break Out" if i % 2 == 1 else "Break In"
-
-                    labeled_results.append({
-                        "record": rec["orig"],
-                        "weekday": weekday,
-                        "label": label
-                    })
-
-                # Mark the last overtime record as "Overtime End" if there's more than one
-                if len(overtime_recs) > 1:
-                    last_ot_rec = overtime_recs[-1]
-                    weekday = last_ot_rec["orig_day"] if last_ot_rec["orig_day"] else self.format_date_with_day(
-                        last_ot_rec["dt"])
-
-                    labeled_results.append({
-                        "record": last_ot_rec["orig"],
-                        "weekday": weekday,
-                        "label": "Overtime End"
-                    })
-
-        # Sort results by original timestamp order
-        labeled_results.sort(key=lambda x: self.parse_record_datetime(x["record"]))
+        # Extract original day from the record if it's in the new format
+        orig_day = None
+        if isinstance(orig, datetime):
+            # Compact/MessagePack punches label like new format record strings
+            orig_day = dt.strftime('%A')
+        elif " - " in orig and len(orig.split(" - ")) == 3:
+            orig_day = orig.split(" - ")[0]
 
-        return {"labeledRecords": labeled_results}
+        # Calculate normalized time for comparison with schedule
+        # This needs special handling for overnight shifts
+        normalized_time = rec_time  # Default to same-day time
 
-    def _process_shift_segment(self, shift_recs, labeled_results, is_overtime=False):
-        """Helper method to process a segment of records (regular or overtime)"""
-        num_records = len(shift_recs)
+        # For overnight shifts, adjust based on day of week
+        if is_overnight:
+            if day_idx == start_day_idx:
+                # On start day, keep as is (e.g., evening hours)
+                normalized_time = rec_time
+            elif day_idx == end_day_idx:
+                # On end day, add days to get correct comparison
+                if day_diff == 0:  # Same day start/end means +1 day for overnight
+                    normalized_time = rec_time + 24.0
+                else:
+                    normalized_time = rec_time + (24.0 * day_diff)
+            else:
+                # On intermediate days (for multi-day shifts)
+                day_offset = (day_idx - start_day_idx) % 7
+                normalized_time = rec_time + (24.0 * day_offset)
+
+        # Calculate proximity to schedule start time
+        start_diff = normalized_time - start_h
+
+        # Calculate proximity to schedule end time
+        end_diff = normalized_time - end_h
+
+        # Determine if this is closer to start or end time
+        is_closer_to_start = abs(start_diff) <= abs(end_diff)
+
+        # Check if valid start time (within threshold of scheduled start)
+        is_valid_start = -early_threshold <= start_diff <= late_threshold
+
+        # Check if valid end time (within threshold of scheduled end)
+        is_valid_end = -early_out_threshold <= end_diff <= grace_period
+
+        # Check if this is overtime (after scheduled end time)
+        is_overtime = normalized_time > overtime_threshold_h + grace_period
+
+        return {
+            "dt": dt,
+            "orig": orig,
+            "time_h": rec_time,
+            "orig_day": orig_day,
+            "day_idx": day_idx,
+            "normalized_time": normalized_time,
+            "start_diff": start_diff,
+            "end_diff": end_diff,
+            "is_closer_to_start": is_closer_to_start,
+            "is_valid_start": is_valid_start,
+            "is_valid_end": is_valid_end,
+            "is_overtime": is_overtime,
+            "date_str": self.get_date_string(dt)
+        }
 
-        if num_records == 0:
-            return
+    def _sorted_shift_labels(self, shift_recs):
+        """Label a shift and return its (datetime, labeled_record) pairs in time order."""
+        labeled_results = []
+        self._label_shift(shift_recs, labeled_results)
+
+        # Sort results by original timestamp order (stable, so ties keep emit order)
+        labeled_results.sort(key=lambda x: x[0])
+        count("sorts")
+        return labeled_results
+
+    def _emit_label(self, labeled_results, rec, label):
+        """Append a labeled record, keyed by its datetime for the final sort."""
+        weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
+        labeled_results.append((rec["dt"], {
+            "record": rec["orig"],
+            "weekday": weekday,
+            "label": label
+        }))
+
+    def _label_shift(self, shift_recs, labeled_results):
+        """
+        Label one shift in a single pass over its records.
 
+        The pass splits the shift into regular and overtime records by index and
+        finds the regular records closest to the scheduled start and end times.
+        Regular records become Time In / Time Out with Break Out / Break In pairs
+        in between; overtime records become Overtime Start / Overtime End with
+        breaks in between.
+        """
+        regular = []
+        overtime = []
+        start_pos = end_pos = None
+        best_start = best_end = None
+
+        for rec in shift_recs:
+            if rec["is_overtime"]:
+                overtime.append(rec)
+                continue
+
+            # Closest to start/end; strict "<" keeps the first of equal candidates
+            start_dist = abs(rec["start_diff"])
+            end_dist = abs(rec["end_diff"])
+            if best_start is None or start_dist < best_start:
+                best_start, start_pos = start_dist, len(regular)
+            if best_end is None or end_dist < best_end:
+                best_end, end_pos = end_dist, len(regular)
+            regular.append(rec)
+
+        # Regular records first
+        num_records = len(regular)
         if num_records == 1:
             # Single record - classify based on proximity to schedule times
-            rec = shift_recs[0]
-            weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
-
-            # Logic 2 specific: Override for overtime records
-            if is_overtime:
-                label = "Overtime Start"  # Single OT record becomes Overtime Start
+            rec = regular[0]
+            if rec["is_valid_end"] and not rec["is_valid_start"]:
+                label = "Time Out"
+            elif rec["is_valid_start"] and not rec["is_valid_end"]:
+                label = "Time In"
+            elif rec["is_closer_to_start"]:
+                label = "Time In"
             else:
-                # Determine if this is closer to start or end time
-                if rec["is_valid_end"] and not rec["is_valid_start"]:
-                    label = "Time Out"
-                elif rec["is_valid_start"] and not rec["is_valid_end"]:
-                    label = "Time In"
-                elif rec["is_closer_to_start"]:
-                    label = "Time In"
-                else:
-                    label = "Time Out"
-
-            labeled_results.append({
-                "record": rec["orig"],
-                "weekday": weekday,
-                "label": label
-            })
+                label = "Time Out"
+            self._emit_label(labeled_results, rec, label)
 
         elif num_records == 2:
             # Two records - determine which is Time In and which is Time Out
             # based on proximity to schedule times
-            rec1, rec2 = shift_recs
+            rec1, rec2 = regular
+            if rec1["is_valid_start"] and rec2["is_valid_end"]:
+                # Clear case: first is start, second is end
+                label1, label2 = "Time In", "Time Out"
+            elif rec1["is_valid_end"] and rec2["is_valid_start"]:
+                # Unusual case: first is end, second is start (shouldn't happen often)
+                label1, label2 = "Time Out", "Time In"
+            elif not rec1["is_closer_to_start"] and rec2["is_closer_to_start"]:
+                label1, label2 = "Time Out", "Time In"
+            else:
+                # Closer to start/end in order, or both closer to the same endpoint
+                label1, label2 = "Time In", "Time Out"
+            self._emit_label(labeled_results, rec1, label1)
+            self._emit_label(labeled_results, rec2, label2)
+
+        elif num_records > 2:
+            # Start and end must be different punches. A duplicate punch counts as
+            # the same one, so pick the next best end among the other punches.
+            if regular[end_pos]["orig"] == regular[start_pos]["orig"]:
+                start_orig = regular[start_pos]["orig"]
+                end_pos, best_end = None, None
+                for i, rec in enumerate(regular):
+                    end_dist = abs(rec["end_diff"])
+                    if rec["orig"] != start_orig and (best_end is None or end_dist < best_end):
+                        best_end, end_pos = end_dist, i
+                if end_pos is None:
+                    # Every punch is the same time: fall back to the last one
+                    end_pos = num_records - 1 if start_pos != num_records - 1 else 0
+
+            # Keep chronological order even if the end record comes first
+            if start_pos > end_pos:
+                first_pos, last_pos = end_pos, start_pos
+                first_label, last_label = "Time Out", "Time In"
+            else:
+                first_pos, last_pos = start_pos, end_pos
+                first_label, last_label = "Time In", "Time Out"
 
-            weekday1 = rec1["orig_day"] if rec1["orig_day"] else self.format_date_with_day(rec1["dt"])
-            weekday2 = rec2["orig_day"] if rec2["orig_day"] else self.format_date_with_day(rec2["dt"])
+            self._emit_label(labeled_results, regular[first_pos], first_label)
+            self._emit_label(labeled_results, regular[last_pos], last_label)
 
-            # Logic 2 specific: Override for overtime records
-            if is_overtime:
-                label1 = "Overtime Start"
-                label2 = "Overtime End"
-            else:
-                # First, try to determine based on valid start/end times
-                if rec1["is_valid_start"] and rec2["is_valid_end"]:
-                    # Clear case: first is start, second is end
-                    label1 = "Time In"
-                    label2 = "Time Out"
-                elif rec1["is_valid_end"] and rec2["is_valid_start"]:
-                    # Unusual case: first is end, second is start (shouldn't happen often)
-                    label1 = "Time Out"
-                    label2 = "Time In"
-                else:
-                    # Determine based on proximity to schedule times
-                    if rec1["is_closer_to_start"] and not rec2["is_closer_to_start"]:
-                        label1 = "Time In"
-                        label2 = "Time Out"
-                    elif not rec1["is_closer_to_start"] and rec2["is_closer_to_start"]:
-                        label1 = "Time Out"
-                        label2 = "Time In"
-                    else:
-                        # If both are closer to the same endpoint, use chronological order as fallback
-                        label1 = "Time In"
-                        label2 = "Time Out"
-
-            labeled_results.append({
-                "record": rec1["orig"],
-                "weekday": weekday1,
-                "label": label1
-            })
-
-            labeled_results.append({
-                "record": rec2["orig"],
-                "weekday": weekday2,
-                "label": label2
-            })
+            # Intermediate records alternate Break Out / Break In
+            label = "Break Out"
+            for i, rec in enumerate(regular):
+                if i == first_pos or i == last_pos:
+                    continue
+                self._emit_label(labeled_results, rec, label)
+                label = "Break In" if label == "Break Out" else "Break Out"
 
-        else:
-            # More than 2 records - determine Time In, Time Out and breaks
+        # Then overtime records
+        if overtime:
+            self._emit_label(labeled_results, overtime[0], "Overtime Start")
 
-            # Logic 2 specific: Labels for overtime records
-            if is_overtime:
-                first_label = "Overtime Start"
-                last_label = "Overtime End"
-            else:
-                first_label = "Time In"
-                last_label = "Time Out"
-
-            # Find records closest to start and end times
-            start_rec = min(shift_recs, key=lambda x: abs(x["start_diff"]))
-            end_rec = min(shift_recs, key=lambda x: abs(x["end_diff"]))
-
-            # Must be different records
-            if start_rec == end_rec:
-                # If same record, find next best match for end time
-                remaining = [r for r in shift_recs if r != start_rec]
-                end_rec = min(remaining, key=lambda x: abs(x["end_diff"]))
-
-            # Get indices of start and end records
-            start_idx = shift_recs.index(start_rec)
-            end_idx = shift_recs.index(end_rec)
-
-            # Sort start and end indices to get chronological order
-            if start_idx > end_idx:
-                # This is an unusual case where end time record comes before start time record
-                # We'll still process in chronological order, but adjust labels accordingly
-                first_rec, last_rec = end_rec, start_rec
-                first_label, last_label = last_label, first_label
-                first_idx, last_idx = end_idx, start_idx
-            else:
-                first_rec, last_rec = start_rec, end_rec
-                first_idx, last_idx = start_idx, end_idx
-
-            # Process first record (Time In or Overtime Start)
-            weekday = first_rec["orig_day"] if first_rec["orig_day"] else self.format_date_with_day(first_rec["dt"])
-            labeled_results.append({
-                "record": first_rec["orig"],
-                "weekday": weekday,
-                "label": first_label
-            })
-
-            # Process last record (Time Out or Overtime End)
-            # Skip if it's the same as the first record (shouldn't happen)
-            if last_rec != first_rec:
-                weekday = last_rec["orig_day"] if last_rec["orig_day"] else self.format_date_with_day(last_rec["dt"])
-                labeled_results.append({
-                    "record": last_rec["orig"],
-                    "weekday": weekday,
-                    "label": last_label
-                })
-
-            # Process intermediate records as break pairs
-            intermediate_recs = [r for i, r in enumerate(shift_recs)
-                                 if i != first_idx and i != last_idx]
-
-            # Process intermediate records in pairs if possible
-            for i in range(0, len(intermediate_recs), 2):
-                if i < len(intermediate_recs):
-                    # Break Out
-                    rec = intermediate_recs[i]
-                    weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
-                    labeled_results.append({
-                        "record": rec["orig"],
-                        "weekday": weekday,
-                        "label": "Break Out"
-                    })
-
-                if i + 1 < len(intermediate_recs):
-                    # Break In
-                    rec = intermediate_recs[i + 1]
-                    weekday = rec["orig_day"] if rec["orig_day"] else self.format_date_with_day(rec["dt"])
-                    labeled_results.append({
-                        "record": rec["orig"],
-                        "weekday": weekday,
-                        "label": "Break In"
-                    })
+            # Intermediate overtime records alternate Break Out / Break In
+            for i in range(1, len(overtime) - 1):
+                self._emit_label(labeled_results, overtime[i], "Break Out" if i % 2 == 1 else "Break In")
+
+            # Mark the last overtime record as "Overtime End" if there's more than one
+            if len(overtime) > 1:
+                self._emit_label(labeled_results, overtime[-1], "Overtime End")
 
     def find_applicable_schedule(self, dt, schedules):
         """
@@ -517,7 +505,8 @@ class OvertimeScheduleManager:
         dt_day_idx = dt.weekday()
         dt_time = dt.hour + dt.minute / 60.0
 
-        for schedule in schedules:
+        # Stop at the first match; the schedules checked are counted
+        for position, schedule in enumerate(schedules, 1):
             # Get indices for schedule days
             start_day_idx = self.get_day_index(schedule.get("start_day", "Monday"))
             end_day_idx = self.get_day_index(schedule.get("end_day", schedule.get("start_day", "Monday")))
@@ -544,35 +533,77 @@ class OvertimeScheduleManager:
             # Case 1: Same day schedule (not overnight)
             if not is_overnight and dt_day_idx == start_day_idx:
                 if start_h <= dt_time <= end_h:
-                    return schedule
+                    break
 
             # Case 2: Overnight shift
             elif is_overnight:
                 # Check if dt is on start day after start time
                 if dt_day_idx == start_day_idx and dt_time >= start_h:
-                    return schedule
+                    break
 
                 # Check if dt is on end day before end time
                 if dt_day_idx == end_day_idx and dt_time <= end_h % 24:
-                    return schedule
+                    break
 
                 # Check if dt is on a day between start and end day (for multi-day shifts)
                 if day_diff > 1:
                     days_between = [(start_day_idx + d) % 7 for d in range(1, day_diff)]
                     if dt_day_idx in days_between:
-                        return schedule
+                        break
+        else:
+            # No matching schedule found
+            count("schedule_comparisons", len(schedules))
+            return None
 
-        # No matching schedule found
-        return None
+        count("schedule_comparisons", position)
+        return schedule
 
-    def process_recorded_times_with_schedules(self, recorded_times, schedules):
+    def get_schedule_key(self, schedule):
+        """Build the key used to group records that share a schedule."""
+        return (
+            f"{schedule.get('start_day', 'Monday')}_"
+            f"{schedule.get('start_time', '8:00 AM')}_"
+            f"{schedule.get('end_day', schedule.get('start_day', 'Monday'))}_"
+            f"{schedule.get('end_time', '5:00 PM')}"
+        )
+
+    def get_schedule_group(self, dt, schedules):
         """
-        Process recorded times using multiple schedules.
-        Groups records by applicable schedule and processes each group.
+        Pick the schedule group a record belongs to.
+        Returns (schedule_key, schedule), or (None, None) if no schedule applies.
         """
-        if not recorded_times:
-            return {"labeledRecords": []}
+        # Registered schedule sets (logics/registry.py) carry a week table
+        if hasattr(schedules, "lookup_group"):
+            count("week_table_lookups")
+            return schedules.lookup_group(self, dt)
 
+        applicable_schedule = self.find_applicable_schedule(dt, schedules)
+
+        if applicable_schedule:
+            return self.get_schedule_key(applicable_schedule), applicable_schedule
+
+        # Handle records with no matching schedule
+        # Use the schedule for the day of the week this record falls on
+        record_day = dt.strftime('%A')
+        matching_schedule = None
+
+        for schedule in schedules:
+            if schedule.get("start_day") == record_day:
+                matching_schedule = schedule
+                break
+
+        if not matching_schedule and schedules:
+            matching_schedule = schedules[0]  # Default to first schedule
+
+        if matching_schedule:
+            return self.get_schedule_key(matching_schedule), matching_schedule
+        return None, None
+
+    def group_records_by_schedule(self, recorded_times, schedules):
+        """
+        Split records into schedule groups.
+        Returns a list of (records, schedule) pairs in first-seen order.
+        """
         # Ensure we have valid schedules with default values
         if not schedules or not isinstance(schedules, list) or len(schedules) == 0:
             # Default schedule if none provided
@@ -584,88 +615,155 @@ class OvertimeScheduleManager:
             }]
 
         # Parse all record datetimes
-        parsed_records = [(rec, self.parse_record_datetime(rec)) for rec in recorded_times]
+        with stage("parse"):
+            parsed_records = [(rec, self.parse_record_datetime(rec)) for rec in checked(recorded_times, "parsing")]
+        count("records_parsed", len(parsed_records))
 
         # Group records by applicable schedule
         schedule_groups = {}
 
-        for rec, dt in parsed_records:
-            applicable_schedule = self.find_applicable_schedule(dt, schedules)
-
-            if applicable_schedule:
-                # Create a key from the schedule to group records
-                schedule_key = (
-                    f"{applicable_schedule.get('start_day', 'Monday')}_"
-                    f"{applicable_schedule.get('start_time', '8:00 AM')}_"
-                    f"{applicable_schedule.get('end_day', applicable_schedule.get('start_day', 'Monday'))}_"
-                    f"{applicable_schedule.get('end_time', '5:00 PM')}"
-                )
+        with stage("match"):
+            for rec, dt in checked(parsed_records, "schedule matching"):
+                schedule_key, matching_schedule = self.get_schedule_group(dt, schedules)
+                if schedule_key is None:
+                    continue
 
                 if schedule_key not in schedule_groups:
                     schedule_groups[schedule_key] = {
-                        "schedule": applicable_schedule,
+                        "schedule": matching_schedule,
                         "records": []
                     }
 
+                # The parsed datetime goes along, so the group doesn't parse the record again
+                if not isinstance(rec, (datetime, ParsedRecord)):
+                    rec = ParsedRecord(rec, dt)
                 schedule_groups[schedule_key]["records"].append(rec)
-            else:
-                # Handle records with no matching schedule
-                # Use the schedule for the day of the week this record falls on
-                record_day = dt.strftime('%A')
-                matching_schedule = None
-
-                for schedule in schedules:
-                    if schedule.get("start_day") == record_day:
-                        matching_schedule = schedule
-                        break
 
-                if not matching_schedule and schedules:
-                    matching_schedule = schedules[0]  # Default to first schedule
+        return [(group_data["records"], group_data["schedule"]) for group_data in schedule_groups.values()]
 
-                if matching_schedule:
-                    schedule_key = (
-                        f"{matching_schedule.get('start_day', 'Monday')}_"
-                        f"{matching_schedule.get('start_time', '8:00 AM')}_"
-                        f"{matching_schedule.get('end_day', matching_schedule.get('start_day', 'Monday'))}_"
-                        f"{matching_schedule.get('end_time', '5:00 PM')}"
-                    )
+    def iter_labeled_records_with_schedules(self, recorded_times, schedules):
+        """
+        Streaming counterpart of process_recorded_times_with_schedules.
+        Yields labeled records in time order, merging the schedule groups'
+        shift-by-shift output instead of collecting and sorting everything.
+        """
+        if not recorded_times:
+            return
 
-                    if schedule_key not in schedule_groups:
-                        schedule_groups[schedule_key] = {
-                            "schedule": matching_schedule,
-                            "records": []
-                        }
+        streams = [
+            self._iter_group_labels(records, schedule)
+            for records, schedule in self.group_records_by_schedule(recorded_times, schedules)
+        ]
+        for _, labeled in heapq.merge(*streams, key=lambda x: x[0]):
+            yield labeled
 
-                    schedule_groups[schedule_key]["records"].append(rec)
+    def _iter_group_labels(self, records, schedule):
+        for shift_labels in self.iter_shift_labels(records, schedule):
+            yield from shift_labels
+
+    def process_recorded_times_with_schedules(self, recorded_times, schedules):
+        """
+        Process recorded times using multiple schedules.
+        Groups records by applicable schedule and processes each group.
+        """
+        if not recorded_times:
+            return {"labeledRecords": []}
 
         # Process each group with its applicable schedule
+        # Groups are independent, so large ones are labeled in worker processes
+        groups = self.group_records_by_schedule(recorded_times, schedules)
         all_labeled_records = []
 
-        for group_data in schedule_groups.values():
-            result = self.process_recorded_times(group_data["records"], group_data["schedule"])
-            all_labeled_records.extend(result["labeledRecords"])
+        # Time spent waiting on worker processes counts as labeling
+        with stage("label"):
+            label_group = partial(_label_schedule_group, deadline=current_deadline())
+            for labeled_records in map_groups(label_group, groups):
+                all_labeled_records.extend(labeled_records)
 
-        # Sort all results by timestamp
-        all_labeled_records.sort(key=lambda x: self.parse_record_datetime(x["record"]))
+        # Sort all results by timestamp (the records carry their datetimes, see group_records_by_schedule())
+        with stage("sort"):
+            all_labeled_records.sort(key=lambda x: self.parse_record_datetime(x["record"]))
+        count("sorts")
 
         return {"labeledRecords": all_labeled_records}
 
 
+def _label_schedule_group(records, schedule, deadline=None):
+    """Label one schedule group. Module level so worker processes can run it."""
+    with deadline_scope(deadline):
+        return OvertimeScheduleManager().process_recorded_times(records, schedule)["labeledRecords"]
+
+
 # For convenience, expose the process functions
-def execute_logic2(recorded_times, schedule_or_schedules):
+def execute_logic2(recorded_times, schedule_or_schedules, window=None, deadline=None):
     """
     Logic 2 processor that extends Logic 1 with overtime detection.
     This function can handle both a single schedule or a list of schedules.
+    An optional window ({"start": date, "end": date}) limits labeling to those dates.
+    A deadline (logics/deadline.py) stops the run with DeadlineExceeded once it passes.
     """
+    with deadline_scope(deadline):
+        manager = OvertimeScheduleManager()
+
+        # Restrict to the window (plus padding up to the nearest shift boundaries)
+        window = parse_window(window)
+        if window:
+            recorded_times = select_window_records(recorded_times, window, schedule_or_schedules, manager)
+
+        # Long histories are labeled in date partitions on the worker pool (logics/partition.py)
+        labeled_records = label_partitioned(OvertimeScheduleManager, "_sorted_shift_labels", recorded_times, schedule_or_schedules)
+        if labeled_records is not None:
+            result = {"labeledRecords": labeled_records}
+        # Stored datasets: label the sorted epoch-minute column as it is
+        elif isinstance(recorded_times, MinuteRecords):
+            from .stream import label_minutes  # stream imports this module
+
+            result = {"labeledRecords": label_minutes(recorded_times.minutes, schedule_or_schedules, "logic2",
+                                                      recorded_times.originals)}
+        # Check if we have a list of schedules or a single schedule
+        elif isinstance(schedule_or_schedules, list):
+            # If we have a list of schedules, use the multi-schedule function
+            result = manager.process_recorded_times_with_schedules(recorded_times, schedule_or_schedules)
+        else:
+            # If we have a single schedule, use the original function
+            result = manager.process_recorded_times(recorded_times, schedule_or_schedules)
+
+        # Only emit labels dated inside the window
+        if window:
+            result = filter_labeled_result(result, window)
+        return result
+
+
+def iter_logic2(recorded_times, schedule_or_schedules, window=None, deadline=None):
+    """
+    Streaming version of execute_logic2: yields labeled records in time order,
+    shift by shift, so callers can send them on before the run has finished.
+    The deadline is checked while the records are produced, as in execute_logic2.
+    """
+    return stepwise(_iter_logic2(recorded_times, schedule_or_schedules, window), deadline)
+
+
+def _iter_logic2(recorded_times, schedule_or_schedules, window):
     manager = OvertimeScheduleManager()
 
-    # Check if we have a list of schedules or a single schedule
+    window = parse_window(window)
+    if window:
+        recorded_times = select_window_records(recorded_times, window, schedule_or_schedules, manager)
+
     if isinstance(schedule_or_schedules, list):
-        # If we have a list of schedules, use the multi-schedule function
-        return manager.process_recorded_times_with_schedules(recorded_times, schedule_or_schedules)
+        labeled_records = manager.iter_labeled_records_with_schedules(recorded_times, schedule_or_schedules)
     else:
-        # If we have a single schedule, use the original function
-        return manager.process_recorded_times(recorded_times, schedule_or_schedules)
+        labeled_records = (
+            labeled
+            for shift_labels in manager.iter_shift_labels(recorded_times, schedule_or_schedules)
+            for _, labeled in shift_labels
+        )
+
+    for labeled in labeled_records:
+        # Only emit labels dated inside the window
+        if window and not in_window(labeled, window):
+            continue
+        yield labeled
 
 
 # Still provide direct access to the individual functions if needed
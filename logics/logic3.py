@@ -1,5 +1,8 @@
 from datetime import datetime, timedelta
 from .logic1 import TimeScheduleManager
+from .deadline import check_deadline, checked, deadline_scope
+from .metrics import count, stage, switch_stage
+from .window import parse_window, select_window_records, filter_review_result
 
 class TimeScheduleReviewer:
     _instance = None
@@ -304,7 +307,8 @@ class TimeScheduleReviewer:
         validated_overtime_records = {}
         labeled_records_map = {}
         
-        for record in recorded_times:
+        switch_stage("parse")
+        for record in checked(recorded_times, "parsing"):
             # Check if this is a dictionary with validation info
             validated_overtime = False
             label_info = None
@@ -335,11 +339,17 @@ class TimeScheduleReviewer:
                 "matched_schedule": None  # Track which schedule this record matches
             })
         
+        count("records_parsed", len(parsed_records))
+
         # Sort chronologically first
-        parsed_records.sort(key=lambda x: x["datetime"])
+        with stage("sort"):
+            parsed_records.sort(key=lambda x: x["datetime"])
+        count("sorts")
         
         # IMPROVED APPROACH: Tag each record with its matching schedule and exact time flags
-        for record in parsed_records:
+        switch_stage("match")
+        count("schedule_comparisons", len(parsed_records) * len(schedules))
+        for record in checked(parsed_records, "schedule matching"):
             record_day = record["datetime"].strftime("%A")
             record_hour = record["datetime"].hour
             record_minute = record["datetime"].minute
@@ -465,6 +475,7 @@ class TimeScheduleReviewer:
                 record["matched_schedule"] = best_schedule
         
         # Now group records into shifts based on schedule matches and time proximity
+        switch_stage("group")
         shifts = []
         current_shift = []
         current_shift_date = None  # Track the date of the current shift
@@ -491,7 +502,7 @@ class TimeScheduleReviewer:
             
             # Find records that could be start points (close to start time on start day)
             potential_starts = []
-            for i, record in enumerate(parsed_records):
+            for i, record in enumerate(checked(parsed_records, "overnight pre-grouping")):
                 if not record.get("already_grouped", False):  # Skip records already in a group
                     record_day = record["datetime"].strftime("%A")
                     record_time = record["datetime"].hour + record["datetime"].minute / 60.0
@@ -500,7 +511,8 @@ class TimeScheduleReviewer:
                         potential_starts.append((i, record))
             
             # For each potential start, look for a matching end
-            for start_idx, start_record in potential_starts:
+            # Each start scans the records for its end, so check the deadline for every start
+            for start_idx, start_record in checked(potential_starts, "overnight pre-grouping", every=1):
                 start_date = start_record["datetime"].date()
                 
                 # Calculate expected end date based on days_span
@@ -543,7 +555,7 @@ class TimeScheduleReviewer:
                         shift_groups.append((group, schedule))
         
         # Now process any remaining records to prioritize same-day clustering
-        for record in parsed_records:
+        for record in checked(parsed_records, "shift grouping"):
             if record.get("already_grouped", False):
                 continue  # Skip records we've already grouped
                 
@@ -648,6 +660,8 @@ class TimeScheduleReviewer:
         
         # Sort all shifts by their first record's timestamp
         shifts.sort(key=lambda shift: shift[0]["datetime"])
+        count("sorts")
+        count("shifts", len(shifts))
         
         # Debug: Print out the shift grouping
         print("\n===== SHIFT GROUPING (Schedule Reference) =====")
@@ -666,10 +680,11 @@ class TimeScheduleReviewer:
         print("===== END SHIFT GROUPING =====\n")
         
         # Process each shift by applying schedules
+        switch_stage("label")
         all_records = []
         all_issues = []
 
-        for shift in shifts:
+        for shift in checked(shifts, "shift labeling", every=64):
             # Find matching schedule for this shift
             first_record = shift[0]
             first_day = first_record["datetime"].strftime("%A")
@@ -731,13 +746,15 @@ class TimeScheduleReviewer:
             
             # Check validity against schedule if a matching schedule was found
             if matching_schedule:
-                issues = self.check_schedule_validity(processed_records, matching_schedule)
+                with stage("validate"):
+                    issues = self.check_schedule_validity(processed_records, matching_schedule)
                 all_issues.extend(issues)
             
             all_records.extend(processed_records)
 
         # Sort all records chronologically (important for display)
         all_records.sort(key=lambda x: x["datetime"])
+        count("sorts")
 
         # Print issues to console
         if all_issues:
@@ -748,6 +765,7 @@ class TimeScheduleReviewer:
         else:
             print("No issues found in schedule records.")
 
+        check_deadline("merging")
         return {
             "status": "success",
             "merged_records": self.merge_schedule(all_records, len(all_issues) > 0),
@@ -810,5 +828,90 @@ class TimeScheduleReviewer:
             self.show_success_message(f"Changes saved to {saved_file}")
 
 
+# Sections a review response can carry; "status" is always included
+REVIEW_FIELDS = ("merged_records", "needs_review", "issues", "original_records", "schedules")
+
+
+def shape_review_result(result, shape="full", fields=None):
+    """
+    Shape a process_records() result for the response.
+
+    shape="full" returns the result unchanged (compatibility mode).
+    shape="slim" drops the datetime objects from original_records and makes
+    each merged row point at its records by index into original_records
+    ("record_indices") instead of embedding copies, so every punch is
+    serialized once. fields limits the response to the listed sections.
+    """
+    if not isinstance(result, dict) or result.get("status") != "success":
+        return result
+
+    if shape == "slim":
+        originals = result["original_records"]
+        positions = {id(rec): i for i, rec in enumerate(originals)}
+
+        slim_records = []
+        for rec in originals:
+            slim = {"record": rec["record"], "label": rec["label"]}
+            if rec.get("validated_overtime"):
+                slim["validated_overtime"] = True
+            if rec.get("original_label"):
+                slim["original_label"] = rec["original_label"]
+            slim_records.append(slim)
+
+        result = dict(result)
+        result["original_records"] = slim_records
+        result["merged_records"] = [
+            {
+                "date": row["date"],
+                "day": row["day"],
+                "times": row["times"],
+                "record_indices": [positions[id(rec)] for rec in row["records"]]
+            }
+            for row in result["merged_records"]
+        ]
+        # The schedules block is a static placeholder
+        result.pop("schedules", None)
+
+    if fields:
+        wanted = set(fields)
+        if shape == "slim" and "merged_records" in wanted:
+            # Slim rows are only readable together with the records they index
+            wanted.add("original_records")
+        result = {key: value for key, value in result.items() if key == "status" or key in wanted}
+
+    return result
+
+
 # Expose the process function
-execute_logic3 = TimeScheduleReviewer().process_records
\ No newline at end of file
+def execute_logic3(recorded_times, schedule_data, window=None, deadline=None):
+    """
+    Run the Logic 3 review. An optional window ({"start": date, "end": date})
+    limits the review to those dates; records in the padding margin around
+    the window are only used to group shifts that cross its edges.
+    A deadline (logics/deadline.py) stops the review with DeadlineExceeded
+    once it passes.
+    """
+    with deadline_scope(deadline):
+        reviewer = TimeScheduleReviewer()
+
+        # The reviewer annotates schedule dicts, so registered sets are copied
+        if hasattr(schedule_data, "copy_schedules"):
+            schedule_data = schedule_data.copy_schedules()
+
+        window = parse_window(window)
+        if window:
+            if isinstance(schedule_data, dict):
+                schedules = schedule_data.get("schedules", [])
+            else:
+                schedules = schedule_data
+            recorded_times = select_window_records(recorded_times, window, schedules)
+            if not recorded_times:
+                return {"status": "error", "message": "No records in the selected window"}
+
+        # process_records() switches between stages; they end with this block
+        with stage("label"):
+            result = reviewer.process_records(recorded_times, schedule_data)
+
+        if window:
+            result = filter_review_result(result, window)
+        return result
\ No newline at end of file
@@ -0,0 +1,121 @@
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+
+# ----------------------------------------
+# Per-request stage timings and work counters
+# ----------------------------------------
+# The app activates a RequestMetrics for each execute request; the engines
+# report into whatever is active in the current context:
+# - stage("parse") / switch_stage("match") attribute wall time to a stage.
+#   Stages are exclusive: entering a stage pauses the enclosing one, so the
+#   stage durations add up to (at most) the request's total.
+# - count("shifts") adds to a work counter.
+# Outside a request (scripts, worker processes) nothing is active and both
+# are no-ops, so the engines don't pay for the bookkeeping.
+#
+# Counters used by the engines:
+#   records_parsed        record strings/datetimes turned into datetimes,
+#                         once per record (ParsedRecords carry theirs)
+#   schedule_comparisons  schedules checked by find_applicable_schedule() or
+#                         scored by the logic3 matching loop
+#   week_table_lookups    records grouped through a registered schedule set
+#   shifts                shifts formed
+#   sorts                 sorts executed
+#   partitions            date partitions labeled on the worker pool
+
+_current = ContextVar("dtr_request_metrics", default=None)
+_NO_STAGE = nullcontext()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+        self.debug = False
+        self._stage = None
+        self._mark = self._start = time.perf_counter()
+        self.total = None
+
+    def switch(self, name):
+        """Attribute the time since the last switch to the current stage and make name current."""
+        now = time.perf_counter()
+        previous = self._stage
+        if previous is not None:
+            self.timings[previous] = self.timings.get(previous, 0.0) + now - self._mark
+        self._stage = name
+        self._mark = now
+        return previous
+
+    @contextmanager
+    def stage(self, name):
+        previous = self.switch(name)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def finish(self):
+        """Close the current stage and record the total duration."""
+        if self.total is None:
+            self.switch(None)
+            self.total = time.perf_counter() - self._start
+        return self
+
+    def timings_ms(self):
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
+
+
+@contextmanager
+def collect_metrics(metrics=None):
+    """Activate a RequestMetrics for the code inside the block."""
+    metrics = metrics or RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def activate(metrics):
+    """Activate metrics until deactivate(token) (for before/after request hooks)."""
+    return _current.set(metrics)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    return _current.get()
+
+
+def stage(name):
+    """Context manager timing a stage of the active request (no-op if none)."""
+    metrics = _current.get()
+    if metrics is None:
+        return _NO_STAGE
+    return metrics.stage(name)
+
+
+def switch_stage(name):
+    """Start attributing time to a stage until the next switch or the enclosing stage ends."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.switch(name)
+
+
+def count(name, n=1):
+    """Add to a work counter of the active request (no-op if none)."""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.count(name, n)
+
+
+def counting():
+    """True if a request is collecting metrics (to skip computing counts otherwise)."""
+    return _current.get() is not None
@@ -0,0 +1,75 @@
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+
+
+# ----------------------------------------
+# Worker pool for independent schedule groups
+# ----------------------------------------
+# Groups smaller than PARALLEL_MIN_GROUP_SIZE records run inline in the
+# calling process: below that size pickling the records to a worker costs
+# more than labeling them. Set DTR_WORKERS=0 to disable the pool entirely.
+
+PARALLEL_MIN_GROUP_SIZE = int(os.environ.get("DTR_PARALLEL_MIN_GROUP_SIZE", "2000"))
+MAX_WORKERS = int(os.environ.get("DTR_WORKERS", str(os.cpu_count() or 1)))
+
+_pool = None
+
+
+def get_pool():
+    """Return the shared process pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        # Start the resource tracker first so the workers share it: shared
+        # memory they attach to (logics/sharedmem.py) is then only freed by
+        # the process that created it
+        resource_tracker.ensure_running()
+        _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        atexit.register(shutdown_pool)
+    return _pool
+
+
+def shutdown_pool():
+    """Shut down the shared process pool (if it was started)."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def map_groups(func, groups, min_size=None):
+    """
+    Run func(records, schedule) for every (records, schedule) pair in groups
+    and return the results in the same order.
+
+    Large groups are submitted to the worker pool first, then the small ones
+    run inline while the workers are busy. Nothing is dispatched when there is
+    only one group, only small groups, or the pool is disabled.
+    """
+    if min_size is None:
+        min_size = PARALLEL_MIN_GROUP_SIZE
+
+    groups = list(groups)
+    big = [i for i, (records, _) in enumerate(groups) if len(records) >= min_size]
+    if MAX_WORKERS <= 1 or len(groups) < 2 or not big:
+        return [func(records, schedule) for records, schedule in groups]
+
+    pool = get_pool()
+    # Biggest groups first so the longest jobs start earliest
+    big.sort(key=lambda i: len(groups[i][0]), reverse=True)
+    futures = {i: pool.submit(func, *groups[i]) for i in big}
+
+    results = [None] * len(groups)
+    try:
+        for i, (records, schedule) in enumerate(groups):
+            if i not in futures:
+                results[i] = func(records, schedule)
+        for i, future in futures.items():
+            results[i] = future.result()
+    except BaseException:
+        # e.g. a deadline (logics/deadline.py): don't leave queued groups for the workers
+        for future in futures.values():
+            future.cancel()
+        raise
+    return results
@@ -0,0 +1,295 @@
+import os
+from functools import partial
+
+from .deadline import checked, current_deadline, deadline_scope
+from .metrics import count, stage
+from .parallel import MAX_WORKERS, map_groups
+from .punchlog import LABEL_CODES, LABELS, datetime_to_minute, minute_to_datetime
+from .sharedmem import SHARED_MEMORY, SharedRecords
+from .window import _schedule_grouper
+
+
+# ----------------------------------------
+# Date partitions for long histories
+# ----------------------------------------
+# map_groups() only parallelizes across schedule groups, so one employee's
+# multi-year history on a single schedule runs on one core. For inputs of at
+# least two partitions, execute_logic1 / execute_logic2 cut the (time
+# ordered) records into one contiguous date range per worker. Each worker
+# parses, groups and labels its range like the engine does, and returns
+# per schedule group:
+#   head/tail  the prepared records of its first and last shift
+#   body       the labels of every shift in between, which can't change
+# The parent stitches the partitions back together: at each partition edge
+# it applies the engine's shift boundary rule to the last open shift and
+# the next head (the overlap window). A shift crossing the edge (an
+# overnight shift, or one the engine chains across days) is labeled from
+# the records of both sides, the same as in a sequential run.
+#
+# Record strings go to the workers in shared memory (logics/sharedmem.py):
+# workers write label codes and the output order into the block and return
+# record indexes instead of records, so only the parent builds labeled
+# records. Compact (datetime) input is pickled as before.
+#
+# Records that turn out not to be in time order (the edges of neighbouring
+# partitions overlap) are labeled sequentially instead. DTR_PARTITION_SIZE
+# sets the records per partition (0 disables partitioning).
+
+PARTITION_SIZE = int(os.environ.get("DTR_PARTITION_SIZE", "25000"))
+
+
+def _partition_shifts(manager, records, schedules):
+    """
+    Parse and group one partition's records like the engine and split each
+    group into shifts: [(group key, shifts)] in first-seen group order.
+    """
+    group_of = _schedule_grouper(manager, schedules)
+
+    groups = {}
+    for orig in checked(records, "parsing"):
+        dt = manager.parse_record_datetime(orig)
+        key, compiled = group_of(dt)
+        if compiled is None:
+            continue
+        groups.setdefault(key, (compiled, []))[1].append(manager.prepare_record(orig, dt, compiled))
+
+    result = []
+    for key, (compiled, recs) in groups.items():
+        recs.sort(key=lambda x: x["dt"])
+        shifts = [[recs[0]]]
+        for i in checked(range(1, len(recs)), "shift labeling"):
+            if manager.is_shift_boundary(recs[i - 1]["dt"], recs[i]["dt"], compiled):
+                shifts.append([recs[i]])
+            else:
+                shifts[-1].append(recs[i])
+        result.append((key, shifts))
+    return result
+
+
+def _label_partition(manager_class, label_method, records, schedules, deadline=None):
+    """
+    Label one partition: [(group key, piece)] in first-seen group order.
+    Module level so worker processes can run it.
+    """
+    with deadline_scope(deadline):
+        manager = manager_class()
+        label_shift = getattr(manager, label_method)
+
+        pieces = []
+        for key, shifts in _partition_shifts(manager, records, schedules):
+            single = len(shifts) == 1
+            pieces.append((key, {
+                "first_dt": shifts[0][0]["dt"],
+                "last_dt": shifts[-1][-1]["dt"],
+                "head": shifts[0],
+                "head_labels": None if single else label_shift(shifts[0]),
+                "body": [pair for shift in shifts[1:-1] for pair in label_shift(shift)],
+                "tail": None if single else shifts[-1]
+            }))
+        return pieces
+
+
+class _IndexedRecord(str):
+    """A record string that remembers its slot (index) in the shared block."""
+
+
+def _label_shared_partition(manager_class, label_method, indexes, shared, deadline=None):
+    """
+    Label the records at indexes of a SharedRecords block. The labels (and
+    the minutes of the records the parent reads back) go into the block; the
+    pieces hold record indexes and spans of the block's output order instead
+    of records.
+    """
+    try:
+        with deadline_scope(deadline):
+            manager = manager_class()
+            label_shift = getattr(manager, label_method)
+            minutes, codes, order = shared.minutes, shared.codes, shared.order
+            position = indexes.start
+
+            def write_labels(shifts):
+                nonlocal position
+                start = position
+                for shift in shifts:
+                    for dt, labeled in label_shift(shift):
+                        # The labelers pass the record string through, slot and all
+                        i = labeled["record"].slot
+                        minutes[i] = datetime_to_minute(dt)
+                        codes[i] = LABEL_CODES[labeled["label"]]
+                        order[position] = i
+                        position += 1
+                return start, position
+
+            def write_records(shift):
+                for rec in shift:
+                    minutes[rec["orig"].slot] = datetime_to_minute(rec["dt"])
+                return [rec["orig"].slot for rec in shift]
+
+            records = []
+            for i in indexes:
+                record = _IndexedRecord(shared.record(i))
+                record.slot = i
+                records.append(record)
+
+            pieces = []
+            for key, shifts in _partition_shifts(manager, records, shared.schedules):
+                single = len(shifts) == 1
+                pieces.append((key, {
+                    "first_dt": shifts[0][0]["dt"],
+                    "last_dt": shifts[-1][-1]["dt"],
+                    "head": write_records(shifts[0]),
+                    "head_labels": None if single else write_labels(shifts[:1]),
+                    "body": write_labels(shifts[1:-1]),
+                    "tail": None if single else write_records(shifts[-1])
+                }))
+            return pieces
+    finally:
+        shared.detach()
+
+
+def _read_shared_piece(manager, shared, recorded_times, compiled, piece):
+    """
+    Turn a piece from _label_shared_partition back into the pickled form,
+    with (epoch minute, labeled record) pairs built from the label codes.
+    """
+    minutes, codes, order = shared.minutes, shared.codes, shared.order
+
+    def records(indexes):
+        return [manager.prepare_record(recorded_times[i], minute_to_datetime(minutes[i]), compiled)
+                for i in indexes]
+
+    def labels(span):
+        pairs = []
+        for position in range(*span):
+            i = order[position]
+            record = recorded_times[i]
+            parts = record.split(" - ")
+            # The weekday the labelers emit (see prepare_record())
+            weekday = parts[0] if len(parts) == 3 else manager.format_date_with_day(minute_to_datetime(minutes[i]))
+            pairs.append((minutes[i], {"record": record, "weekday": weekday, "label": LABELS[codes[i]]}))
+        return pairs
+
+    return dict(piece,
+                head=records(piece["head"]),
+                head_labels=None if piece["head_labels"] is None else labels(piece["head_labels"]),
+                body=labels(piece["body"]),
+                tail=None if piece["tail"] is None else records(piece["tail"]))
+
+
+def _minute_keyed(label_shift):
+    """label_shift() with its pairs keyed by epoch minute, like the labels read back from shared memory."""
+    def label(shift_recs):
+        return [(datetime_to_minute(dt), labeled) for dt, labeled in label_shift(shift_recs)]
+    return label
+
+
+class _GroupStitch:
+    """One schedule group's labels so far, and its shift still open at the last partition edge."""
+
+    def __init__(self, manager, label_shift, compiled):
+        self.manager = manager
+        self.label_shift = label_shift
+        self.compiled = compiled
+        self.labels = []  # (datetime, labeled_record) pairs
+        self.open_shift = []
+        self.last_dt = None
+
+    def add(self, piece):
+        head = piece["head"]
+        crosses = self.open_shift and not self.manager.is_shift_boundary(
+            self.open_shift[-1]["dt"], head[0]["dt"], self.compiled)
+        self.last_dt = piece["last_dt"]
+
+        if piece["tail"] is None:
+            # The whole partition is one shift, which may go on in the next one
+            if crosses:
+                self.open_shift.extend(head)
+            else:
+                self.close()
+                self.open_shift = list(head)
+            return
+
+        if crosses:
+            # The open shift runs across the edge: label it with the head's records
+            self.labels.extend(self.label_shift(self.open_shift + head))
+        else:
+            self.close()
+            self.labels.extend(piece["head_labels"])
+        self.labels.extend(piece["body"])
+        self.open_shift = piece["tail"]
+
+    def close(self):
+        if self.open_shift:
+            self.labels.extend(self.label_shift(self.open_shift))
+            self.open_shift = []
+
+
+def label_partitioned(manager_class, label_method, recorded_times, schedule_or_schedules):
+    """
+    Label records in date partitions on the worker pool. label_method is the
+    manager method labeling one shift's prepared records. Returns the
+    labeled records in the engine's order, or None when the input is too
+    small, the pool is disabled or the records are not in time order (the
+    caller then labels sequentially).
+    """
+    if PARTITION_SIZE <= 0 or MAX_WORKERS <= 1 or len(recorded_times) < 2 * PARTITION_SIZE:
+        return None
+
+    manager = manager_class()
+    partitions = min(MAX_WORKERS, len(recorded_times) // PARTITION_SIZE)
+    bounds = [len(recorded_times) * i // partitions for i in range(partitions + 1)]
+
+    # Don't start the workers for records that are visibly out of order
+    parse = manager.parse_record_datetime
+    if any(parse(recorded_times[i - 1]) > parse(recorded_times[i]) for i in bounds[1:-1]):
+        return None
+
+    shared = None
+    if SHARED_MEMORY and all(isinstance(record, str) for record in recorded_times):
+        try:
+            shared = SharedRecords.create(recorded_times, schedule_or_schedules)
+        except OSError as e:
+            print(f"PARTITION: Shared memory unavailable ({e}), pickling the partitions")
+
+    try:
+        with stage("label"):
+            ranges = list(zip(bounds, bounds[1:]))
+            if shared is not None:
+                label = partial(_label_shared_partition, manager_class, label_method, deadline=current_deadline())
+                parts = map_groups(label, [(range(start, end), shared) for start, end in ranges], min_size=0)
+            else:
+                label = partial(_label_partition, manager_class, label_method, deadline=current_deadline())
+                parts = map_groups(label, [(recorded_times[start:end], schedule_or_schedules)
+                                           for start, end in ranges], min_size=0)
+        count("partitions", partitions)
+
+        label_shift = getattr(manager, label_method)
+        if shared is not None:
+            label_shift = _minute_keyed(label_shift)
+        group_of = _schedule_grouper(manager, schedule_or_schedules)
+        groups = {}
+        for pieces in parts:
+            for key, piece in pieces:
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = _GroupStitch(manager, label_shift, group_of(piece["first_dt"])[1])
+                elif piece["first_dt"] < group.last_dt:
+                    print(f"PARTITION: Records are not in time order, labeling {len(recorded_times)} records sequentially")
+                    return None
+                if shared is not None:
+                    piece = _read_shared_piece(manager, shared, recorded_times, group.compiled, piece)
+                group.add(piece)
+    finally:
+        if shared is not None:
+            shared.close()
+
+    labels = []
+    for group in groups.values():
+        group.close()
+        labels.extend(group.labels)
+    if len(groups) > 1:
+        # Like the engine: the groups' labels in time order, ties in first-seen group order
+        with stage("sort"):
+            labels.sort(key=lambda pair: pair[0])
+        count("sorts")
+    return [labeled for _, labeled in labels]
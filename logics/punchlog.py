@@ -0,0 +1,341 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+
+
+# ----------------------------------------
+# Binary punch log format
+# ----------------------------------------
+# A punch log is a fixed-width, column oriented file:
+#
+#   header   : magic (8s) | version (H) | flags (H) | count (I)   -> 16 bytes
+#   column 1 : employee ids, uint32 * count
+#   column 2 : epoch minutes, int32 * count (minutes since 01/01/1970 00:00,
+#              wall clock time, no timezone)
+#   column 3 : label codes, uint8 * count (0 = no label)
+#
+# That is 9 bytes per punch instead of ~35 for the JSON strings, and since
+# every column is a flat array the reader can cast the mapped file straight
+# into typed memoryviews without parsing anything.
+
+MAGIC = b"DTRPUNCH"
+VERSION = 1
+FLAG_BIG_ENDIAN = 0x0001
+HEADER = struct.Struct("<8sHHI")
+
+EPOCH = datetime(1970, 1, 1)
+
+# Label codes stored in the third column. Index in this tuple == code.
+LABELS = (
+    None,
+    "Time In",
+    "Time Out",
+    "Break Out",
+    "Break In",
+    "Overtime Start",
+    "Overtime End",
+    "Time In (Early)",
+    "Time In (Late)",
+    "Time Out (Overtime)",
+)
+LABEL_CODES = {label: code for code, label in enumerate(LABELS) if label}
+
+
+class ParsedRecord(str):
+    """
+    A record string carrying its parsed datetime (.dt): the engines label it
+    like the string it is, but take the datetime instead of parsing it.
+    """
+
+    def __new__(cls, record, dt):
+        self = super().__new__(cls, record)
+        self.dt = dt
+        return self
+
+    def __reduce__(self):
+        return ParsedRecord, (str(self), self.dt)
+
+
+class MinuteRecords(Sequence):
+    """
+    Sorted punches kept as an epoch-minute column (and the original strings,
+    if any), e.g. a stored dataset. stream.label_minutes() labels the column
+    directly; read as a sequence, the items are datetimes (or ParsedRecords),
+    made one at a time.
+    """
+
+    def __init__(self, minutes, originals=None):
+        self.minutes = minutes
+        self.originals = originals
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        dt = minute_to_datetime(self.minutes[index])
+        return dt if self.originals is None else ParsedRecord(self.originals[index], dt)
+
+    def __iter__(self):
+        if self.originals is None:
+            return map(minute_to_datetime, self.minutes)
+        return map(ParsedRecord, self.originals, map(minute_to_datetime, self.minutes))
+
+
+def datetime_to_minute(dt):
+    """Convert a datetime into minutes since the epoch."""
+    return (dt - EPOCH) // timedelta(minutes=1)
+
+
+def minute_to_datetime(minute):
+    """Convert minutes since the epoch back into a datetime."""
+    return EPOCH + timedelta(minutes=minute)
+
+
+def format_record(dt):
+    """
+    Format a datetime as a record string "Day - DD/MM/YYYY - H:MM AM/PM",
+    the same shape the browser produces.
+    """
+    hour = dt.hour % 12 or 12
+    return f"{dt.strftime('%A')} - {dt.strftime('%d/%m/%Y')} - {hour}:{dt.minute:02d} {'AM' if dt.hour < 12 else 'PM'}"
+
+
+def parse_record_minute(record_str):
+    """
+    Parse a record string in either the "DD/MM/YYYY - HH:MM AM/PM" or
+    "Day - DD/MM/YYYY - HH:MM AM/PM" format into an epoch minute.
+    """
+    parts = record_str.split(" - ")
+    if len(parts) == 2:
+        date_part, time_part = parts
+    elif len(parts) == 3:
+        date_part, time_part = parts[1], parts[2]
+    else:
+        raise ValueError(f"Invalid record format: {record_str}")
+    dt = datetime.strptime(f"{date_part} - {time_part}", "%d/%m/%Y - %I:%M %p")
+    return datetime_to_minute(dt)
+
+
+def _release(*views):
+    """Release memoryview slices so the mapping can be closed."""
+    for view in views:
+        if isinstance(view, memoryview):
+            view.release()
+
+
+class PunchLog:
+    """
+    Memory-mapped reader for a binary punch log.
+
+    The `employee_ids`, `minutes` and `labels` attributes are memoryviews over
+    the mapped file, so nothing is copied or parsed when a log is opened.
+    Records are sorted by (employee id, minute) by the writer, which lets
+    `select()` find one employee's punches with a binary search.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            size = self._file.seek(0, 2)
+            if size < HEADER.size:
+                raise ValueError(f"Not a punch log: {path}")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic, version, flags, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a punch log: {path}")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Unsupported punch log version: {version}")
+        if size < HEADER.size + 9 * count:
+            self.close()
+            raise ValueError(f"Truncated punch log: {path}")
+
+        self.count = count
+        view = memoryview(self._mmap)
+        ids_off = HEADER.size
+        min_off = ids_off + 4 * count
+        lbl_off = min_off + 4 * count
+
+        file_big_endian = bool(flags & FLAG_BIG_ENDIAN)
+        if file_big_endian == (sys.byteorder == "big"):
+            # Native byte order: zero-copy views straight into the mapping
+            self.employee_ids = view[ids_off:min_off].cast("I")
+            self.minutes = view[min_off:lbl_off].cast("i")
+        else:
+            # Foreign byte order: fall back to a swapped in-memory copy
+            self.employee_ids = array("I")
+            self.employee_ids.frombytes(view[ids_off:min_off])
+            self.employee_ids.byteswap()
+            self.minutes = array("i")
+            self.minutes.frombytes(view[min_off:lbl_off])
+            self.minutes.byteswap()
+        self.labels = view[lbl_off:lbl_off + count]
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        """Release the memoryviews and unmap the file."""
+        for name in ("employee_ids", "minutes", "labels"):
+            value = getattr(self, name, None)
+            if isinstance(value, memoryview):
+                value.release()
+            setattr(self, name, None)
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def _bisect(self, employee_id, right=False):
+        lo, hi = 0, self.count
+        ids = self.employee_ids
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[mid] < employee_id or (right and ids[mid] == employee_id):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def employees(self):
+        """Return the distinct employee ids in the log, in file order."""
+        result = []
+        i = 0
+        while i < self.count:
+            employee_id = self.employee_ids[i]
+            result.append(employee_id)
+            i = self._bisect(employee_id, right=True)
+        return result
+
+    def select(self, employee_id=None):
+        """
+        Return (minutes, labels) memoryview slices for one employee, or for
+        the whole log if employee_id is None. The slices share the mapping.
+        """
+        if employee_id is None:
+            return self.minutes[:], self.labels[:]
+        lo = self._bisect(employee_id)
+        hi = self._bisect(employee_id, right=True)
+        return self.minutes[lo:hi], self.labels[lo:hi]
+
+    def recorded_times(self, employee_id=None):
+        """Format one employee's punches as `recordedTimes` strings."""
+        minutes, labels = self.select(employee_id)
+        records = [format_record(minute_to_datetime(m)) for m in minutes]
+        _release(minutes, labels)
+        return records
+
+
+# ----------------------------------------
+# Writer and converters
+# ----------------------------------------
+def write_punchlog(path, punches):
+    """
+    Write a punch log. `punches` is an iterable of
+    (employee_id, epoch_minute, label_code) tuples in any order.
+    Returns the number of records written.
+    """
+    rows = sorted(punches, key=lambda p: (p[0], p[1]))
+    ids = array("I", (p[0] for p in rows))
+    minutes = array("i", (p[1] for p in rows))
+    labels = array("B", (p[2] for p in rows))
+
+    flags = FLAG_BIG_ENDIAN if sys.byteorder == "big" else 0
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, flags, len(rows)))
+        ids.tofile(f)
+        minutes.tofile(f)
+        labels.tofile(f)
+    return len(rows)
+
+
+def json_to_punchlog(data, path, employee_id=0):
+    """
+    Convert a `recordedTimes` JSON document (a dict, or a path to a file) into
+    a punch log. Entries may be plain record strings or labeled records
+    ({"record": ..., "label": ...}); labeledRecords are accepted as well.
+    """
+    if isinstance(data, str):
+        with open(data, "r") as f:
+            data = json.load(f)
+
+    entries = data.get("recordedTimes")
+    if entries is None:
+        entries = data.get("labeledRecords", [])
+
+    punches = []
+    for entry in entries:
+        label_code = 0
+        if isinstance(entry, dict):
+            label_code = LABEL_CODES.get(entry.get("label"), 0)
+            entry = entry.get("record", "")
+        punches.append((employee_id, parse_record_minute(entry), label_code))
+
+    return write_punchlog(path, punches)
+
+
+def punchlog_to_json(path, employee_id=None):
+    """
+    Convert a punch log back into a `recordedTimes` document. When any punch
+    carries a label, the labels are returned as `labeledRecords` as well.
+    """
+    with PunchLog(path) as log:
+        minutes, labels = log.select(employee_id)
+        recorded_times = [format_record(minute_to_datetime(m)) for m in minutes]
+        data = {"recordedTimes": recorded_times}
+        if any(labels):
+            data["labeledRecords"] = [
+                {
+                    "record": record,
+                    "weekday": record.rsplit(" - ", 1)[0],
+                    "label": LABELS[code] if code < len(LABELS) else None
+                }
+                for record, code in zip(recorded_times, labels)
+            ]
+        # Drop the slices before the mapping is closed
+        _release(minutes, labels)
+    return data
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert between recordedTimes JSON and binary punch logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    to_bin = sub.add_parser("to-bin", help="JSON -> punch log")
+    to_bin.add_argument("source")
+    to_bin.add_argument("target")
+    to_bin.add_argument("--employee-id", type=int, default=0)
+
+    to_json = sub.add_parser("to-json", help="punch log -> JSON")
+    to_json.add_argument("source")
+    to_json.add_argument("target")
+    to_json.add_argument("--employee-id", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "to-bin":
+        written = json_to_punchlog(args.source, args.target, employee_id=args.employee_id)
+        print(f"PUNCHLOG: Wrote {written} records to {args.target}")
+    else:
+        with open(args.target, "w") as f:
+            json.dump(punchlog_to_json(args.source, employee_id=args.employee_id), f, indent=2)
+        print(f"PUNCHLOG: Wrote {args.target}")
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from .logic1 import TimeScheduleManager
+from .logic2 import OvertimeScheduleManager
+
+
+# ----------------------------------------
+# Compiled schedule registry
+# ----------------------------------------
+# /set_schedule validates and compiles a schedule set once and stores it
+# under an id derived from its content; execute calls then send the
+# schedule_id instead of the schedules. Compiling means:
+# - each schedule parsed by both engines (hours, day indices, multi-day /
+#   overnight flags, shift duration)
+# - a week table per engine mapping every minute of the week to the schedule
+#   group a punch at that time belongs to, so grouping a record is one array
+#   lookup instead of re-parsing every schedule's times for every record
+#
+# Sets live in a small in-process LRU backed by a directory of JSON files,
+# so all workers on a host share them. The directory is bounded as well:
+# the least recently used files are removed once it grows past the limit.
+
+SCHEDULE_STORE_DIR = os.environ.get("DTR_SCHEDULE_DIR", os.path.join(tempfile.gettempdir(), "dtr-schedules"))
+SCHEDULE_CACHE_SIZE = int(os.environ.get("DTR_SCHEDULE_CACHE_SIZE", "64"))
+SCHEDULE_STORE_SIZE = int(os.environ.get("DTR_SCHEDULE_STORE_SIZE", "1024"))
+
+REQUIRED_FIELDS = ("start_day", "start_time", "end_day", "end_time")
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+MINUTES_PER_DAY = 24 * 60
+
+ENGINES = {
+    "logic1": TimeScheduleManager,
+    "logic2": OvertimeScheduleManager
+}
+
+
+def validate_schedules(schedules):
+    """
+    Check a schedule list and return it normalized to the four schedule
+    fields. Raises ValueError describing the first invalid schedule.
+    """
+    if not isinstance(schedules, list) or not schedules:
+        raise ValueError("Schedules must be a non-empty list.")
+
+    manager = TimeScheduleManager()
+    normalized = []
+    for i, schedule in enumerate(schedules):
+        if not isinstance(schedule, dict) or not all(schedule.get(field) for field in REQUIRED_FIELDS):
+            raise ValueError(f'Each schedule must contain: {", ".join(REQUIRED_FIELDS)}')
+        for field in ("start_day", "end_day"):
+            if schedule[field] not in DAY_NAMES:
+                raise ValueError(f"Schedule {i + 1}: invalid {field} {schedule[field]!r}")
+        for field in ("start_time", "end_time"):
+            manager.parse_time_12_or_24(schedule[field])  # raises ValueError
+        normalized.append({field: schedule[field].strip() for field in REQUIRED_FIELDS})
+    return normalized
+
+
+def schedule_set_id(schedules):
+    """Content-derived id of a normalized schedule list (order matters: first match wins)."""
+    canonical = json.dumps(schedules, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def build_week_table(manager, schedules):
+    """
+    Map each minute of the week to the index of the schedule
+    manager.get_schedule_group() picks for it (-1 for none).
+
+    Schedule matching compares the time of day against each schedule's
+    start/end with <= and >=, so the result can only change at a start/end
+    minute or the minute after it. Only those minutes are evaluated; the
+    rest of the day is filled in from the last one.
+    """
+    critical = {0}
+    for schedule in schedules:
+        for field in ("start_time", "end_time"):
+            minute = round(manager.parse_time_12_or_24(schedule[field]) * 60) % MINUTES_PER_DAY
+            critical.update((minute, (minute + 1) % MINUTES_PER_DAY))
+    critical = sorted(critical)
+
+    index_by_key = {}
+    for i, schedule in enumerate(schedules):
+        index_by_key.setdefault(manager.get_schedule_key(schedule), i)
+
+    # 01/01/2024 is a Monday
+    week_start = datetime(2024, 1, 1)
+
+    table = array("h", [-1]) * (7 * MINUTES_PER_DAY)
+    for day in range(7):
+        bounds = critical + [MINUTES_PER_DAY]
+        for start, end in zip(bounds, bounds[1:]):
+            dt = week_start + timedelta(days=day, minutes=start)
+            key, _ = manager.get_schedule_group(dt, list(schedules))
+            index = index_by_key.get(key, -1)
+            offset = day * MINUTES_PER_DAY
+            table[offset + start:offset + end] = array("h", [index]) * (end - start)
+    return table
+
+
+class CompiledScheduleSet(list):
+    """
+    A validated schedule list plus its compiled form. It is still a list of
+    schedule dicts, so it can be passed anywhere schedules are accepted; the
+    engines use lookup_group() for it instead of matching every schedule.
+    """
+
+    def __init__(self, schedules, schedule_id, compiled=None, tables=None):
+        super().__init__(schedules)
+        self.schedule_id = schedule_id
+        self.compiled = compiled or {
+            logic: [manager_class().compile_schedule(schedule) for schedule in schedules]
+            for logic, manager_class in ENGINES.items()
+        }
+        self.tables = tables or {
+            logic: build_week_table(manager_class(), schedules)
+            for logic, manager_class in ENGINES.items()
+        }
+        self.keys = [TimeScheduleManager().get_schedule_key(schedule) for schedule in schedules]
+
+    def lookup_group(self, manager, dt):
+        """Return (schedule_key, schedule) for dt, like manager.get_schedule_group()."""
+        logic = "logic2" if isinstance(manager, OvertimeScheduleManager) else "logic1"
+        index = self.tables[logic][dt.weekday() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute]
+        if index < 0:
+            return None, None
+        return self.keys[index], self[index]
+
+    def copy_schedules(self):
+        """Plain copies of the schedules, for code that annotates schedule dicts."""
+        return [dict(schedule) for schedule in self]
+
+    def describe(self):
+        """Per-schedule summary of the compiled values, for /set_schedule responses."""
+        return [
+            dict(schedule,
+                 shift_hours=round(logic1["shift_duration"], 2),
+                 multi_day=logic1["is_multi_day"],
+                 overnight=logic2["is_overnight"])
+            for schedule, logic1, logic2 in zip(self, self.compiled["logic1"], self.compiled["logic2"])
+        ]
+
+    def to_json(self):
+        return {
+            "schedule_id": self.schedule_id,
+            "schedules": list(self),
+            "compiled": self.compiled,
+            "tables": {logic: table.tolist() for logic, table in self.tables.items()}
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data["schedules"],
+            data["schedule_id"],
+            compiled=data["compiled"],
+            tables={logic: array("h", table) for logic, table in data["tables"].items()}
+        )
+
+
+class ScheduleRegistry:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ScheduleRegistry, cls).__new__(cls)
+            cls._instance._cache = OrderedDict()
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def register(self, schedules):
+        """
+        Validate and compile a schedule list, store it and return the
+        CompiledScheduleSet. Registering the same schedules again is cheap.
+        """
+        schedules = validate_schedules(schedules)
+        schedule_id = schedule_set_id(schedules)
+
+        compiled = self.get(schedule_id)
+        if compiled is None:
+            compiled = CompiledScheduleSet(schedules, schedule_id)
+            self._remember(compiled)
+            self._store(compiled)
+            print(f"SCHEDULE_REGISTRY: Compiled schedule set {schedule_id} ({len(schedules)} schedules)")
+        return compiled
+
+    def get(self, schedule_id):
+        """Return the CompiledScheduleSet for an id, or None if it is unknown."""
+        with self._lock:
+            compiled = self._cache.get(schedule_id)
+            if compiled is not None:
+                self._cache.move_to_end(schedule_id)
+                return compiled
+
+        compiled = self._load(schedule_id)
+        if compiled is not None:
+            self._remember(compiled)
+        return compiled
+
+    def _remember(self, compiled):
+        with self._lock:
+            self._cache[compiled.schedule_id] = compiled
+            self._cache.move_to_end(compiled.schedule_id)
+            while len(self._cache) > SCHEDULE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def _path(self, schedule_id):
+        return os.path.join(SCHEDULE_STORE_DIR, f"{schedule_id}.json")
+
+    def _load(self, schedule_id):
+        if not schedule_id or not all(c in "0123456789abcdef" for c in schedule_id):
+            return None
+        path = self._path(schedule_id)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            os.utime(path)  # mark as recently used for the store's LRU
+        except (OSError, ValueError):
+            return None
+        return CompiledScheduleSet.from_json(data)
+
+    def _store(self, compiled):
+        try:
+            os.makedirs(SCHEDULE_STORE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=SCHEDULE_STORE_DIR, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(compiled.to_json(), f)
+            os.replace(tmp_path, self._path(compiled.schedule_id))
+            self._prune()
+        except OSError as e:
+            # The in-process cache still has it; other workers will recompile
+            print(f"SCHEDULE_REGISTRY: Could not store {compiled.schedule_id}: {e}")
+
+    def _prune(self):
+        """Remove the least recently used files beyond SCHEDULE_STORE_SIZE."""
+        entries = []
+        for name in os.listdir(SCHEDULE_STORE_DIR):
+            if name.endswith(".json"):
+                path = os.path.join(SCHEDULE_STORE_DIR, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - SCHEDULE_STORE_SIZE)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,136 @@
+import os
+from array import array
+from itertools import accumulate
+from multiprocessing.shared_memory import SharedMemory
+
+
+# ----------------------------------------
+# Shared-memory transport for the worker pool
+# ----------------------------------------
+# Handing a partition to a worker process used to pickle its record strings
+# on the way in and (datetime, labeled record) pairs on the way out, which
+# adds about a third to the labeling time of long histories. A SharedRecords
+# block holds one run in a single multiprocessing.shared_memory segment, laid
+# out in columns like the punch log (logics/punchlog.py):
+#
+#   offsets : int64 * (count + 1)   start of each record string in text
+#   minutes : int32 * count         epoch minutes, written by the workers
+#   order   : int32 * count         record indexes in the engine's output order
+#   tables  : int16 * 10080 each    week tables of a registered schedule set
+#   codes   : uint8 * count         label codes (punch log codes), by record
+#   text    : the record strings, UTF-8
+#
+# Workers get a small handle (the segment name and sizes, plus the schedules
+# without their week tables), attach to the segment without copying it, and
+# write parsed minutes and label codes straight into the columns. The parent
+# turns codes back into labeled records at the edge. DTR_SHARED_MEMORY=0
+# falls back to pickling.
+
+SHARED_MEMORY = os.environ.get("DTR_SHARED_MEMORY", "1").lower() in ("1", "true", "yes")
+
+MINUTES_PER_WEEK = 7 * 24 * 60
+
+
+class SharedRecords:
+    """
+    Record strings and the per-record result columns of one run, in shared
+    memory. The parent creates it with create() and close()s it (which also
+    frees the segment); unpickling it in a worker attaches to the segment.
+    """
+
+    def __init__(self, shm, count, text_size, schedules, table_logics, owner):
+        # With week tables in the segment, schedules is the rest of the set:
+        # (set class, schedule dicts, schedule id, compiled schedules)
+        self.shm = shm
+        self.count = count
+        self.text_size = text_size
+        self.table_logics = table_logics
+        self.owner = owner
+        self._schedules = schedules
+        self._views = []
+
+        offset = 0
+
+        def column(typecode, length):
+            nonlocal offset
+            itemsize = array(typecode).itemsize
+            view = shm.buf[offset:offset + itemsize * length]
+            offset += itemsize * length
+            self._views.append(view)
+            if typecode == "B":
+                return view
+            cast = view.cast(typecode)
+            self._views.append(cast)
+            return cast
+
+        self.offsets = column("q", count + 1)
+        self.minutes = column("i", count)
+        self.order = column("i", count)
+        tables = {logic: column("h", MINUTES_PER_WEEK) for logic in table_logics}
+        self.codes = column("B", count)
+        self.text = column("B", text_size)
+
+        if tables:
+            # A registered schedule set (logics/registry.py) reading its week tables from the segment
+            set_class, items, schedule_id, compiled = schedules
+            self.schedules = set_class(items, schedule_id, compiled=compiled, tables=tables)
+        else:
+            self.schedules = schedules
+
+    @classmethod
+    def create(cls, recorded_times, schedules):
+        """Copy record strings (and a registered set's week tables) into a new segment."""
+        encoded = [record.encode("utf-8") for record in recorded_times]
+        offsets = array("q", accumulate((len(record) for record in encoded), initial=0))
+        table_logics = list(getattr(schedules, "tables", {}))
+        if table_logics:
+            schedules_arg = (type(schedules), list(schedules), schedules.schedule_id, schedules.compiled)
+        else:
+            schedules_arg = schedules
+
+        count = len(encoded)
+        size = cls._size(count, offsets[-1], len(table_logics))
+        shm = SharedMemory(create=True, size=max(1, size))
+        shared = cls(shm, count, offsets[-1], schedules_arg, table_logics, owner=True)
+        try:
+            shared.offsets[:] = offsets
+            for logic in table_logics:
+                shared.schedules.tables[logic][:] = schedules.tables[logic]
+            shared.text[:] = b"".join(encoded)
+        except BaseException:
+            shared.close()
+            raise
+        return shared
+
+    @staticmethod
+    def _size(count, text_size, tables):
+        return 8 * (count + 1) + 4 * count * 2 + 2 * MINUTES_PER_WEEK * tables + count + text_size
+
+    def record(self, index):
+        """The record string at index."""
+        return str(self.text[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __reduce__(self):
+        # Workers get the segment name; the week tables stay in the segment
+        return _attach, (self.shm.name, self.count, self.text_size, self._schedules, self.table_logics)
+
+    def close(self):
+        """Release the views and detach; the owner also frees the segment."""
+        if self.shm is None:
+            return
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def detach(self):
+        """Detach a worker's attachment (the owner keeps the segment until close())."""
+        if not self.owner:
+            self.close()
+
+
+def _attach(name, count, text_size, schedules, table_logics):
+    return SharedRecords(SharedMemory(name=name), count, text_size, schedules, table_logics, owner=False)
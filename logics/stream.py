@@ -0,0 +1,147 @@
+import heapq
+from datetime import datetime
+
+from .deadline import checked
+from .logic1 import TimeScheduleManager
+from .logic2 import OvertimeScheduleManager
+from .punchlog import ParsedRecord, format_record, minute_to_datetime
+from .window import _schedule_grouper
+
+
+# ----------------------------------------
+# Streaming engine API
+# ----------------------------------------
+# iter_labels() labels an unbounded, already sorted stream of punches with
+# the same schedule grouping and shift boundary rules as execute_logic1 /
+# execute_logic2, but only holds the open shift of each schedule group in
+# memory. A shift is labeled as soon as the next punch in its group starts a
+# new shift (or the stream ends), since no later punch can change it.
+#
+#     for labeled in iter_labels(read_punches(), schedules, logic="logic2"):
+#         ...
+#
+# label_minutes() is the batch entry point for punches that are already an
+# epoch-minute column in time order (a punch log's PunchLog.minutes, or a
+# stored dataset): it labels the column as it is, with no parse or sort
+# phase, and returns what execute_logic1 / execute_logic2 would.
+
+# logic name -> (manager class, method labeling one shift's prepared records)
+ENGINES = {
+    "logic1": (TimeScheduleManager, "_label_shift"),
+    "logic2": (OvertimeScheduleManager, "_sorted_shift_labels")
+}
+
+
+class _OpenShift:
+    """The records of one schedule group's current (not yet closed) shift."""
+
+    def __init__(self, order, compiled):
+        self.order = order  # first-seen order of the group, used to break ties
+        self.compiled = compiled
+        self.records = []
+
+
+def iter_labels(punches, schedules, logic="logic1", ordered=True):
+    """
+    Label a sorted iterable of punches and yield labeled records
+    ({"record", "weekday", "label"}) as each shift closes.
+
+    punches: record strings ("Monday - 24/03/2025 - 6:00 PM") or datetimes,
+        in chronological order. Raises ValueError on an out-of-order punch.
+    schedules: a single schedule dict or a list of schedules, as accepted by
+        execute_logic1 / execute_logic2.
+    ordered: with several schedule groups, hold closed shifts back until
+        every earlier open shift has closed, so the output is in time order
+        and matches execute_logic*. Set to False to emit each shift the
+        moment it closes (strictly one open shift per group in memory, but
+        shifts of different groups may interleave out of order).
+    """
+    if logic not in ENGINES:
+        raise ValueError(f"Unknown logic: {logic}")
+
+    manager = ENGINES[logic][0]()
+
+    def dated(punches):
+        for punch in punches:
+            if isinstance(punch, datetime):
+                yield punch, format_record(punch)
+            else:
+                yield manager.parse_record_datetime(punch), punch
+
+    return _label_sorted(manager, dated(punches), schedules, logic, ordered)
+
+
+def label_minutes(minutes, schedules, logic="logic1", originals=None):
+    """
+    Label punches given as a sorted column of epoch minutes (an array or
+    memoryview, read in place) and return the labeled records, in the order
+    and form execute_logic1 / execute_logic2 return them: "record" is the
+    punch's datetime, or its string in originals (a list lined up with
+    minutes) when given.
+    """
+    if logic not in ENGINES:
+        raise ValueError(f"Unknown logic: {logic}")
+
+    manager = ENGINES[logic][0]()
+
+    def dated(indexes):
+        for i in indexes:
+            dt = minute_to_datetime(minutes[i])
+            yield dt, dt if originals is None else ParsedRecord(originals[i], dt)
+
+    return list(_label_sorted(manager, dated(checked(range(len(minutes)), "labeling")), schedules, logic))
+
+
+def _label_sorted(manager, punches, schedules, logic, ordered=True):
+    """iter_labels() for (datetime, record) pairs."""
+    label_shift = getattr(manager, ENGINES[logic][1])
+    group_of = _schedule_grouper(manager, schedules)
+
+    open_shifts = {}
+    pending = []  # heap of (datetime, group order, seq, labeled) waiting for earlier shifts
+    seq = 0
+    last_dt = None
+
+    for dt, orig in punches:
+        if last_dt is not None and dt < last_dt:
+            raise ValueError(f"Punches must be sorted: {orig} comes after {format_record(last_dt)}")
+        last_dt = dt
+
+        key, compiled = group_of(dt)
+        if compiled is None:
+            continue
+
+        shift = open_shifts.get(key)
+        if shift is None:
+            shift = open_shifts[key] = _OpenShift(len(open_shifts), compiled)
+        elif shift.records and manager.is_shift_boundary(shift.records[-1]["dt"], dt, compiled):
+            # The group's shift is closed: no later punch can change its labels
+            shift_labels = label_shift(shift.records)
+            shift.records = []
+            if not ordered or len(open_shifts) == 1:
+                for _, labeled in shift_labels:
+                    yield labeled
+            else:
+                for label_dt, labeled in shift_labels:
+                    heapq.heappush(pending, (label_dt, shift.order, seq, labeled))
+                    seq += 1
+
+        shift.records.append(manager.prepare_record(orig, dt, compiled))
+
+        # Release held labels that sort before every open shift and before
+        # any punch still to come
+        if pending:
+            horizon = min(
+                (s.records[0]["dt"], s.order) for s in open_shifts.values() if s.records
+            )
+            while pending and pending[0][0] < last_dt and pending[0][:2] < horizon:
+                yield heapq.heappop(pending)[3]
+
+    # End of stream: every open shift is final now
+    for shift in open_shifts.values():
+        if shift.records:
+            for label_dt, labeled in label_shift(shift.records):
+                heapq.heappush(pending, (label_dt, shift.order, seq, labeled))
+                seq += 1
+    while pending:
+        yield heapq.heappop(pending)[3]
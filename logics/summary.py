@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta
+
+from .logic1 import TimeScheduleManager
+from .window import schedule_span_hours
+
+
+# ----------------------------------------
+# Timesheet aggregation
+# ----------------------------------------
+# Turns labeled punches into per-shift, per-day and per-week totals so the
+# browser (or a payroll export) doesn't have to receive every punch and add
+# up the minutes itself. Days and weeks are keyed by the date the shift
+# started, so an overnight shift counts towards the day it began.
+
+GRACE_MINUTES = 15  # same 15 minute grace the engines use
+OVERTIME_ATTACH_HOURS = 12.0  # Overtime Start this close to a Time Out extends that shift
+
+SUMMARY_FIELDS = ("worked_minutes", "break_minutes", "overtime_minutes", "late_count", "early_count")
+
+
+def _new_totals():
+    return {field: 0 for field in SUMMARY_FIELDS}
+
+
+def _minutes(start, end):
+    return max(0, int((end - start).total_seconds() // 60))
+
+
+def _schedule_list(schedules):
+    if isinstance(schedules, dict):
+        return schedules.get("schedules", [schedules])
+    return schedules or []
+
+
+class TimesheetSummarizer:
+    """
+    Walks labeled records in chronological order and builds shifts:
+    - "Time In*" opens a shift, "Time Out*" closes it
+    - "Break Out" / "Break In" pause and resume the clock
+    - "Overtime Start" / "Overtime End" (Logic 2) bracket overtime work,
+      attached to the preceding shift when it follows shortly after
+    - "Time Out (Overtime)" (Logic 3) counts the minutes past the scheduled end
+    Late/early counts come from "Time In (Late)" labels, or from the schedules
+    when given (Time In more than 15 minutes late, Time Out more than
+    15 minutes before the scheduled end).
+    """
+
+    def __init__(self, schedules=None):
+        self.manager = TimeScheduleManager()
+        self.schedules = {}
+        for schedule in _schedule_list(schedules):
+            if isinstance(schedule, dict) and schedule.get("start_day"):
+                # First schedule per start day wins, like the engines' fallbacks
+                self.schedules.setdefault(schedule["start_day"], schedule)
+
+    def scheduled_bounds(self, shift_start):
+        """Return the (start, end) datetimes of the schedule for a shift, or None."""
+        schedule = self.schedules.get(shift_start.strftime("%A"))
+        if not schedule:
+            return None
+        start_h = self.manager.parse_time_12_or_24(schedule.get("start_time") or "8:00 AM")
+        start = datetime.combine(shift_start.date(), datetime.min.time()) + timedelta(hours=start_h)
+        return start, start + timedelta(hours=schedule_span_hours(schedule))
+
+    def summarize(self, labeled_records):
+        """Aggregate labeled records ({"record", "label"[, "datetime"]}) into totals."""
+        events = []
+        for rec in labeled_records:
+            dt = rec.get("datetime")
+            if not isinstance(dt, datetime):
+                dt = self.manager.parse_record_datetime(rec["record"])
+            events.append((dt, rec.get("label") or ""))
+        events.sort(key=lambda x: x[0])
+
+        shifts = []
+        shift = None
+        working_since = None
+        break_since = None
+        in_overtime = False
+
+        def add_work(until):
+            minutes = _minutes(working_since, until)
+            shift["worked_minutes"] += minutes
+            if in_overtime:
+                shift["overtime_minutes"] += minutes
+
+        for dt, label in events:
+            if label.startswith("Time In"):
+                if shift and working_since:
+                    shift["incomplete"] = True
+                shift = self._open_shift(dt, shifts)
+                working_since, break_since, in_overtime = dt, None, False
+                if label == "Time In (Late)":
+                    shift["late_count"] = 1
+
+            elif label == "Overtime Start":
+                attach = (shift is not None and
+                          (dt - shift["_end"]).total_seconds() / 3600 <= OVERTIME_ATTACH_HOURS)
+                if not attach:
+                    shift = self._open_shift(dt, shifts)
+                elif working_since:
+                    add_work(dt)
+                working_since, break_since, in_overtime = dt, None, True
+
+            elif shift is None:
+                continue  # Nothing to attach a break or time out to
+
+            elif label == "Break Out":
+                if working_since:
+                    add_work(dt)
+                working_since, break_since = None, dt
+
+            elif label == "Break In":
+                if break_since:
+                    shift["break_minutes"] += _minutes(break_since, dt)
+                working_since, break_since = dt, None
+
+            elif label.startswith("Time Out") or label == "Overtime End":
+                if working_since:
+                    add_work(dt)
+                elif break_since:
+                    # Clocked out straight from a break: the break never ended
+                    shift["incomplete"] = True
+                working_since, break_since, in_overtime = None, None, False
+                shift["_end"] = dt
+                shift["end"] = dt.strftime("%d/%m/%Y %I:%M %p")
+                if label == "Time Out (Overtime)":
+                    bounds = self.scheduled_bounds(shift["_start"])
+                    if bounds:
+                        shift["overtime_minutes"] += _minutes(bounds[1], dt)
+                if label.startswith("Time Out"):
+                    self._check_early(shift, dt)
+                continue
+
+            shift["_end"] = dt
+
+        if shift and (working_since or break_since):
+            shift["incomplete"] = True
+
+        return self._rollup(shifts)
+
+    def _open_shift(self, dt, shifts):
+        shift = {
+            "date": dt.strftime("%d/%m/%Y"),
+            "day": dt.strftime("%A"),
+            "start": dt.strftime("%d/%m/%Y %I:%M %p"),
+            "end": None,
+            "incomplete": False,
+            "_start": dt,
+            "_end": dt
+        }
+        shift.update(_new_totals())
+
+        bounds = self.scheduled_bounds(dt)
+        if bounds and dt > bounds[0] + timedelta(minutes=GRACE_MINUTES):
+            shift["late_count"] = 1
+        shifts.append(shift)
+        return shift
+
+    def _check_early(self, shift, dt):
+        bounds = self.scheduled_bounds(shift["_start"])
+        if bounds and dt < bounds[1] - timedelta(minutes=GRACE_MINUTES):
+            shift["early_count"] = 1
+
+    def _rollup(self, shifts):
+        days = {}
+        weeks = {}
+        totals = _new_totals()
+        totals["shifts"] = 0
+
+        for shift in shifts:
+            start = shift.pop("_start")
+            shift.pop("_end")
+            if shift["end"] is None:
+                shift["incomplete"] = True
+
+            year, week, _ = start.isocalendar()
+            week_key = f"{year}-W{week:02d}"
+            day = days.setdefault(shift["date"], dict(_new_totals(), date=shift["date"], day=shift["day"], shifts=0))
+            week_totals = weeks.setdefault(week_key, dict(_new_totals(), week=week_key, shifts=0))
+
+            for bucket in (day, week_totals, totals):
+                bucket["shifts"] += 1
+                for field in SUMMARY_FIELDS:
+                    bucket[field] += shift[field]
+
+        return {
+            "totals": totals,
+            "weeks": list(weeks.values()),
+            "days": list(days.values()),
+            "shifts": shifts
+        }
+
+
+def summarize_labeled_records(labeled_records, schedules=None):
+    """Summarize a Logic 1 / Logic 2 labeledRecords list."""
+    return TimesheetSummarizer(schedules).summarize(labeled_records)
+
+
+def summarize_review(result, schedules=None):
+    """Summarize a Logic 3 review result (uses its original_records)."""
+    return TimesheetSummarizer(schedules).summarize(result.get("original_records", []))
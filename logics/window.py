@@ -0,0 +1,274 @@
+import math
+from datetime import date, datetime, timedelta
+
+
+# ----------------------------------------
+# Date-windowed processing
+# ----------------------------------------
+# A window restricts a run to one pay period. Records outside the window are
+# dropped before the engines run, except for a padding margin on both sides
+# so shifts that cross the window edges (e.g. Monday 6:00 PM -> Tuesday
+# 2:00 AM) are still grouped with all of their punches. For Logic 1 and 2 the
+# padded range is then widened to the nearest shift boundaries, so labels
+# match a full run exactly. Only labels dated inside the window are returned.
+
+# Hours a Time In may precede the scheduled start (see early_threshold in
+# the engines); added on top of the longest schedule span.
+EARLY_SLACK_HOURS = 3.0
+
+
+def parse_window_date(value):
+    """Parse a window bound given as a date, "YYYY-MM-DD" or "DD/MM/YYYY"."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if not isinstance(value, str) or value.strip() == "":
+        raise ValueError(f"Invalid window date: {value}")
+
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid window date: {value}")
+
+
+def parse_window(window):
+    """
+    Normalize a window into an inclusive (start_date, end_date) tuple.
+    Accepts {"start": ..., "end": ...}, a (start, end) pair or None.
+    Either bound may be omitted to leave that side open.
+    """
+    if not window:
+        return None
+
+    if isinstance(window, dict):
+        start, end = window.get("start"), window.get("end")
+    elif isinstance(window, (list, tuple)) and len(window) == 2:
+        start, end = window
+    else:
+        raise ValueError("Window must contain a start and an end date.")
+
+    start = parse_window_date(start) if start else date.min
+    end = parse_window_date(end) if end else date.max
+    if start > end:
+        raise ValueError("Window start must not be after window end.")
+    return start, end
+
+
+def schedule_span_hours(schedule):
+    """
+    Length of a schedule in hours, including overnight and multi-day spans.
+    "Monday 6:00 PM -> Tuesday 2:00 AM" gives 8.0.
+    """
+    from .logic1 import TimeScheduleManager  # logic1 imports this module
+
+    manager = TimeScheduleManager()
+    start_day = schedule.get("start_day", "Monday")
+    start_h = manager.parse_time_12_or_24(schedule.get("start_time") or "8:00 AM")
+    end_h = manager.parse_time_12_or_24(schedule.get("end_time") or "5:00 PM")
+
+    start_day_idx = manager.get_day_index(start_day)
+    end_day_idx = manager.get_day_index(schedule.get("end_day", start_day))
+    day_diff = (end_day_idx - start_day_idx) % 7
+
+    if day_diff == 0 and end_h <= start_h:
+        day_diff = 1
+    return end_h + 24.0 * day_diff - start_h
+
+
+def window_padding(schedules):
+    """
+    Padding margin in whole days for a set of schedules: the longest span
+    plus the early arrival slack, rounded up, plus one day so the record
+    before a crossing shift is still available for grouping decisions.
+    """
+    if isinstance(schedules, dict):
+        schedules = schedules.get("schedules", [schedules])
+    longest = max((schedule_span_hours(s) for s in schedules or [] if isinstance(s, dict)), default=24.0)
+    return timedelta(days=math.ceil((longest + EARLY_SLACK_HOURS) / 24.0) + 1)
+
+
+def record_date(record):
+    """
+    Extract the calendar date of a record without a full strptime.
+    Accepts record strings (old/new format, optionally with a trailing
+    "(label)"), datetimes and record dicts with a "record" key.
+    """
+    if isinstance(record, dict):
+        record = record.get("record", "")
+    if isinstance(record, datetime):
+        return record.date()
+    for part in record.split(" - "):
+        if part.count("/") == 2:
+            day, month, year = part.strip().split("/")
+            return date(int(year), int(month), int(day))
+    raise ValueError(f"Invalid record format: {record}")
+
+
+DEFAULT_SCHEDULE = {
+    "start_day": "Monday",
+    "start_time": "8:00 AM",
+    "end_day": "Monday",
+    "end_time": "5:00 PM"
+}
+
+
+def _schedule_grouper(manager, schedule_or_schedules):
+    """
+    Build a function mapping a record datetime to (group_key, compiled_schedule),
+    mirroring how the engine splits records into schedule groups.
+    """
+    if not isinstance(schedule_or_schedules, list):
+        compiled = manager.compile_schedule(schedule_or_schedules)
+        return lambda dt: ("", compiled)
+
+    schedules = schedule_or_schedules or [DEFAULT_SCHEDULE]
+    compiled_groups = {}
+
+    def group_of(dt):
+        key, schedule = manager.get_schedule_group(dt, schedules)
+        if key is None:
+            return None, None
+        if key not in compiled_groups:
+            compiled_groups[key] = manager.compile_schedule(schedule)
+        return key, compiled_groups[key]
+
+    return group_of
+
+
+def _extend_to_boundaries(recorded_times, selected, before, after, manager, schedule_or_schedules):
+    """
+    Walk outward from the padded range, one date at a time, until every
+    schedule group has reached a shift boundary on both sides. This keeps
+    shifts that the engine would chain across many days (e.g. Logic 1 when no
+    punch is near the schedule start/end) identical to a full run.
+    """
+    group_of = _schedule_grouper(manager, schedule_or_schedules)
+    parse = manager.parse_record_datetime
+
+    # Earliest and latest selected record of every group
+    first, last = {}, {}
+    for i in selected:
+        dt = parse(recorded_times[i])
+        key, _ = group_of(dt)
+        if key is None:
+            continue
+        if key not in first or dt < first[key]:
+            first[key] = dt
+        if key not in last or dt >= last[key]:
+            last[key] = dt
+
+    extra = []
+    for outside, backwards in ((before, True), (after, False)):
+        edge = dict(first if backwards else last)
+        open_groups = set(edge)
+        pos = len(outside) - 1 if backwards else 0
+
+        while open_groups and 0 <= pos < len(outside):
+            # Collect every record of the next date outwards
+            day = outside[pos][0]
+            day_indices = []
+            while 0 <= pos < len(outside) and outside[pos][0] == day:
+                day_indices.append(outside[pos][1])
+                pos += -1 if backwards else 1
+
+            day_records = sorted(((parse(recorded_times[i]), i) for i in day_indices), reverse=backwards)
+            for dt, i in day_records:
+                key, compiled = group_of(dt)
+                if key not in open_groups:
+                    continue
+                if backwards:
+                    boundary = manager.is_shift_boundary(dt, edge[key], compiled)
+                else:
+                    boundary = manager.is_shift_boundary(edge[key], dt, compiled)
+                if boundary:
+                    open_groups.discard(key)
+                else:
+                    extra.append(i)
+                    edge[key] = dt
+
+    return extra
+
+
+def select_window_records(recorded_times, window, schedule_or_schedules, manager=None):
+    """
+    Return the records that fall inside the window plus its padding, in input
+    order. When the engine's manager is given, the range is extended further
+    until each schedule group reaches a shift boundary.
+    """
+    if isinstance(recorded_times, dict):
+        recorded_times = recorded_times.get("recordedTimes", [])
+
+    start, end = window
+    schedules = schedule_or_schedules if isinstance(schedule_or_schedules, list) else [schedule_or_schedules or {}]
+    padding = window_padding(schedules)
+    padded_start = start - padding if start > date.min + padding else date.min
+    padded_end = end + padding if end < date.max - padding else date.max
+
+    selected, before, after = [], [], []
+    for i, rec in enumerate(recorded_times):
+        rec_date = record_date(rec)
+        if rec_date < padded_start:
+            before.append((rec_date, i))
+        elif rec_date > padded_end:
+            after.append((rec_date, i))
+        else:
+            selected.append(i)
+
+    if manager is not None and selected and (before or after):
+        before.sort()
+        after.sort()
+        selected.extend(_extend_to_boundaries(recorded_times, selected, before, after,
+                                              manager, schedule_or_schedules))
+        selected.sort()
+
+    return [recorded_times[i] for i in selected]
+
+
+def in_window(record, window):
+    """True if the record's date is inside the (unpadded) window."""
+    start, end = window
+    return start <= record_date(record) <= end
+
+
+def _issue_record(issue):
+    # Issues look like "Early arrival: <record>" or
+    # "Day/date mismatch in record: <record> (date is actually a <Day>)"
+    record = issue.split(": ", 1)[-1]
+    if " (date is actually" in record:
+        record = record[:record.find(" (date is actually")]
+    return record
+
+
+def filter_labeled_result(result, window):
+    """Drop labels outside the window from a logic1/logic2 result."""
+    if isinstance(result, dict) and "labeledRecords" in result:
+        result["labeledRecords"] = [rec for rec in result["labeledRecords"] if in_window(rec, window)]
+    return result
+
+
+def filter_review_result(result, window):
+    """Drop records, merged rows and issues outside the window from a logic3 result."""
+    if not isinstance(result, dict) or result.get("status") != "success":
+        return result
+
+    start, end = window
+    result["original_records"] = [rec for rec in result["original_records"] if in_window(rec, window)]
+    result["merged_records"] = [
+        row for row in result["merged_records"]
+        if start <= datetime.strptime(row["date"], "%d/%m/%Y").date() <= end
+    ]
+
+    issues = []
+    for issue in result["issues"]:
+        try:
+            if not in_window(_issue_record(issue), window):
+                continue
+        except ValueError:
+            pass  # Keep issues we can't date
+        issues.append(issue)
+    result["issues"] = issues
+    result["needs_review"] = len(issues) > 0
+    return result
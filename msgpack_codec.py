@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+
+try:
+    import msgpack  # Optional: pip install msgpack
+except ImportError:
+    msgpack = None
+
+from logics.punchlog import LABEL_CODES, LABELS
+
+
+# ----------------------------------------
+# MessagePack content negotiation
+# ----------------------------------------
+# Batch clients can send request bodies as MessagePack (Content-Type
+# application/msgpack) and ask for MessagePack responses (Accept
+# application/msgpack) instead of JSON. On the wire:
+# - datetimes are native MessagePack timestamps (ext type -1) holding the
+#   wall clock time as if it were UTC, the same convention as the epoch
+#   minutes of the compact format
+# - labels ("label", "original_label") are ext type 1 with the one byte
+#   punch log label code, so every label decodes to the same interned string
+#
+# Python clients can use packb()/unpackb() from this module to get both.
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+MSGPACK_EXTENSIONS = ('.msgpack', '.mpk')
+
+EXT_LABEL = 1
+LABEL_KEYS = ('label', 'original_label')
+
+
+def _to_wire(obj):
+    """Copy a payload, turning datetimes into timestamps and labels into label ext types."""
+    if isinstance(obj, dict):
+        return {
+            key: (msgpack.ExtType(EXT_LABEL, bytes((LABEL_CODES[value],)))
+                  if key in LABEL_KEYS and value in LABEL_CODES else _to_wire(value))
+            for key, value in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [_to_wire(value) for value in obj]
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return msgpack.Timestamp.from_datetime(obj)
+    return obj
+
+
+def _ext_hook(code, data):
+    if code == EXT_LABEL and len(data) == 1 and 0 < data[0] < len(LABELS):
+        return LABELS[data[0]]
+    return msgpack.ExtType(code, data)
+
+
+def packb(payload):
+    """Encode a payload as MessagePack."""
+    return msgpack.packb(_to_wire(payload), use_bin_type=True)
+
+
+def unpackb(data):
+    """
+    Decode a MessagePack body. Timestamps become (UTC) datetimes and label
+    ext types become label strings. Raises ValueError on malformed input.
+    """
+    if msgpack is None:
+        raise ValueError("MessagePack is not supported on this server.")
+    try:
+        return msgpack.unpackb(data, timestamp=3, ext_hook=_ext_hook, strict_map_key=False)
+    except (ValueError, TypeError, msgpack.UnpackException) as e:
+        raise ValueError(f"Invalid MessagePack body: {str(e) or type(e).__name__}")
+
+
+def is_msgpack_request(request):
+    """True if the request body is MessagePack."""
+    return request.mimetype in MSGPACK_TYPES
+
+
+def wants_msgpack(request):
+    """True if the client prefers a MessagePack response and it is available."""
+    if msgpack is None:
+        return False
+    best = request.accept_mimetypes.best_match(('application/json',) + MSGPACK_TYPES)
+    return best in MSGPACK_TYPES
+
+
+def msgpack_response(payload):
+    """Build a MessagePack Flask response."""
+    from flask import Response
+
+    return Response(packb(payload), mimetype=MSGPACK_MIMETYPE)
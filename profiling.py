@@ -0,0 +1,190 @@
+import cProfile
+import os
+import pstats
+import random
+import tempfile
+import time
+import uuid
+from urllib.parse import parse_qs
+
+
+# ----------------------------------------
+# Per-request profiling
+# ----------------------------------------
+# Slow calls reported by users (usually /execute_logic3 on a big upload)
+# are hard to reproduce, so the server can profile individual requests:
+# - a request with the header "X-Profile: 1" or the query flag ?profile=1
+# - or a random DTR_PROFILE_SAMPLE_RATE fraction of API requests
+# runs under cProfile and leaves two files in DTR_PROFILE_DIR named after
+# the route, request body size and duration (plus a random suffix, so two
+# profiles finishing in the same second don't overwrite each other), e.g.
+#   20250324-180000-execute_logic3-1834211B-2310ms-3f9a1c.pstats  (python -m pstats, snakeviz)
+#   20250324-180000-execute_logic3-1834211B-2310ms-3f9a1c.folded  (flamegraph.pl, speedscope)
+# The file name is returned in an X-Profile-File response header.
+#
+# Profiling is off unless DTR_PROFILE=1; when off the middleware isn't
+# installed at all, so requests pay nothing for it.
+
+PROFILE_ENABLED = os.environ.get("DTR_PROFILE", "0").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.environ.get("DTR_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "dtr-profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("DTR_PROFILE_SAMPLE_RATE", "0"))  # 0..1
+PROFILE_KEEP = int(os.environ.get("DTR_PROFILE_KEEP", "200"))  # profiles kept in PROFILE_DIR
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_QUERY_FLAG = "profile"
+
+# Routes the sampling rate applies to (an explicit header/query flag works everywhere)
+SAMPLED_PATHS = ('/upload', '/set_schedule', '/execute_logic1', '/execute_logic2', '/execute_logic3', '/summary')
+
+
+def _is_set(value):
+    return value is not None and value.lower() in ("1", "true", "yes")
+
+
+def wants_profile(environ, sample_rate=PROFILE_SAMPLE_RATE):
+    """True if this request should run under the profiler."""
+    if _is_set(environ.get(PROFILE_HEADER)):
+        return True
+    query = environ.get("QUERY_STRING")
+    if query and PROFILE_QUERY_FLAG in query:
+        if _is_set(parse_qs(query).get(PROFILE_QUERY_FLAG, [None])[-1]):
+            return True
+    return sample_rate > 0 and environ.get("PATH_INFO") in SAMPLED_PATHS and random.random() < sample_rate
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == "~":
+        # Builtins: "<built-in method builtins.sorted>"
+        return name.strip("<>")
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapsed_stacks(stats):
+    """
+    Turn pstats data into collapsed stacks ("a;b;c <microseconds>" lines).
+
+    cProfile only records caller -> callee edges, not full stacks, so each
+    function's own time is spread over its callers in proportion to the
+    time spent through each call edge. That is exact for code reached along
+    one path, and a good approximation otherwise.
+    """
+    callees = {}
+    roots = []
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    counts = {}
+
+    def walk(func, stack, fraction, seen):
+        tottime = stats.stats[func][2]
+        stack = stack + (_frame_name(func),)
+        own = round(tottime * fraction * 1e6)
+        if own > 0:
+            key = ";".join(stack)
+            counts[key] = counts.get(key, 0) + own
+        for callee, edge_cumtime in callees.get(func, ()):
+            callee_cumtime = stats.stats[callee][3]
+            if callee in seen or callee_cumtime <= 0:
+                continue  # recursion: the callee's time is counted at its outermost frame
+            share = fraction * min(1.0, edge_cumtime / callee_cumtime)
+            # Skip sub-microsecond branches; they would not show up anyway
+            if share * callee_cumtime * 1e6 >= 1:
+                walk(callee, stack, share, seen | {callee})
+
+    for root in roots:
+        walk(root, (), 1.0, {root})
+    return [f"{stack} {count}" for stack, count in counts.items()]
+
+
+def profile_name(path, payload_size, elapsed):
+    """Base file name for a profile: timestamp, route, payload size, duration and a random suffix."""
+    route = path.strip("/").replace("/", "_") or "index"
+    return (f"{time.strftime('%Y%m%d-%H%M%S')}-{route}-{payload_size}B-{round(elapsed * 1000)}ms-"
+            f"{uuid.uuid4().hex[:6]}")
+
+
+def write_profile(profiler, name, directory=PROFILE_DIR):
+    """Write <name>.pstats and <name>.folded for a finished profiler. Returns the pstats path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(path + ".pstats")
+    with open(path + ".folded", "w") as f:
+        f.write("\n".join(collapsed_stacks(stats)) + "\n")
+    prune_profiles(directory)
+    return path + ".pstats"
+
+
+def prune_profiles(directory=PROFILE_DIR, keep=PROFILE_KEEP):
+    """Remove the oldest profiles beyond the keep limit."""
+    try:
+        names = sorted(name[:-len(".pstats")] for name in os.listdir(directory) if name.endswith(".pstats"))
+    except OSError:
+        return
+    for name in names[:max(0, len(names) - keep)]:
+        for suffix in (".pstats", ".folded"):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except OSError:
+                pass
+
+
+class ProfileRequestMiddleware:
+    """
+    WSGI middleware that runs selected requests under cProfile, including
+    producing the response body (so streamed responses are profiled too).
+    """
+
+    def __init__(self, wsgi_app, sample_rate=PROFILE_SAMPLE_RATE, directory=PROFILE_DIR):
+        self.wsgi_app = wsgi_app
+        self.sample_rate = sample_rate
+        self.directory = directory
+
+    def __call__(self, environ, start_response):
+        if not wants_profile(environ, self.sample_rate):
+            return self.wsgi_app(environ, start_response)
+
+        path = environ.get("PATH_INFO", "")
+        payload_size = int(environ.get("CONTENT_LENGTH") or 0)
+        response_start = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            response_start[:] = [status, headers, exc_info]
+            return lambda data: None  # write() callable; Flask doesn't use it
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            result = self.wsgi_app(environ, capture_start_response)
+            try:
+                body = list(result)
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+
+        headers = list(response_start[1])
+        try:
+            profile_path = write_profile(profiler, profile_name(path, payload_size, elapsed), self.directory)
+            headers.append(("X-Profile-File", os.path.basename(profile_path)))
+            print(f"PROFILE: {path} ({payload_size} bytes) took {elapsed * 1000:.0f} ms -> {profile_path}")
+        except OSError as e:
+            print(f"PROFILE: Could not write profile for {path}: {e}")
+
+        start_response(response_start[0], headers, response_start[2])
+        return body
+
+
+def init_profiling(app):
+    """Enable per-request profiling for a Flask app if DTR_PROFILE is set."""
+    if not PROFILE_ENABLED:
+        return
+    app.wsgi_app = ProfileRequestMiddleware(app.wsgi_app)
+    print(f"PROFILE: Per-request profiling enabled (sample rate {PROFILE_SAMPLE_RATE}), writing to {PROFILE_DIR}")
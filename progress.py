@@ -0,0 +1,244 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from logics.deadline import Deadline
+
+
+# ----------------------------------------
+# Progress events for long runs
+# ----------------------------------------
+# A client that sends a progress id with an execute request ("progress_id"
+# in the body or an X-Progress-Id header) can follow the run as server-sent
+# events from GET /progress/<id>, and stop it early with DELETE
+# /progress/<id>. Background jobs (jobs.py) report under their job id.
+#
+# Progress comes from the engines' deadline checks (logics/deadline.py):
+# the run's deadline is a TrackedDeadline, and every check reports the
+# phase (parsing, schedule matching, overnight pre-grouping, shift
+# grouping, shift labeling, merging) with the records done so far.
+# Cancelling the run cancels its deadline.
+#
+# The stream sends "progress" events at most every EVENT_INTERVAL, then
+# one "done" event with the final status and the time spent in each phase,
+# which is also logged, so real sessions give stage-level telemetry. A
+# client may subscribe before its request arrives; the progress of a run
+# is kept PROGRESS_TTL seconds after it finishes for late subscribers.
+
+PROGRESS_TTL = 60  # seconds
+PROGRESS_MAX_RUNS = 1000  # runs tracked at once
+EVENT_INTERVAL = 0.25  # seconds between progress events
+KEEPALIVE_INTERVAL = 15  # seconds between keep-alive comments on a quiet stream
+
+PROGRESS_KEY = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+PENDING, RUNNING = "pending", "running"
+
+
+class RunProgress:
+    """The phase and counts a run has reached, with the time spent in each phase."""
+
+    def __init__(self, key):
+        self.key = key
+        self.status = PENDING
+        self.phase = None
+        self.done = None
+        self.total = None
+        self.message = None
+        self.phases = {}  # phase -> seconds
+        self.deadline = None
+        self.version = 0
+        self.created = self.updated = self._phase_start = time.monotonic()
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status not in (PENDING, RUNNING)
+
+    def _close_phase(self, now):
+        if self.phase is not None:
+            self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self._phase_start
+        self._phase_start = now
+
+    def update(self, phase, done=None, total=None):
+        with self._cond:
+            now = time.monotonic()
+            if phase != self.phase:
+                self._close_phase(now)
+                self.phase = phase
+            self.done = done
+            self.total = total
+            self.status = RUNNING
+            self.version += 1
+            self.updated = now
+            self._cond.notify_all()
+
+    def finish(self, status, message=None):
+        with self._cond:
+            if self.finished:
+                return
+            now = time.monotonic()
+            self._close_phase(now)
+            self.status = status
+            self.message = message
+            self.deadline = None
+            self.version += 1
+            self.updated = now
+            self._cond.notify_all()
+        print(f"PROGRESS: {self.key} {status} after {now - self.created:.2f} s, phases:",
+              ", ".join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in self.phases.items()) or "none")
+
+    def wait(self, version, timeout):
+        """Wait up to timeout seconds for a change after version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+
+    def snapshot(self):
+        with self._cond:
+            snapshot = {"id": self.key, "status": self.status, "phase": self.phase, "done": self.done,
+                        "total": self.total}
+            if self.finished:
+                snapshot["phases_ms"] = {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()}
+                if self.message:
+                    snapshot["message"] = self.message
+            return snapshot
+
+
+class TrackedDeadline(Deadline):
+    """A deadline whose checks report the run's progress."""
+
+    def __init__(self, progress, seconds=None):
+        super().__init__(seconds)
+        self.progress = progress
+        progress.deadline = self
+
+    def check(self, phase, done=None, total=None):
+        self.progress.update(phase, done, total)
+        super().check(phase, done, total)
+
+    def __reduce__(self):
+        # Worker processes get a plain Deadline; progress is reported by this process
+        return Deadline, (), {"expires_at": self.expires_at, "cancelled": self.cancelled}
+
+
+class ProgressBoard:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(ProgressBoard, cls).__new__(cls)
+            cls._instance._runs = OrderedDict()
+            cls._instance._lock = threading.Lock()
+        return cls._instance
+
+    def track(self, key):
+        """
+        The RunProgress for a key. Subscribing before the run starts creates
+        a pending one, which start() then reports into.
+        """
+        with self._lock:
+            self._prune()
+            run = self._runs.get(key)
+            if run is None:
+                run = self._runs[key] = RunProgress(key)
+            return run
+
+    def start(self, key, seconds=None):
+        """Start tracking a run (replacing a finished one with the same key); returns its TrackedDeadline."""
+        with self._lock:
+            run = self._runs.get(key)
+            if run is None or run.status != PENDING:
+                run = self._runs[key] = RunProgress(key)
+            self._prune()
+        return TrackedDeadline(run, seconds)
+
+    def get(self, key):
+        with self._lock:
+            return self._runs.get(key)
+
+    def finish(self, key, status, message=None):
+        run = self.get(key)
+        if run is not None:
+            run.finish(status, message)
+
+    def cancel(self, key):
+        """Cancel a running run (it stops at its next check). Returns the RunProgress, or None."""
+        run = self.get(key)
+        if run is None or run.deadline is None:
+            return None
+        run.deadline.cancel()
+        return run
+
+    def _stale(self, run):
+        return time.monotonic() - run.updated > PROGRESS_TTL
+
+    def _prune(self):
+        for key in [key for key, run in self._runs.items()
+                    if (run.finished or run.status == PENDING) and self._stale(run)]:
+            del self._runs[key]
+        while len(self._runs) > PROGRESS_MAX_RUNS:
+            self._runs.popitem(last=False)
+
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def progress_stream(run):
+    """
+    Server-sent events for a run: "progress" on changes (at most every
+    EVENT_INTERVAL), then "done". A run that never starts ends with a
+    "done" event of status "unknown" after PROGRESS_TTL.
+    """
+    version = None
+    while True:
+        if run.version != version:
+            version = run.version
+            snapshot = run.snapshot()
+            if run.finished:
+                yield server_sent_event("done", snapshot)
+                return
+            yield server_sent_event("progress", snapshot)
+            time.sleep(EVENT_INTERVAL)
+            continue
+
+        if run.status == PENDING and time.monotonic() - run.created > PROGRESS_TTL:
+            yield server_sent_event("done", dict(run.snapshot(), status="unknown"))
+            return
+        run.wait(version, KEEPALIVE_INTERVAL)
+        if run.version == version:
+            # Keeps proxies from closing a quiet stream, and notices a client that went away
+            yield ": keepalive\n\n"
+
+
+def progress_key(data):
+    """The progress id of a request ("progress_id" in the body or X-Progress-Id), or None."""
+    from flask import request
+
+    key = data.get('progress_id') or request.headers.get('X-Progress-Id')
+    if isinstance(key, str) and PROGRESS_KEY.match(key):
+        return key
+    return None
+
+
+def init_progress(app):
+    """Finish a request's progress when the request ends."""
+    from flask import g
+
+    @app.after_request
+    def finish_request_progress(response):
+        key = g.pop('progress_key', None)
+        if key is not None:
+            run = ProgressBoard().get(key)
+            cancelled = run is not None and run.deadline is not None and run.deadline.cancelled
+            status = "cancelled" if cancelled else "succeeded" if response.status_code < 400 else "failed"
+            ProgressBoard().finish(key, status, f"HTTP {response.status_code}" if status == "failed" else None)
+        return response
+
+    @app.teardown_request
+    def abandon_request_progress(exc=None):
+        key = g.pop('progress_key', None)
+        if key is not None:
+            ProgressBoard().finish(key, "failed", str(exc) if exc else None)
@@ -0,0 +1,173 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# ----------------------------------------
+# Always-on sampling profiler
+# ----------------------------------------
+# A daemon thread wakes every DTR_SAMPLER_INTERVAL_MS, grabs the Python
+# stack of every thread that is serving a request (sys._current_frames())
+# and adds one to the count of that stack. Nothing is traced in between, so
+# the cost is one stack walk per busy thread per interval (well under 1% at
+# the default 10 ms) and the sampler can stay on in production.
+#
+# init_sampler() starts the thread and installs the middleware;
+# DTR_SAMPLER=0 turns the sampler off, and then nothing runs at all.
+#
+# GET /debug/profile?seconds=N (with the X-Debug-Token header, see app.py)
+# collects for N seconds and returns the counts as collapsed stacks
+# ("a;b;c <samples>" per line), which flamegraph.pl and speedscope read
+# directly.
+#
+# Only request threads are sampled, so idle server threads waiting on their
+# sockets don't drown out the engines. Work done in the worker process pool
+# (logics/parallel.py) happens in other processes and is not seen here.
+
+SAMPLER_ENABLED = os.environ.get("DTR_SAMPLER", "1").lower() in ("1", "true", "yes")
+SAMPLER_INTERVAL = int(os.environ.get("DTR_SAMPLER_INTERVAL_MS", "10")) / 1000  # seconds
+SAMPLER_MAX_STACKS = 20000  # distinct stacks kept; the rest are counted as "[other]"
+SAMPLER_MAX_DEPTH = 128  # frames per stack, innermost kept
+MAX_PROFILE_SECONDS = 300
+
+
+class StackSampler:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(StackSampler, cls).__new__(cls)
+            cls._instance._counts = {}
+            cls._instance._names = {}
+            cls._instance._tracked = {}
+            cls._instance._lock = threading.Lock()
+            cls._instance._thread = None
+            cls._instance.samples = 0
+        return cls._instance
+
+    def start(self, interval=SAMPLER_INTERVAL):
+        """Start the sampling thread (once per process)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.interval = interval
+        self._thread = threading.Thread(target=self._run, name="dtr-stack-sampler", daemon=True)
+        self._thread.start()
+        print(f"SAMPLER: Sampling request threads every {interval * 1000:.0f} ms")
+
+    @contextmanager
+    def track(self):
+        """Sample the current thread while inside this block (nests)."""
+        ident = threading.get_ident()
+        self._tracked[ident] = self._tracked.get(ident, 0) + 1
+        try:
+            yield
+        finally:
+            if self._tracked.get(ident, 0) <= 1:
+                self._tracked.pop(ident, None)
+            else:
+                self._tracked[ident] -= 1
+
+    @contextmanager
+    def untrack(self):
+        """Stop sampling the current thread inside this block (e.g. while it waits)."""
+        ident = threading.get_ident()
+        depth = self._tracked.pop(ident, None)
+        try:
+            yield
+        finally:
+            if depth:
+                self._tracked[ident] = depth
+
+    def _frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._names[code] = name
+        return name
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._tracked:
+                continue
+            frames = sys._current_frames()
+            for ident in list(self._tracked):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < SAMPLER_MAX_DEPTH:
+                    stack.append(self._frame_name(frame.f_code))
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                with self._lock:
+                    if key not in self._counts and len(self._counts) >= SAMPLER_MAX_STACKS:
+                        key = "[other]"
+                    self._counts[key] = self._counts.get(key, 0) + 1
+                    self.samples += 1
+            del frames
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def collect(self, seconds):
+        """Sample for the given number of seconds and return {stack: samples} for that period."""
+        before = self.snapshot()
+        with self.untrack():
+            time.sleep(seconds)
+        after = self.snapshot()
+        return {stack: count - before.get(stack, 0) for stack, count in after.items() if count > before.get(stack, 0)}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+def collapsed_text(counts):
+    """Format {stack: samples} as collapsed-stack lines, hottest first."""
+    lines = [f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])]
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+class SampleRequestMiddleware:
+    """WSGI middleware that marks request threads for sampling, including streamed bodies."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.sampler = StackSampler()
+
+    def __call__(self, environ, start_response):
+        with self.sampler.track():
+            result = self.wsgi_app(environ, start_response)
+        return _TrackedIterable(result, self.sampler)
+
+
+class _TrackedIterable:
+    def __init__(self, result, sampler):
+        self.result = result
+        self.sampler = sampler
+
+    def __iter__(self):
+        iterator = iter(self.result)
+        while True:
+            with self.sampler.track():
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+            yield chunk
+
+    def close(self):
+        if hasattr(self.result, "close"):
+            self.result.close()
+
+
+def init_sampler(app):
+    """Start the sampling profiler and mark a Flask app's request threads for it (unless DTR_SAMPLER=0)."""
+    if not SAMPLER_ENABLED:
+        return
+    app.wsgi_app = SampleRequestMiddleware(app.wsgi_app)
+    StackSampler().start()
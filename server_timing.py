@@ -0,0 +1,83 @@
+from logics.metrics import RequestMetrics, activate, current_metrics, deactivate
+
+
+# ----------------------------------------
+# Server-Timing headers and work counters
+# ----------------------------------------
+# Every execute/summary response carries a Server-Timing header with the
+# duration of each stage of the request (see logics/metrics.py), e.g.
+#   Server-Timing: decode;dur=3.1, parse;dur=41.7, match;dur=12.0,
+#                  group;dur=8.2, label;dur=20.4, sort;dur=6.3, encode;dur=9.9,
+#                  total;dur=118.5, bytes_out;desc="1834211"
+# which browser dev tools show next to the request. Time not spent in any
+# stage (logging, window selection, summaries) is the gap to "total", and
+# bytes_out is the size of the (possibly compressed) body, left out for
+# streamed responses.
+#
+# Requests with "debug": true also get a "debug" block in the payload with
+# the stage timings and the work counters (records parsed, schedule
+# comparisons, shifts, sorts), to tie latency to input shape. The block is
+# built before the payload is encoded, so it leaves out the encode stage;
+# bytes out, known only once the response is encoded, is in the header.
+
+TIMED_PATHS = ('/execute_logic1', '/execute_logic2', '/execute_logic3', '/summary')
+
+
+def server_timing_header(metrics):
+    """Format stage timings as a Server-Timing header value."""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in metrics.timings.items()]
+    if metrics.total is not None:
+        entries.append(f"total;dur={metrics.total * 1000:.1f}")
+    if "bytes_out" in metrics.counters:
+        entries.append(f'bytes_out;desc="{metrics.counters["bytes_out"]}"')
+    return ", ".join(entries)
+
+
+def note_debug_request(data):
+    """Remember that the request asked for the debug block ("debug": true)."""
+    metrics = current_metrics()
+    if metrics is not None and isinstance(data, dict) and data.get('debug') is True:
+        metrics.debug = True
+
+
+def debug_block(metrics):
+    """The "debug" block: stage timings so far and the work counters."""
+    return {'timings_ms': metrics.timings_ms(), 'counters': dict(metrics.counters)}
+
+
+def with_debug_block(payload, encode):
+    """
+    Encode a payload, adding the debug block if the request asked for it.
+    encode(payload) must return a Flask response.
+    """
+    metrics = current_metrics()
+    if metrics is not None and metrics.debug and isinstance(payload, dict):
+        payload = dict(payload, debug=debug_block(metrics))
+    return encode(payload)
+
+
+def init_server_timing(app):
+    """Collect stage timings for the timed routes and report them in a Server-Timing header."""
+    from flask import g, request
+
+    @app.before_request
+    def start_request_metrics():
+        if request.path in TIMED_PATHS:
+            g.request_metrics = RequestMetrics()
+            g.request_metrics_token = activate(g.request_metrics)
+
+    @app.after_request
+    def add_server_timing(response):
+        metrics = g.pop('request_metrics', None)
+        if metrics is not None:
+            metrics.finish()
+            if not response.is_streamed:
+                metrics.count('bytes_out', response.content_length or 0)
+            response.headers['Server-Timing'] = server_timing_header(metrics)
+        return response
+
+    @app.teardown_request
+    def stop_request_metrics(exc=None):
+        token = g.pop('request_metrics_token', None)
+        if token is not None:
+            deactivate(token)
@@ -0,0 +1,327 @@
+import cProfile
+import json
+import os
+import random
+import re
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+from logics.compact import decode_recorded_times, decode_schedules, record_strings
+from logics.logic1 import execute_logic1
+from logics.logic2 import execute_logic2
+from logics.logic3 import execute_logic3
+from logics.metrics import RequestMetrics, collect_metrics
+from logics.window import parse_window
+
+
+# ----------------------------------------
+# Slow-request capture and replay
+# ----------------------------------------
+# An /execute_logic* request that takes longer than DTR_SLOW_REQUEST_MS is
+# saved to DTR_CAPTURE_DIR together with its timing breakdown (the stages
+# and work counters of server_timing.py). The engine input is captured
+# after dataset_id / schedule_id resolution, so a capture replays without
+# the server-side state it was made with.
+#
+# Captures are anonymized by default (DTR_CAPTURE_ANONYMIZE=0 to keep them
+# as sent): every date is moved by the same random number of weeks, which
+# keeps weekdays, times of day and the gaps between punches (all the
+# engines look at) but not the real dates, and fields the engines don't
+# use are dropped. The directory is bounded by count and total size.
+#
+# Replay captures directly against the engines, with timing and optional
+# profiling:
+#   python slowlog.py list
+#   python slowlog.py replay <capture.json | capture dir> [--repeat 5] [--profile DIR]
+
+SLOW_REQUEST_MS = int(os.environ.get("DTR_SLOW_REQUEST_MS", "2000"))  # 0 disables capture
+CAPTURE_DIR = os.environ.get("DTR_CAPTURE_DIR", os.path.join(tempfile.gettempdir(), "dtr-slow-requests"))
+CAPTURE_ANONYMIZE = os.environ.get("DTR_CAPTURE_ANONYMIZE", "1").lower() in ("1", "true", "yes")
+CAPTURE_KEEP = int(os.environ.get("DTR_CAPTURE_KEEP", "50"))  # captures kept
+CAPTURE_MAX_SIZE = int(os.environ.get("DTR_CAPTURE_MAX_MB", "16")) * 1024 * 1024  # bytes per capture
+CAPTURE_MAX_TOTAL_SIZE = int(os.environ.get("DTR_CAPTURE_TOTAL_MB", "256")) * 1024 * 1024  # bytes, all captures
+
+CAPTURED_PATHS = {'/execute_logic1': 'logic1', '/execute_logic2': 'logic2', '/execute_logic3': 'logic3'}
+# Request options kept in a capture (they change the work done)
+CAPTURED_OPTIONS = ('view', 'shape', 'fields', 'format')
+# Keys of Logic 3's labeled record objects
+RECORD_KEYS = ('record', 'label', 'validated_overtime')
+SCHEDULE_KEYS = ('start_day', 'start_time', 'end_day', 'end_time')
+
+EXECUTE = {
+    'logic1': execute_logic1,
+    'logic2': execute_logic2,
+    'logic3': execute_logic3
+}
+
+DATE_PART = re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b")
+
+
+# ----------------------------------------
+# Anonymization
+# ----------------------------------------
+def _shift_record_string(record, shift):
+    """Move the DD/MM/YYYY date in a record string, leaving the rest of the text as sent."""
+    def replace(match):
+        day, month, year = (int(part) for part in match.groups())
+        return (date(year, month, day) + shift).strftime("%d/%m/%Y")
+    return DATE_PART.sub(replace, record, count=1)
+
+
+def _shift_punch(value, shift):
+    if isinstance(value, datetime):
+        return value + shift
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value + int(shift.total_seconds()) // 60  # epoch minutes
+    if isinstance(value, str):
+        if len(value) >= 10 and value[4] == "-" and value[7] == "-":
+            # ISO-8601: move the date, keep the time and offset text
+            return (date.fromisoformat(value[:10]) + shift).isoformat() + value[10:]
+        return _shift_record_string(value, shift)
+    if isinstance(value, dict):
+        return {key: (_shift_punch(item, shift) if key == 'record' else item)
+                for key, item in value.items() if key in RECORD_KEYS}
+    return value
+
+
+def anonymize_input(recorded_times, window, weeks=None):
+    """
+    Move every punch (and the window) by the same whole number of weeks.
+    Returns (recorded_times, window); the window in {"start", "end"} form.
+    """
+    if weeks is None:
+        weeks = random.choice([-1, 1]) * random.randint(52, 520)
+    shift = timedelta(weeks=weeks)
+    recorded_times = [_shift_punch(value, shift) for value in recorded_times]
+    bounds = parse_window(window)
+    if bounds:
+        # Open bounds (date.min / date.max) stay open
+        window = {key: (bound + shift).isoformat() if bound not in (date.min, date.max) else None
+                  for key, bound in zip(('start', 'end'), bounds)}
+    return recorded_times, window
+
+
+# ----------------------------------------
+# Capture
+# ----------------------------------------
+def to_json(value):
+    """json.dump default: datetimes (MessagePack/compact input) as ISO-8601 strings."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+def plain_schedules(schedule_data):
+    """Schedules as plain dicts, without the annotations Logic 3 adds (and registry extras)."""
+    if isinstance(schedule_data, dict):
+        if "schedules" in schedule_data:
+            # Logic 3's {"schedules": [...]} form
+            return {"schedules": plain_schedules(schedule_data["schedules"])}
+        return {key: value for key, value in schedule_data.items() if key in SCHEDULE_KEYS}
+    return [{key: value for key, value in schedule.items() if key in SCHEDULE_KEYS}
+            for schedule in schedule_data or []]
+
+
+def build_capture(logic, engine_input, data, metrics, status, duration, anonymize=CAPTURE_ANONYMIZE):
+    """The capture document for a slow request."""
+    recorded_times, schedule_data, window = engine_input
+    if anonymize:
+        recorded_times, window = anonymize_input(recorded_times, window)
+    return {
+        'logic': logic,
+        'captured_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'status': status,
+        'duration_ms': round(duration * 1000, 1),
+        'timings_ms': metrics.timings_ms() if metrics else {},
+        'counters': dict(metrics.counters) if metrics else {},
+        'anonymized': anonymize,
+        'request': {
+            'recordedTimes': list(recorded_times),
+            'schedules': plain_schedules(schedule_data),
+            'window': window,
+            'options': {key: data[key] for key in CAPTURED_OPTIONS if isinstance(data, dict) and key in data}
+        }
+    }
+
+
+def write_capture(capture, directory=CAPTURE_DIR):
+    """Write a capture file, within the size limits. Returns its path, or None if it was too large."""
+    body = json.dumps(capture, default=to_json)
+    if len(body) > CAPTURE_MAX_SIZE:
+        print(f"SLOWLOG: Not capturing {capture['logic']} request, {len(body)} bytes is over the limit")
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    name = (f"{time.strftime('%Y%m%d-%H%M%S')}-{capture['logic']}-{round(capture['duration_ms'])}ms-"
+            f"{uuid.uuid4().hex[:6]}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(body)
+    path = os.path.join(directory, name)
+    os.replace(tmp_path, path)
+    prune_captures(directory)
+    return path
+
+
+def list_captures(directory=CAPTURE_DIR):
+    """Capture file paths, oldest first."""
+    try:
+        names = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+    except OSError:
+        return []
+    return [os.path.join(directory, name) for name in names]
+
+
+def prune_captures(directory=CAPTURE_DIR, keep=CAPTURE_KEEP, max_total=CAPTURE_MAX_TOTAL_SIZE):
+    """Remove the oldest captures beyond the count and total size limits."""
+    paths = list_captures(directory)
+    sizes = {}
+    for path in paths:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            sizes[path] = 0
+    total = sum(sizes.values())
+    while paths and (len(paths) > keep or total > max_total):
+        path = paths.pop(0)
+        total -= sizes[path]
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def note_engine_input(data, recorded_times, schedule_data, window):
+    """
+    Remember a route's request data and engine input (after dataset/schedule
+    resolution) so it can be captured if the request turns out to be slow.
+    """
+    from flask import g
+
+    if SLOW_REQUEST_MS > 0:
+        g.engine_input = (data, (recorded_times, schedule_data, window))
+
+
+def capture_slow_request(response):
+    """after_request hook: capture execute requests slower than SLOW_REQUEST_MS."""
+    from flask import g, request
+
+    logic = CAPTURED_PATHS.get(request.path)
+    metrics = g.get('request_metrics')
+    engine_input = g.pop('engine_input', None)
+    if logic is None or metrics is None or engine_input is None or response.is_streamed:
+        return response
+
+    metrics.finish()
+    if metrics.total * 1000 < SLOW_REQUEST_MS:
+        return response
+
+    try:
+        data, engine_input = engine_input
+        capture = build_capture(logic, engine_input, data, metrics, response.status_code, metrics.total)
+        path = write_capture(capture)
+        if path:
+            print(f"SLOWLOG: {request.path} took {metrics.total * 1000:.0f} ms, captured to {path}")
+    except (OSError, TypeError, ValueError) as e:
+        print(f"SLOWLOG: Could not capture {request.path}: {e}")
+    return response
+
+
+def init_slowlog(app):
+    """
+    Capture slow execute requests. Call after init_server_timing(): the
+    capture reads the request's stage timings.
+    """
+    if SLOW_REQUEST_MS <= 0:
+        return
+    app.after_request(capture_slow_request)
+
+
+# ----------------------------------------
+# Replay
+# ----------------------------------------
+def load_capture(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def replay_capture(capture, profiler=None):
+    """
+    Run a capture's engine call once, the way the route does.
+    Returns (result, RequestMetrics) with the stage timings of the run.
+    """
+    request_data = capture['request']
+    recorded_times = decode_recorded_times(request_data['recordedTimes'])
+    schedule_data = decode_schedules(request_data['schedules'])
+    if capture['logic'] == 'logic3':
+        recorded_times = record_strings(recorded_times)
+
+    with collect_metrics(RequestMetrics()) as metrics:
+        if profiler is not None:
+            profiler.enable()
+        try:
+            result = EXECUTE[capture['logic']](recorded_times, schedule_data, window=request_data.get('window'))
+        finally:
+            if profiler is not None:
+                profiler.disable()
+    return result, metrics.finish()
+
+
+def replay(paths, repeat=1, profile_dir=None):
+    """Replay capture files and print the timing of each against its captured timing."""
+    from contextlib import redirect_stdout
+    from io import StringIO
+
+    for path in paths:
+        capture = load_capture(path)
+        runs = []
+        for i in range(repeat):
+            profiler = cProfile.Profile() if profile_dir and i == repeat - 1 else None
+            # The engines log every shift; keep the replay output readable
+            with redirect_stdout(StringIO()):
+                _, metrics = replay_capture(capture, profiler)
+            runs.append(metrics)
+
+        best = min(runs, key=lambda metrics: metrics.total)
+        print(f"{os.path.basename(path)}: {capture['logic']}, {len(capture['request']['recordedTimes'])} records, "
+              f"captured {capture['duration_ms']} ms, replayed {best.total * 1000:.1f} ms "
+              f"(best of {repeat})")
+        print("  stages:", ", ".join(f"{name}={ms}" for name, ms in best.timings_ms().items()))
+        print("  counters:", ", ".join(f"{name}={value}" for name, value in best.counters.items()))
+
+        if profiler is not None:
+            from profiling import write_profile
+
+            name = os.path.splitext(os.path.basename(path))[0] + "-replay"
+            print("  profile:", write_profile(profiler, name, profile_dir))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List and replay captured slow requests.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = subparsers.add_parser("list", help="list captured requests")
+    list_parser.add_argument("directory", nargs="?", default=CAPTURE_DIR)
+
+    replay_parser = subparsers.add_parser("replay", help="re-run captured requests against the engines")
+    replay_parser.add_argument("paths", nargs="+", help="capture files or capture directories")
+    replay_parser.add_argument("--repeat", type=int, default=1, help="runs per capture; the best is reported")
+    replay_parser.add_argument("--profile", metavar="DIR", default=None,
+                               help="write a .pstats/.folded profile of the last run to DIR")
+
+    args = parser.parse_args()
+    if args.command == "list":
+        for path in list_captures(args.directory):
+            capture = load_capture(path)
+            print(f"{os.path.basename(path)}: {capture['logic']}, "
+                  f"{len(capture['request']['recordedTimes'])} records, {capture['duration_ms']} ms, "
+                  f"status {capture['status']}")
+    else:
+        paths = []
+        for path in args.paths:
+            paths.extend(list_captures(path) if os.path.isdir(path) else [path])
+        replay(paths, repeat=max(1, args.repeat), profile_dir=args.profile)
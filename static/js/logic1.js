@@ -99,19 +99,16 @@ function applyLogic1() {
   }];
   
   // Create payload
+  // (records go in as recordedTimes, or the upload's dataset_id; see record.js)
   const payload = {
-    recordedTimes: recordedTimes,
-    schedules: schedules
+    schedules: schedules,
+    view: "records" // labels for every record, even past the server's summary threshold
   };
   
-  console.log("Sending payload to /execute_logic1:", JSON.stringify(payload, null, 2));
+  console.log("Sending payload to /execute_logic1:", JSON.stringify(withRecords(payload, recordedTimes), null, 2));
   
   // Send request with error handling
-  fetch('/execute_logic1', {
-    method: 'POST',
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(payload)
-  })
+  postRecords('/execute_logic1', payload, recordedTimes)
   .then(response => {
     console.log("Response status:", response.status);
     return response.json().then(data => {
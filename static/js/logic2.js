@@ -35,19 +35,16 @@ function applyLogic2() {
   // You can add code here to get additional schedules if your UI supports that
 
   // Payload for the backend
+  // (records go in as recordedTimes, or the upload's dataset_id; see record.js)
   const payload = {
-    recordedTimes: recordedTimes,
-    schedules: schedules
+    schedules: schedules,
+    view: "records" // labels for every record, even past the server's summary threshold
   };
 
-  console.log("Logic2 - Sending payload:", payload);
+  console.log("Logic2 - Sending payload:", withRecords(payload, recordedTimes));
 
   // Make request to Logic 2 endpoint (assuming you've implemented it on the backend)
-  fetch('/execute_logic2', {
-    method: 'POST',
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify(payload)
-  })
+  postRecords('/execute_logic2', payload, recordedTimes)
   .then(response => {
     if (!response.ok) {
       return response.json().then(data => {
@@ -26,22 +26,25 @@ function applyLogic3() {
         return null;
     }).filter(item => item !== null);
 
+    // Lets the server report progress for this run (see showLogic3Progress)
+    const progressId = newProgressId();
+
+    // Records go in as recordedTimes, or the upload's dataset_id (see record.js)
     const payload = {
-        recordedTimes: recordedTimes,
         schedules: {
             schedules: scheduleItems
-        }
+        },
+        progress_id: progressId,
+        view: "records" // the review needs every record, even past the summary threshold
     };
 
-    console.log("Sending payload to logic3:", payload);
+    console.log("Sending payload to logic3:", withRecords(payload, recordedTimes));
 
-    fetch('/execute_logic3', {
-        method: 'POST',
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload)
-    })
+    const progress = showLogic3Progress(progressId);
+    postRecords('/execute_logic3', payload, recordedTimes)
     .then(response => response.json())
     .then(data => {
+        progress.close();
         if (data.status === "success") {
             // Clear existing records
             recordBox.innerHTML = '';
@@ -113,11 +116,12 @@ function applyLogic3() {
                 entry.appendChild(leftContainer);
                 recordBox.appendChild(entry);
             });
-        } else {
+        } else if (!progress.cancelled) {
             alert("Error: " + data.message);
         }
     })
     .catch(err => {
+        progress.close();
         console.error(err);
         alert("Error executing logic.");
     });
@@ -336,13 +340,17 @@ function showReviewModal(data) {
         }).filter(item => item !== null);
 
         // Send the updated records to the backend
+        const progressId = newProgressId();
         const payload = {
             recordedTimes: labeledRecords, // Send the records with validation state
             schedules: {
                 schedules: scheduleItems
-            }
+            },
+            progress_id: progressId,
+            view: "records"
         };
 
+        const progress = showLogic3Progress(progressId);
         fetch('/execute_logic3', {
             method: 'POST',
             headers: { "Content-Type": "application/json" },
@@ -350,6 +358,7 @@ function showReviewModal(data) {
         })
         .then(response => response.json())
         .then(newData => {
+            progress.close();
             if (newData.status === "success") {
                 // If user-provided labels exist in the response, use them
                 if (labeledRecords.length > 0) {
@@ -374,11 +383,12 @@ function showReviewModal(data) {
                 
                 // Replace the alert with our new success modal
                 showSuccessModal();
-            } else {
+            } else if (!progress.cancelled) {
                 alert(newData.message || "Error processing records");
             }
         })
         .catch(err => {
+            progress.close();
             console.error(err);
             alert("Error updating display after save.");
         });
@@ -415,6 +425,100 @@ function showReviewModal(data) {
     document.body.appendChild(modalOverlay);
 }
 
+// Create an id for following a run's progress
+function newProgressId() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + Math.random().toString(36).slice(2);
+}
+
+// Show a progress panel for a logic3 run started with this progress id.
+// It follows the server-sent events from /progress/<id> and has a Cancel
+// button. Short runs finish before the panel appears.
+function showLogic3Progress(progressId) {
+    const progressUrl = '/progress/' + encodeURIComponent(progressId);
+
+    const panel = document.createElement('div');
+    panel.classList.add('logic3-progress');
+    panel.style.position = 'fixed';
+    panel.style.bottom = '24px';
+    panel.style.right = '24px';
+    panel.style.width = '300px';
+    panel.style.backgroundColor = 'white';
+    panel.style.borderRadius = '8px';
+    panel.style.boxShadow = '0 4px 15px rgba(0, 0, 0, 0.2)';
+    panel.style.padding = '16px';
+    panel.style.zIndex = '1000';
+
+    const title = document.createElement('div');
+    title.textContent = 'Reviewing records...';
+    title.style.fontWeight = 'bold';
+    title.style.marginBottom = '8px';
+    panel.appendChild(title);
+
+    const phaseText = document.createElement('div');
+    phaseText.textContent = 'Waiting for the server';
+    phaseText.style.fontSize = '14px';
+    phaseText.style.color = '#6c757d';
+    panel.appendChild(phaseText);
+
+    // Without a value the bar shows as busy
+    const bar = document.createElement('progress');
+    bar.style.width = '100%';
+    bar.style.margin = '8px 0';
+    panel.appendChild(bar);
+
+    const cancelBtn = document.createElement('button');
+    cancelBtn.textContent = 'Cancel';
+    cancelBtn.style.padding = '6px 16px';
+    cancelBtn.style.borderRadius = '4px';
+    cancelBtn.style.border = '1px solid #6c757d';
+    cancelBtn.style.backgroundColor = 'transparent';
+    cancelBtn.style.color = '#6c757d';
+    cancelBtn.style.fontSize = '14px';
+    cancelBtn.style.cursor = 'pointer';
+    panel.appendChild(cancelBtn);
+
+    const progress = { cancelled: false };
+
+    const events = new EventSource(progressUrl);
+    events.addEventListener('progress', event => {
+        const data = JSON.parse(event.data);
+        if (!data.phase || progress.cancelled) {
+            return;
+        }
+        const phase = data.phase.charAt(0).toUpperCase() + data.phase.slice(1);
+        if (data.total) {
+            phaseText.textContent = `${phase}: ${data.done} of ${data.total}`;
+            bar.max = data.total;
+            bar.value = data.done;
+        } else {
+            phaseText.textContent = phase;
+            bar.removeAttribute('value');
+        }
+    });
+    events.addEventListener('done', () => events.close());
+
+    cancelBtn.onclick = () => {
+        progress.cancelled = true;
+        cancelBtn.disabled = true;
+        phaseText.textContent = 'Cancelling...';
+        fetch(progressUrl, { method: 'DELETE' });
+    };
+
+    const showTimer = setTimeout(() => document.body.appendChild(panel), 500);
+
+    progress.close = () => {
+        clearTimeout(showTimer);
+        events.close();
+        if (panel.parentNode) {
+            panel.parentNode.removeChild(panel);
+        }
+    };
+    return progress;
+}
+
 // Add this function to show a success modal
 function showSuccessModal() {
     const modalOverlay = document.createElement('div');
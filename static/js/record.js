@@ -270,6 +270,39 @@ document.getElementById('save-info').addEventListener('click', function() {
   warningElements.forEach(el => { el.style.display = ''; });
 });
 
+// Records of the last upload and the dataset_id /upload kept them under.
+// Execute calls send the dataset_id instead of the records while the record
+// box still holds exactly what was uploaded (see postRecords).
+let uploadedDataset = null;
+
+// Add the records to an execute payload, as the uploaded dataset_id if unchanged
+function withRecords(payload, recordedTimes) {
+  const unchanged = uploadedDataset &&
+    uploadedDataset.records.length === recordedTimes.length &&
+    uploadedDataset.records.every((record, i) => record === recordedTimes[i]);
+  if (unchanged) {
+    return Object.assign({ dataset_id: uploadedDataset.id }, payload);
+  }
+  return Object.assign({ recordedTimes: recordedTimes }, payload);
+}
+
+// POST an execute payload; resends the records if the dataset has expired
+function postRecords(url, payload, recordedTimes) {
+  const post = body => fetch(url, {
+    method: 'POST',
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body)
+  });
+  const body = withRecords(payload, recordedTimes);
+  return post(body).then(response => {
+    if (response.status === 404 && body.dataset_id) {
+      uploadedDataset = null;
+      return post(withRecords(payload, recordedTimes));
+    }
+    return response;
+  });
+}
+
 // Upload record box info
 document.getElementById('upload-info').addEventListener('click', function() {
   const fileInput = document.getElementById('upload-file').click();
@@ -295,12 +328,18 @@ document.getElementById('upload-file').addEventListener('change', function() {
           
           const recordBox = document.getElementById('record-box');
           recordBox.innerHTML = "";
+          uploadedDataset = null;
           if (data.content.recordedTimes) {
+            const records = [];
             data.content.recordedTimes.forEach(record => {
               if (typeof record === 'string' && record.trim() !== "") {
+                records.push(record.trim());
                 recordBox.appendChild(createRecordEntry(record.trim()));
               }
             });
+            if (data.dataset_id && records.length === data.content.recordedTimes.length) {
+              uploadedDataset = { id: data.dataset_id, records: records };
+            }
           }
           
           // If schedules are included, update the schedule list
@@ -326,6 +365,7 @@ document.getElementById('upload-file').addEventListener('change', function() {
 document.getElementById('clear-info').addEventListener('click', function() {
   document.getElementById('record-box').innerText = "No time recorded";
   document.getElementById('upload-file').value = ''; // Reset the input when clearing
+  uploadedDataset = null;
 
   // Uncheck all logic checkboxes when records are cleared
   const logicCheckboxes = document.querySelectorAll('#logic1, #logic2, #logic3');
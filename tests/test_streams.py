@@ -0,0 +1,63 @@
+import json
+import unittest
+
+from app import app
+from progress import ProgressBoard
+from tests.test_ui_views import SCHEDULES, big_record_list
+
+
+# ----------------------------------------
+# NDJSON streams and the request deadline
+# ----------------------------------------
+# A streamed run does its work after the route has returned, so the
+# request's timeout has to travel with the generator. A stream that runs
+# out of time ends with an error trailer that says how far it got. Its
+# progress id (if any) stays running until the stream ends.
+
+class StreamDeadlineTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = app.test_client()
+        cls.records = big_record_list(40000)
+
+    def stream(self, path, **options):
+        payload = dict({"recordedTimes": self.records, "scheduleData": SCHEDULES, "stream": True}, **options)
+        response = self.client.post(path, json=payload)
+        try:
+            self.assertEqual(response.status_code, 200, response.get_data(as_text=True)[:200])
+            lines = response.get_data(as_text=True).splitlines()
+        finally:
+            response.close()  # gives back the admission ticket
+        return [json.loads(line) for line in lines]
+
+    def test_stream_completes_without_timeout(self):
+        for path in ("/execute_logic1", "/execute_logic2"):
+            lines = self.stream(path)
+            self.assertEqual(lines[-1]["status"], "success")
+            self.assertEqual(lines[-1]["count"], len(lines) - 1)
+
+    def test_stream_stops_at_request_timeout(self):
+        for path in ("/execute_logic1", "/execute_logic2"):
+            trailer = self.stream(path, timeout=0.01)[-1]
+            self.assertEqual(trailer["status"], "error")
+            self.assertIn("Deadline exceeded", trailer["message"])
+            self.assertFalse(trailer["progress"]["cancelled"])
+
+    def test_progress_finishes_with_the_stream(self):
+        payload = {"recordedTimes": self.records, "scheduleData": SCHEDULES, "stream": True,
+                   "progress_id": "stream-progress-test"}
+        response = self.client.post("/execute_logic1", json=payload)
+        try:
+            chunks = response.iter_encoded()
+            next(chunks)
+            self.assertFalse(ProgressBoard().get("stream-progress-test").finished)
+            self.assertEqual(self.client.delete("/progress/stream-progress-test").status_code, 200)
+            trailer = json.loads(b"".join(chunks).decode().splitlines()[-1])
+        finally:
+            response.close()
+        self.assertTrue(trailer["progress"]["cancelled"])
+        self.assertEqual(ProgressBoard().get("stream-progress-test").status, "cancelled")
+
+
+if __name__ == "__main__":
+    unittest.main()
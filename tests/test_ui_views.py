@@ -0,0 +1,68 @@
+import unittest
+from datetime import datetime, timedelta
+
+from app import SUMMARY_DEFAULT_THRESHOLD, app
+
+
+# ----------------------------------------
+# The browser clients past the summary threshold
+# ----------------------------------------
+# Runs with more than SUMMARY_DEFAULT_THRESHOLD records get a summary unless
+# the request asks for "view": "records". static/js/logic1.js, logic2.js and
+# logic3.js render labeled records only, so they send it; these tests post
+# their payloads with a big upload.
+
+SCHEDULES = [{"start_day": day, "start_time": "8:00 AM", "end_day": day, "end_time": "5:00 PM"}
+             for day in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday")]
+
+
+def big_record_list(count=SUMMARY_DEFAULT_THRESHOLD + 1):
+    """Alternating 8:00 AM / 5:00 PM punches, in the record box's format."""
+    start = datetime(2020, 1, 6, 8, 0)
+    records = []
+    for i in range(count):
+        dt = start + timedelta(days=i // 2, hours=9 * (i % 2))
+        records.append(f"{dt:%A} - {dt:%d/%m/%Y} - {dt:%I:%M %p}")
+    return records
+
+
+class UIPayloadTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = app.test_client()
+        cls.records = big_record_list()
+
+    def post(self, path, payload):
+        response = self.client.post(path, json=payload)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True)[:200])
+        return response.get_json()
+
+    def test_logic1_gets_labeled_records(self):
+        # static/js/logic1.js: {schedules, view, recordedTimes}
+        data = self.post('/execute_logic1', {"schedules": SCHEDULES, "view": "records",
+                                             "recordedTimes": self.records})
+        self.assertEqual(data["status"], "success")
+        self.assertEqual(len(data["labeledRecords"]), len(self.records))
+
+    def test_logic2_gets_labeled_records(self):
+        # static/js/logic2.js: {schedules, view, recordedTimes}
+        data = self.post('/execute_logic2', {"schedules": SCHEDULES, "view": "records",
+                                             "recordedTimes": self.records})
+        self.assertEqual(data["status"], "success")
+        self.assertEqual(len(data["labeledRecords"]), len(self.records))
+
+    def test_logic3_gets_original_records(self):
+        # static/js/logic3.js: {schedules: {schedules}, progress_id, view, recordedTimes}
+        data = self.post('/execute_logic3', {"schedules": {"schedules": SCHEDULES}, "progress_id": "ui-test",
+                                             "view": "records", "recordedTimes": self.records})
+        self.assertEqual(data["status"], "success")
+        self.assertEqual(len(data["original_records"]), len(self.records))
+
+    def test_api_default_is_the_summary(self):
+        data = self.post('/execute_logic1', {"schedules": SCHEDULES, "recordedTimes": self.records})
+        self.assertIn("summary", data)
+        self.assertNotIn("labeledRecords", data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import zipfile
+import zlib
+
+from logics.datasets import DatasetStore, parse_punches
+from logics.parallel import MAX_WORKERS, get_pool
+from msgpack_codec import MSGPACK_EXTENSIONS, MSGPACK_TYPES, unpackb
+
+
+# ----------------------------------------
+# Upload validation and bulk uploads
+# ----------------------------------------
+# /upload takes one JSON (or MessagePack) file, or, for bulk loads, several
+# files and/or zip archives of them, e.g. one "<name> record.json" and one
+# "<name> sched.json" per employee. Bulk members are decoded, validated and
+# parsed in the worker pool, stored as datasets (see logics/datasets.py)
+# and reported in a per-file manifest instead of being echoed back.
+
+REQUIRED_SCHEDULE_FIELDS = ['start_day', 'start_time', 'end_day', 'end_time']
+UPLOAD_EXTENSIONS = ('.json',) + MSGPACK_EXTENSIONS
+ZIP_TYPES = ('application/zip', 'application/x-zip-compressed')
+
+BULK_MAX_MEMBERS = int(os.environ.get("DTR_BULK_MAX_MEMBERS", "5000"))
+BULK_MAX_MEMBER_SIZE = 64 * 1024 * 1024  # bytes, uncompressed
+BULK_MAX_TOTAL_SIZE = 1024 * 1024 * 1024  # bytes, uncompressed, whole upload
+BULK_PARALLEL_MIN_BYTES = 256 * 1024  # below this, decoding inline is faster than shipping to workers
+
+# "leon record.json" and "leon sched.json" belong to the same employee "leon"
+MEMBER_SUFFIX = re.compile(r"[\s_-]*(records?|sched(ules?)?|punch(es)?|times?)$", re.IGNORECASE)
+
+
+def validate_upload(data, require_records=True):
+    """
+    Check an uploaded document: "recordedTimes" must be a list and any
+    "schedules" a list of complete schedules. Raises ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('File must contain a JSON object.')
+
+    if require_records and ("recordedTimes" not in data or not isinstance(data["recordedTimes"], list)):
+        raise ValueError('JSON file must contain "recordedTimes" as a list.')
+
+    if 'schedules' in data:
+        if not isinstance(data['schedules'], list):
+            raise ValueError('Schedules must be a list.')
+
+        for schedule in data['schedules']:
+            if not isinstance(schedule, dict) or not all(field in schedule for field in REQUIRED_SCHEDULE_FIELDS):
+                raise ValueError(f'Each schedule must contain: {", ".join(REQUIRED_SCHEDULE_FIELDS)}')
+
+
+def decode_upload(name, raw, mimetype=None):
+    """Decode one uploaded file (JSON, or MessagePack by type/extension)."""
+    if mimetype in MSGPACK_TYPES or name.lower().endswith(MSGPACK_EXTENSIONS):
+        return unpackb(raw)
+    return json.loads(raw.decode('utf-8'))
+
+
+def read_upload(file):
+    """Read one uploaded (non-zip) file, refusing more than BULK_MAX_MEMBER_SIZE bytes. Raises ValueError."""
+    raw = file.read(BULK_MAX_MEMBER_SIZE + 1)
+    if len(raw) > BULK_MAX_MEMBER_SIZE:
+        raise ValueError('File is too large.')
+    return raw
+
+
+def member_key(name):
+    """Group key pairing a member's records and schedules files."""
+    directory, base = os.path.split(name)
+    stem = MEMBER_SUFFIX.sub("", os.path.splitext(base)[0]).strip()
+    return os.path.join(directory, stem.lower())
+
+
+def decode_member(name, raw):
+    """
+    Decode, validate and parse one bulk member. Runs in worker processes,
+    so errors are returned in the result rather than raised.
+    """
+    try:
+        data = decode_upload(name, raw)
+        validate_upload(data, require_records=False)
+        if "recordedTimes" in data:
+            validate_upload(data)
+            minutes, originals = parse_punches(data["recordedTimes"])
+            return {"file": name, "kind": "records", "minutes": minutes, "originals": originals,
+                    "schedules": data.get("schedules")}
+        if data.get("schedules"):
+            return {"file": name, "kind": "schedules", "schedules": data["schedules"]}
+        raise ValueError('File must contain "recordedTimes" or "schedules".')
+    except (ValueError, UnicodeDecodeError, OverflowError) as e:
+        # OverflowError: epoch minutes outside the datetime range
+        return {"file": name, "kind": "error", "message": str(e)}
+
+
+def decode_members(members):
+    """decode_member() for every (name, raw) pair, in the worker pool when it pays off."""
+    if MAX_WORKERS <= 1 or len(members) < 2 or sum(len(raw) for _, raw in members) < BULK_PARALLEL_MIN_BYTES:
+        return [decode_member(name, raw) for name, raw in members]
+    names, raws = zip(*members)
+    chunksize = max(1, len(members) // (MAX_WORKERS * 4))
+    return list(get_pool().map(decode_member, names, raws, chunksize=chunksize))
+
+
+def is_zip(file):
+    return file.mimetype in ZIP_TYPES or file.filename.lower().endswith('.zip')
+
+
+def collect_members(files):
+    """
+    Read the uploaded files into (name, raw) members, expanding zip archives.
+    Returns (members, manifest entries for skipped/rejected files).
+    """
+    members = []
+    skipped = []
+    total = 0
+
+    def add(name, size, read):
+        nonlocal total
+        if not name.lower().endswith(UPLOAD_EXTENSIONS):
+            skipped.append({"file": name, "status": "skipped", "message": "Not a JSON or MessagePack file."})
+            return
+        if len(members) >= BULK_MAX_MEMBERS:
+            skipped.append({"file": name, "status": "error", "message": "Too many files in one upload."})
+            return
+        raw = b""
+        if size <= BULK_MAX_MEMBER_SIZE:
+            try:
+                raw = read()
+            except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError, zlib.error) as e:
+                skipped.append({"file": name, "status": "error", "message": f"Could not read file: {e}"})
+                return
+        if size > BULK_MAX_MEMBER_SIZE or len(raw) > BULK_MAX_MEMBER_SIZE or total + len(raw) > BULK_MAX_TOTAL_SIZE:
+            skipped.append({"file": name, "status": "error", "message": "File is too large."})
+            return
+        total += len(raw)
+        members.append((name, raw))
+
+    for file in files:
+        if not is_zip(file):
+            # Read at most one byte past the limit, as for zip members
+            add(file.filename, 0, lambda file=file: file.read(BULK_MAX_MEMBER_SIZE + 1))
+            continue
+        try:
+            with zipfile.ZipFile(file.stream) as archive:
+                for info in archive.infolist():
+                    base = os.path.basename(info.filename)
+                    if info.is_dir() or info.filename.startswith("__MACOSX/") or base.startswith("."):
+                        continue
+                    # Read at most one byte past the limit in case file_size lies
+                    add(f"{file.filename}/{info.filename}", info.file_size,
+                        lambda info=info: archive.open(info).read(BULK_MAX_MEMBER_SIZE + 1))
+        except zipfile.BadZipFile as e:
+            skipped.append({"file": file.filename, "status": "error", "message": f"Invalid zip file: {e}"})
+    return members, skipped
+
+
+def process_bulk_upload(files):
+    """
+    Decode, validate and store every member of a bulk upload. Records files
+    become datasets; a schedules-only file is attached to the records files
+    with the same name stem. Returns the per-file manifest.
+    """
+    members, manifest = collect_members(files)
+    results = decode_members(members)
+
+    schedules_by_key = {}
+    for result in results:
+        if result["kind"] == "schedules":
+            schedules_by_key.setdefault(member_key(result["file"]), result)
+
+    store = DatasetStore()
+    for result in results:
+        name = result["file"]
+        if result["kind"] == "error":
+            manifest.append({"file": name, "status": "error", "message": result["message"]})
+
+        elif result["kind"] == "schedules":
+            manifest.append({"file": name, "status": "ok", "kind": "schedules",
+                             "count": len(result["schedules"])})
+
+        else:
+            schedules = result["schedules"]
+            schedules_file = None
+            if not schedules and member_key(name) in schedules_by_key:
+                paired = schedules_by_key[member_key(name)]
+                schedules, schedules_file = paired["schedules"], paired["file"]
+
+            dataset = store.put_parsed(result["minutes"], result["originals"], schedules, name=name)
+            manifest.append({"file": name, "status": "ok", "kind": "records",
+                             "dataset_id": dataset.dataset_id, "count": len(result["minutes"]),
+                             "schedules_file": schedules_file, "has_schedules": bool(schedules)})
+    return manifest